@@ -1,6 +1,6 @@
 
 __version__ = "0.3.1"
 
-from . import controller
-from . import dialogs
+# the GUI modules (controller, dialogs, zbc) require wxPython and are not
+# imported here so that the calculator can be used without it
 from . import model
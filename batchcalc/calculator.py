@@ -27,16 +27,15 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import operator
 import re
+from collections import defaultdict
 
-from numpy.linalg import solve, lstsq
+from numpy.linalg import inv, pinv
 import numpy as np
 
-from batchcalc import controller as ctrl
-from batchcalc.model import Chemical, Component, Batch
+from batchcalc.database import DB, get_revision, register_model
+from batchcalc.model import Chemical, Component, Batch, Kind
 
 __version__ = "0.3.1"
 
@@ -66,6 +65,11 @@ class BatchCalculator(object):
         self.item_scale = 1.0
         self.selections = []
 
+        self._problem = None
+
+        # the selected records stay in the session when it is trimmed
+        register_model(self)
+
     def reset(self):
         '''
         Clear the state of the calculation by reseting all the list and
@@ -87,6 +91,8 @@ class BatchCalculator(object):
         self.item_scale = 1.0
         self.selections = []
 
+        self._problem = None
+
     # this can be probably removed since base chemical has is_undefined method
     @staticmethod
     def is_empty(item):
@@ -111,12 +117,14 @@ class BatchCalculator(object):
         else:
             return None
 
-    def calculate_masses(self, session):
+    def check_selection(self, session=None):
         '''
-        Solve the linear system of equations  B * X = C
+        Check that both components and chemicals are selected and that every
+        component has at least one source among the selected chemicals.
         '''
 
-        db = ctrl.DB()
+        if session is None:
+            session = DB().session
 
         if len(self.components) == 0:
             raise ValueError("No Zeolite components selected")
@@ -124,154 +132,135 @@ class BatchCalculator(object):
         if len(self.chemicals) == 0:
             raise ValueError("No chemicals selected")
 
-        for comp in self.components:
-            temp = db.get_chemicals(components=[comp])
-            if len(set([t.id for t in temp]) & set([r.id for r in self.chemicals])) == 0:
-                raise ValueError("some components need their sources: {0:s}".format(comp.name))
+        index = get_source_index(session)
+        missing = index.missing(self.components, self.chemicals)
+        if len(missing) > 0:
+            raise ValueError("some components need their sources: {0:s}".format(
+                             ", ".join(comp.name for comp in missing)))
 
-        self.A = self.get_A_matrix()
-        self.B = self.get_B_matrix(session)
+    def get_sources(self, component, session):
+        '''
+        Return the selected chemicals that are sources of `component`.
+        '''
 
-        try:
-            if self.B.shape[0] == self.B.shape[1]:
-                self.X = solve(np.transpose(self.B), self.A)
-            else:
-                self.X, resid, rank, s = lstsq(np.transpose(self.B), self.A)
-            # assign calculated masses to the chemicals
-            for chemical, x in zip(self.chemicals, self.X):
-                if chemical.kind == "reactant":
-                    chemical.mass = x / chemical.concentration
-                else:
-                    chemical.mass = x
-        except Exception as e:
-            raise e
-        else:
-            self.calculated = True
+        ids = get_source_index(session).sources.get(component.id, frozenset())
+        return [chem for chem in self.chemicals if chem.id in ids]
 
-    def calculate_moles(self, session):
+    def calculate_masses(self, session):
         '''
-        Calculate the composition matrix by multiplying C = B * X
+        Solve the linear system of equations  B * X = C
         '''
 
-        db = ctrl.DB()
-
-        if len(self.components) == 0:
-            raise ValueError("No Zeolite components selected")
+        problem = self.get_problem(session)
 
-        if len(self.chemicals) == 0:
-            raise ValueError("No chemicals selected")
+        self.A = self.get_A_matrix()
+        self.X = np.dot(problem.Binv, self.A)
+        self.B = problem.B
 
-        for comp in self.components:
-            temp = db.get_chemicals(components=[comp])
-            if len(set([t.id for t in temp]) & set([r.id for r in self.chemicals])) == 0:
-                raise ValueError("some components need their sources: {0:s}".format(comp.name))
-
-        masses = []
-        for chemical in self.chemicals:
-            if chemical.kind == "reactant":
-                masses.append(chemical.mass * chemical.concentration)
-            else:
-                masses.append(chemical.mass)
+        # assign calculated masses to the chemicals
+        masses = solve_masses(problem, [z.moles for z in self.components])[0]
+        for chemical, mass in zip(self.chemicals, masses):
+            chemical.mass = mass
+        self.calculated = True
 
-        self.X = np.array(masses, dtype=float)
-        self.B = self.get_B_matrix(session)
+    def calculate_masses_many(self, moles, session):
+        '''
+        Solve the linear system of equations  B * X = C  for many compositions
+        at once, the batch matrix is factorized only once for all of them.
+        The ORM objects are not modified.
+
+        Args:
+            moles : array_like
+                2-D array of mole numbers, one row per composition and one
+                column per component in the order of `components`
+            session :
+                SQLAlchemy session
+
+        Returns:
+            numpy.ndarray with the masses of chemicals, one row per
+            composition and one column per chemical in the order of
+            `chemicals`
+        '''
 
-        try:
-            self.A = np.dot(np.transpose(self.B), self.X)
-            for comp, a in zip(self.components, self.A):
-                comp.moles = a / comp.molwt
-        except Exception as e:
-            raise e
-        else:
-            self.calculated = True
+        return solve_masses(self.get_problem(session), moles)
 
-    def get_A_matrix(self):
+    def selection_key(self):
         '''
-        Compose the [A] matrix with masses of zeolite components.
+        Return a hashable key identifying the current selection of chemicals
+        and components together with the concentrations of the chemicals.
         '''
 
-        return np.asarray([z.moles * z.molwt for z in self.components],
-                          dtype=float)
+        return (tuple(c.id for c in self.chemicals),
+                tuple(c.id for c in self.components),
+                tuple(c.concentration for c in self.chemicals))
 
-    def get_B_matrix(self, session):
+    def get_problem(self, session):
         '''
-        Construct and return the batch matrix [B].
+        Return the `BatchProblem` snapshot of the current selection. The
+        snapshot is cached and reused as long as the `selection_key` and the
+        database revision do not change, otherwise it is recreated.
         '''
 
-        B = np.zeros((len(self.chemicals), len(self.components)), dtype=float)
-
-        for i, chemical in enumerate(self.chemicals):
-            comps = session.query(Batch, Component).\
-                    filter(Batch.chemical_id == chemical.id).\
-                    filter(Component.id == Batch.component_id).all()
-            wfs = self.get_weight_fractions(i, comps, session)
-            for j, comp in enumerate(self.components):
-                for cid, wf in wfs:
-                    if comp.id == cid:
-                        B[i, j] = wf
-        return B
+        key = (get_revision(session), self.selection_key())
+        if self._problem is None or self._problem[0] != key:
+            self._problem = (key, BatchProblem.from_model(self, session))
+        return self._problem[1]
 
-    def get_weight_fractions(self, rindex, comps, session):
+    def calculate_moles(self, session):
         '''
-        Calculate the weight fractions corresponding to a specific reactant
-        and coupled zolite componts.
-
-        lower case "m": mass in grmas
-        upper case "M": molecular weight [gram/mol]
+        Calculate the composition matrix by multiplying C = B * X
         '''
 
-        res = []
-
-        if self.chemicals[rindex].kind == "mixture":
-            for batch, comp in comps:
-                res.append((comp.id, batch.coefficient))
-            return res
+        problem = self.get_problem(session)
 
-        elif self.chemicals[rindex].kind == "solution":
-            if len(comps) > 2:
-                raise ValueError("cannot handle cases of zeoindexes > 2")
+        masses = [chemical.mass for chemical in self.chemicals]
+        moles = solve_moles(problem, masses)[0]
 
-            rct = self.chemicals[rindex]
+        self.B = problem.B
+        self.X = np.asarray(masses, dtype=float) * problem.scales
+        self.A = moles * problem.molwts
+        for comp, mole in zip(self.components, moles):
+            comp.moles = mole
+        self.calculated = True
 
-            h2o = session.query(Chemical).filter(Chemical.formula == "H2O").one()
-            M_solv = h2o.molwt
+    def calculate_moles_many(self, masses, session):
+        '''
+        Calculate the compositions corresponding to many sets of masses of
+        chemicals at once,  C = B * X,  the ORM objects are not modified.
+
+        Args:
+            masses : array_like
+                2-D array of masses of chemicals, one row per batch and one
+                column per chemical in the order of `chemicals`
+            session :
+                SQLAlchemy session
+
+        Returns:
+            numpy.ndarray with the number of moles of components, one row
+            per batch and one column per component in the order of
+            `components`
+        '''
 
-            M_solu = rct.molwt
+        return solve_moles(self.get_problem(session), masses)
 
-            if abs(rct.concentration - 1.0) > 0.0001:
-                n_solu = M_solu * M_solv / (M_solv + (1.0 - rct.concentration) * M_solu / rct.concentration) / M_solu
-                n_solv = M_solu * M_solv / (M_solu + rct.concentration * M_solv / (1.0 - rct.concentration)) / M_solv
-            else:
-                n_solu = 1.0
-                n_solv = 0.0
+    def get_A_matrix(self):
+        '''
+        Compose the [A] matrix with masses of zeolite components.
+        '''
 
-            masses = list()
+        return np.asarray([z.moles * z.molwt for z in self.components],
+                          dtype=float)
 
-            for batch, comp in comps:
-                if comp.formula != "H2O":
-                    masses.append(batch.coefficient * n_solu * comp.molwt)
-                else:
-                    masses.append((batch.coefficient * n_solu + n_solv) * comp.molwt)
+    def get_B_matrix(self, session):
+        '''
+        Construct and return the batch matrix [B].
 
-            tot_mass = sum(masses)
-            for batch, comp in comps:
-                if comp.formula != "H2O":
-                    res.append((comp.id, batch.coefficient * n_solu * comp.molwt / tot_mass))
-                else:
-                    res.append((comp.id, (batch.coefficient * n_solu + n_solv) * comp.molwt / tot_mass))
-            return res
-
-        elif self.chemicals[rindex].kind == "reactant":
-            if len(comps) > 1:
-                tot_mass = sum([b.coefficient * c.molwt for b, c in comps])
-                for batch, comp in comps:
-                    res.append((comp.id, batch.coefficient * comp.molwt / tot_mass))
-            else:
-                res.append((comps[0][1].id, 1.0))
-            return res
+        The weight fractions are gathered from the precomputed
+        `WeightFractionTable` of the current database revision.
+        '''
 
-        else:
-            raise ValueError("Unknown chemical kind: {}".format(self.chemicals[rindex].kind))
+        table = get_weight_fraction_table(session)
+        return table.batch_matrix(self.chemicals, self.components)
 
     def rescale_all(self):
         '''
@@ -359,3 +348,371 @@ class BatchCalculator(object):
                     nmol = float(m.group('nmol'))
                 result.append((m.group('formula'), nmol))
         return result
+
+
+class BatchProblem(object):
+    '''
+    Array snapshot of a batch calculation, independent of the database and
+    the ORM objects, created with `BatchProblem.from_model`. The solvers
+    `solve_masses` and `solve_moles` operate only on the snapshot, so they
+    can be run concurrently and profiled on their own.
+
+    Attributes
+    ----------
+    chemicals : tuple
+        Ids of the chemicals (rows of B)
+    components : tuple
+        Ids of the components (columns of B)
+    kinds : tuple
+        Kinds of the chemicals
+    concentrations : numpy.ndarray
+        Concentrations of the chemicals
+    molwts : numpy.ndarray
+        Molecular weights of the components
+    B : numpy.ndarray
+        Batch matrix, weight fractions of the components in the chemicals
+    '''
+
+    def __init__(self, chemicals, components, kinds, concentrations, molwts, B):
+
+        self.chemicals = tuple(chemicals)
+        self.components = tuple(components)
+        self.kinds = tuple(kinds)
+        self.concentrations = np.asarray(concentrations, dtype=float)
+        self.molwts = np.asarray(molwts, dtype=float)
+        self.B = np.asarray(B, dtype=float)
+        self._Binv = None
+
+        if self.B.shape != (len(self.chemicals), len(self.components)):
+            raise ValueError("batch matrix of shape {0} does not match the "
+                             "selection".format(self.B.shape))
+
+    @classmethod
+    def from_model(cls, model, session):
+        '''
+        Create the snapshot for the chemicals and components selected in
+        the `model` (BatchCalculator).
+        '''
+
+        model.check_selection(session)
+        return cls([c.id for c in model.chemicals],
+                   [z.id for z in model.components],
+                   [c.kind for c in model.chemicals],
+                   [c.concentration for c in model.chemicals],
+                   [z.molwt for z in model.components],
+                   model.get_B_matrix(session))
+
+    @property
+    def scales(self):
+        '''
+        Factors converting the masses of the chemicals to the masses in the
+        batch equations, the concentration for reactants and 1 otherwise.
+        '''
+
+        return np.asarray([c if k == "reactant" else 1.0
+                           for k, c in zip(self.kinds, self.concentrations)],
+                          dtype=float)
+
+    @property
+    def Binv(self):
+        '''
+        Inverse of the transposed batch matrix, or the pseudo-inverse if B is
+        not square, calculated on first use.
+        '''
+
+        if self._Binv is None:
+            if self.B.shape[0] == self.B.shape[1]:
+                self._Binv = inv(np.transpose(self.B))
+            else:
+                self._Binv = pinv(np.transpose(self.B))
+        return self._Binv
+
+
+def solve_masses(problem, moles):
+    '''
+    Calculate the masses of chemicals for the compositions `moles` by solving
+    B^T * X = A, exactly if B is square and in the least squares sense
+    otherwise.
+
+    Args:
+        problem : BatchProblem
+            Snapshot of the calculation
+        moles : array_like
+            Mole numbers of the components, a vector or a 2-D array with one
+            row per composition
+
+    Returns:
+        numpy.ndarray with the masses, one row per composition
+    '''
+
+    moles = np.atleast_2d(np.asarray(moles, dtype=float))
+    if moles.ndim != 2 or moles.shape[1] != len(problem.components):
+        raise ValueError("expected moles with {0:d} columns, got shape {1}".format(
+                         len(problem.components), moles.shape))
+
+    X = np.dot(problem.Binv, np.transpose(moles * problem.molwts))
+    return np.transpose(X) / problem.scales
+
+
+def solve_moles(problem, masses):
+    '''
+    Calculate the mole numbers of components for the `masses` of chemicals,
+    C = B * X.
+
+    Args:
+        problem : BatchProblem
+            Snapshot of the calculation
+        masses : array_like
+            Masses of the chemicals, a vector or a 2-D array with one row per
+            batch
+
+    Returns:
+        numpy.ndarray with the mole numbers, one row per batch
+    '''
+
+    masses = np.atleast_2d(np.asarray(masses, dtype=float))
+    if masses.ndim != 2 or masses.shape[1] != len(problem.chemicals):
+        raise ValueError("expected masses with {0:d} columns, got shape {1}".format(
+                         len(problem.chemicals), masses.shape))
+
+    return np.dot(masses * problem.scales, problem.B) / problem.molwts
+
+
+def weight_fractions(kind, concentration, molwt, sources, h2o_molwt=None):
+    '''
+    Calculate the weight fractions of the components in a chemical.
+
+    lower case "m": mass in grmas
+    upper case "M": molecular weight [gram/mol]
+
+    Args:
+        kind : str
+            Kind of the chemical, "mixture", "solution" or "reactant"
+        concentration : float
+            Concentration of the chemical as weight fraction
+        molwt : float
+            Molecular weight of the chemical
+        sources : list of tuples
+            (component id, formula, molecular weight, coefficient) for every
+            component the chemical is a source of
+        h2o_molwt : float
+            Molecular weight of water, required only for solutions
+
+    Returns:
+        list of (component id, weight fraction) tuples
+    '''
+
+    res = []
+
+    if kind == "mixture":
+        for cid, formula, cmolwt, coeff in sources:
+            res.append((cid, coeff))
+        return res
+
+    elif kind == "solution":
+        if len(sources) > 2:
+            raise ValueError("cannot handle cases of zeoindexes > 2")
+
+        if h2o_molwt is None:
+            raise ValueError("water (H2O) not found in the chemicals")
+
+        M_solv = h2o_molwt
+        M_solu = molwt
+
+        if abs(concentration - 1.0) > 0.0001:
+            n_solu = M_solu * M_solv / (M_solv + (1.0 - concentration) * M_solu / concentration) / M_solu
+            n_solv = M_solu * M_solv / (M_solu + concentration * M_solv / (1.0 - concentration)) / M_solv
+        else:
+            n_solu = 1.0
+            n_solv = 0.0
+
+        masses = list()
+
+        for cid, formula, cmolwt, coeff in sources:
+            if formula != "H2O":
+                masses.append(coeff * n_solu * cmolwt)
+            else:
+                masses.append((coeff * n_solu + n_solv) * cmolwt)
+
+        tot_mass = sum(masses)
+        for (cid, formula, cmolwt, coeff), mass in zip(sources, masses):
+            res.append((cid, mass / tot_mass))
+        return res
+
+    elif kind == "reactant":
+        if len(sources) > 1:
+            tot_mass = sum([coeff * cmolwt for cid, formula, cmolwt, coeff in sources])
+            for cid, formula, cmolwt, coeff in sources:
+                res.append((cid, coeff * cmolwt / tot_mass))
+        else:
+            res.append((sources[0][0], 1.0))
+        return res
+
+    else:
+        raise ValueError("Unknown chemical kind: {}".format(kind))
+
+
+class WeightFractionTable(object):
+    '''
+    Weight fractions of the components in all the chemicals from the
+    database, stored as a dense (chemicals x components) array. The table is
+    calculated once per database revision, see `get_weight_fraction_table`.
+
+    Attributes
+    ----------
+    revision : tuple
+        Database revision the table was calculated for
+    chemicals : dict
+        Chemical id -> row index
+    components : dict
+        Component id -> column index
+    fractions : numpy.ndarray
+        Weight fractions
+    '''
+
+    def __init__(self, session):
+
+        self.revision = get_revision(session)
+
+        self.components = {cid: j for j, (cid,) in enumerate(
+            session.query(Component.id).order_by(Component.id))}
+
+        chemicals = session.query(Chemical.id, Kind.name, Chemical.concentration,
+                                  Chemical.molwt).\
+            join(Kind, Kind.id == Chemical._kind_id).\
+            order_by(Chemical.id).all()
+        self.chemicals = {row[0]: i for i, row in enumerate(chemicals)}
+
+        h2o = session.query(Chemical.molwt).\
+            filter(Chemical.formula == "H2O").first()
+        self.h2o_molwt = h2o[0] if h2o is not None else None
+
+        self.sources = defaultdict(list)
+        records = session.query(Batch.chemical_id, Component.id,
+                                Component.formula, Component.molwt,
+                                Batch.coefficient).\
+            filter(Component.id == Batch.component_id).\
+            order_by(Batch.chemical_id, Batch.id)
+        for row in records:
+            self.sources[row[0]].append(tuple(row[1:]))
+
+        self.kinds = {}
+        self.concentrations = {}
+        self.errors = {}
+        self.fractions = np.zeros((len(self.chemicals), len(self.components)),
+                                  dtype=float)
+
+        for chid, kind, conc, molwt in chemicals:
+            self.kinds[chid] = kind
+            self.concentrations[chid] = conc
+            try:
+                wfs = weight_fractions(kind, conc, molwt, self.sources[chid],
+                                       self.h2o_molwt)
+            except (ValueError, IndexError, TypeError,
+                    ZeroDivisionError) as e:
+                # raised only when the chemical is actually used
+                self.errors[chid] = e
+                continue
+            for cid, wf in wfs:
+                self.fractions[self.chemicals[chid], self.components[cid]] = wf
+
+    def batch_matrix(self, chemicals, components):
+        '''
+        Return the batch matrix [B] for the selected chemicals and components.
+
+        Chemicals whose concentration differs from the one stored in the
+        database (e.g. edited by the user) have their weight fractions
+        recalculated.
+        '''
+
+        rows = [self.chemicals[c.id] for c in chemicals]
+        cols = [self.components[c.id] for c in components]
+        B = self.fractions[np.ix_(rows, cols)]
+
+        columns = {comp.id: j for j, comp in enumerate(components)}
+        for i, chemical in enumerate(chemicals):
+            if chemical.concentration != self.concentrations[chemical.id]:
+                wfs = weight_fractions(chemical.kind, chemical.concentration,
+                                       chemical.molwt,
+                                       self.sources[chemical.id],
+                                       self.h2o_molwt)
+                B[i] = 0.0
+                for cid, wf in wfs:
+                    if cid in columns:
+                        B[i, columns[cid]] = wf
+            elif chemical.id in self.errors:
+                raise self.errors[chemical.id]
+        return B
+
+
+_WF_TABLES = {}
+
+
+def get_weight_fraction_table(session):
+    '''
+    Return the `WeightFractionTable` for the database bound to `session`,
+    the table is recalculated only if the database revision has changed.
+    '''
+
+    revision = get_revision(session)
+    table = _WF_TABLES.get(revision[0])
+    if table is None or table.revision != revision:
+        table = WeightFractionTable(session)
+        _WF_TABLES[revision[0]] = table
+    return table
+
+
+class SourceIndex(object):
+    '''
+    Bipartite index of the component <-> chemical source relation from the
+    `batch` table, built once per database revision, see `get_source_index`.
+
+    Attributes
+    ----------
+    revision : tuple
+        Database revision the index was built for
+    sources : dict
+        Component id -> frozenset of ids of the chemicals that are its sources
+    supplies : dict
+        Chemical id -> frozenset of ids of the components it is a source of
+    '''
+
+    def __init__(self, session):
+
+        self.revision = get_revision(session)
+
+        sources = defaultdict(set)
+        supplies = defaultdict(set)
+        for chid, cid in session.query(Batch.chemical_id, Batch.component_id):
+            sources[cid].add(chid)
+            supplies[chid].add(cid)
+
+        self.sources = {k: frozenset(v) for k, v in sources.items()}
+        self.supplies = {k: frozenset(v) for k, v in supplies.items()}
+
+    def missing(self, components, chemicals):
+        '''
+        Return the components that have no source among the `chemicals`.
+        '''
+
+        covered = set()
+        for chem in chemicals:
+            covered.update(self.supplies.get(chem.id, ()))
+        return [comp for comp in components if comp.id not in covered]
+
+
+_SOURCE_INDEXES = {}
+
+
+def get_source_index(session):
+    '''
+    Return the `SourceIndex` for the database bound to `session`, the index
+    is rebuilt only if the database revision has changed.
+    '''
+
+    revision = get_revision(session)
+    index = _SOURCE_INDEXES.get(revision[0])
+    if index is None or index.revision != revision:
+        index = SourceIndex(session)
+        _SOURCE_INDEXES[revision[0]] = index
+    return index
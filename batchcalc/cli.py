@@ -0,0 +1,576 @@
+# cli.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Command line batch calculator (zbc-batch) working without the GUI.
+
+The compositions are read either from a CSV file, where the header holds the
+components and every row is one composition, or from a JSON file of the form::
+
+    {"chemicals": ["NaOH", "sodium aluminate", "fumed silica", "water"],
+     "components": ["Na2O", "Al2O3", "SiO2", "H2O"],
+     "compositions": [[1.0, 1.0, 10.0, 100.0],
+                      {"Na2O": 2.0, "Al2O3": 1.0, "SiO2": 20.0, "H2O": 200}]}
+
+Chemicals and components can be given by id, name, short name or formula.
+'''
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.database import DB
+from batchcalc.importer import TABLES, import_file
+from batchcalc.model import Chemical, Component
+from batchcalc.sweep import (CompositionGrid, parse_values, sweep,
+                             parallel_sweep)
+from batchcalc.zbcindex import Catalogue, parse_ratio
+
+__version__ = "0.3.1"
+
+
+def find_record(session, cls, identifier):
+    '''
+    Return the `Chemical` or `Component` record matching the `identifier`,
+    which can be an id, name, short name or formula.
+
+    Args:
+        session :
+            SQLAlchemy session
+        cls : Chemical or Component
+            Mapped class to search
+        identifier : str or int
+            Identifier of the record
+    '''
+
+    identifier = "{}".format(identifier).strip()
+
+    if identifier.isdigit():
+        record = session.query(cls).get(int(identifier))
+        if record is not None:
+            return record
+
+    for attr in ["name", "short_name", "formula"]:
+        records = session.query(cls).\
+            filter(getattr(cls, attr) == identifier).all()
+        if len(records) == 1:
+            return records[0]
+        elif len(records) > 1:
+            raise ValueError("ambiguous {0:s} '{1:s}', matches ids: {2:s}".format(
+                cls.__tablename__, identifier,
+                ", ".join(str(r.id) for r in records)))
+
+    raise ValueError("{0:s} '{1:s}' not found".format(cls.__tablename__,
+                                                      identifier))
+
+
+def split_list(string):
+    '''Split a comma separated string into a list of stripped items.'''
+
+    return [x.strip() for x in string.split(",") if x.strip() != ""]
+
+
+def read_csv(fobj):
+    '''
+    Read compositions from a CSV file with the components in the header.
+
+    Returns:
+        a tuple with the list of component identifiers and an iterator over
+        the compositions (lists of floats)
+    '''
+
+    reader = csv.reader(fobj)
+    components = [x.strip() for x in next(reader)]
+    rows = ([float(x) for x in row] for row in reader if len(row) > 0)
+    return components, rows
+
+
+def read_json(fobj):
+    '''
+    Read the chemicals, components and compositions from a JSON file.
+
+    Returns:
+        a tuple with the lists of chemical identifiers, component identifiers
+        and compositions (lists of floats)
+    '''
+
+    data = json.load(fobj)
+
+    chemicals = data.get("chemicals", [])
+    components = data.get("components", [])
+    compositions = data.get("compositions", [])
+
+    if len(components) == 0:
+        for comp in compositions:
+            if isinstance(comp, dict):
+                components.extend(k for k in comp.keys() if k not in components)
+
+    rows = []
+    for comp in compositions:
+        if isinstance(comp, dict):
+            rows.append([float(comp.get(k, 0.0)) for k in components])
+        else:
+            rows.append([float(x) for x in comp])
+
+    return chemicals, components, rows
+
+
+def chunks(iterable, size):
+    '''Split an iterable into lists of at most `size` items.'''
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def column_names(components, chemicals):
+    '''
+    Return the column names for the output, formulas of the components
+    followed by the labels of the chemicals with the mass unit.
+    '''
+
+    return ([c.formula for c in components] +
+            ["{0:s} [g]".format(c.listctrl_label()) for c in chemicals])
+
+
+class CSVWriter(object):
+    '''Write the compositions and masses as CSV rows.'''
+
+    binary = False
+
+    def __init__(self, fobj, components, chemicals):
+
+        self.writer = csv.writer(fobj, lineterminator="\n")
+        self.writer.writerow(column_names(components, chemicals))
+
+    def write(self, moles, masses):
+
+        for mrow, xrow in zip(moles, masses):
+            self.writer.writerow(["{0:.6f}".format(x) for x in mrow] +
+                                 ["{0:.6f}".format(x) for x in xrow])
+
+    def close(self):
+
+        pass
+
+
+class JSONWriter(object):
+    '''Write the compositions and masses as JSON objects, one per line.'''
+
+    binary = False
+
+    def __init__(self, fobj, components, chemicals):
+
+        self.fobj = fobj
+        self.components = [c.formula for c in components]
+        self.chemicals = [c.listctrl_label() for c in chemicals]
+
+    def write(self, moles, masses):
+
+        for mrow, xrow in zip(moles, masses):
+            record = {"composition": dict(zip(self.components, mrow.tolist())),
+                      "masses": dict(zip(self.chemicals, xrow.tolist()))}
+            self.fobj.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def close(self):
+
+        pass
+
+
+class ParquetWriter(object):
+    '''
+    Write the compositions and masses to a Parquet file, one row group per
+    chunk. Requires the pyarrow package.
+    '''
+
+    binary = True
+
+    def __init__(self, fobj, components, chemicals):
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required to write parquet files")
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.float64()) for name in
+                                      column_names(components, chemicals)])
+        self.writer = pyarrow.parquet.ParquetWriter(fobj, self.schema)
+
+    def write(self, moles, masses):
+
+        data = np.hstack([moles, masses])
+        arrays = [self.pa.array(data[:, i]) for i in range(data.shape[1])]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays,
+                                                          schema=self.schema))
+
+    def close(self):
+
+        self.writer.close()
+
+
+WRITERS = {"csv": CSVWriter, "json": JSONWriter, "parquet": ParquetWriter}
+
+
+def open_output(path, fmt):
+    '''
+    Open the output file for the format `fmt`, standard output is used if
+    `path` is None.
+    '''
+
+    if path is None:
+        if WRITERS[fmt].binary:
+            raise ValueError("{0:s} output has to be written to a file".format(fmt))
+        return sys.stdout
+    return open(path, "wb" if WRITERS[fmt].binary else "w")
+
+
+def run(session, chemicals, components, compositions, output, fmt="csv",
+        chunk_size=1000):
+    '''
+    Calculate the masses of `chemicals` for all the `compositions` and write
+    the results to `output`. The compositions are processed in chunks of
+    `chunk_size` so that arbitrarily long inputs can be streamed.
+
+    Args:
+        session :
+            SQLAlchemy session
+        chemicals : list
+            Chemical identifiers
+        components : list
+            Component identifiers
+        compositions : iterable
+            Compositions as sequences of mole numbers in the order of
+            `components`
+        output : file
+            File object to write the results to
+        fmt : str
+            Output format, "csv", "json" or "parquet"
+        chunk_size : int
+            Number of compositions solved at once
+
+    Returns:
+        number of processed compositions
+    '''
+
+    model = BatchCalculator()
+    model.chemicals = [find_record(session, Chemical, c) for c in chemicals]
+    model.components = [find_record(session, Component, c) for c in components]
+
+    writer = WRITERS[fmt](output, model.components, model.chemicals)
+
+    count = 0
+    for chunk in chunks(compositions, chunk_size):
+        masses = model.calculate_masses_many(chunk, session)
+        writer.write(np.asarray(chunk, dtype=float), masses)
+        count += len(chunk)
+    writer.close()
+    return count
+
+
+def main(argv=None):
+    '''Entry point of the zbc-batch script.'''
+
+    parser = argparse.ArgumentParser(
+        prog="zbc-batch",
+        description="Calculate the batch (masses of chemicals) for zeolite "
+                    "compositions read from a CSV or JSON file")
+    parser.add_argument("input",
+                        help="CSV or JSON file with the compositions, "
+                             "use - for standard input (CSV)")
+    parser.add_argument("-c", "--chemicals",
+                        help="comma separated list of chemicals (ids, names, "
+                             "short names or formulas)")
+    parser.add_argument("--components",
+                        help="comma separated list of components, overrides "
+                             "the ones given in the input file")
+    parser.add_argument("-d", "--db", help="path to the database file")
+    parser.add_argument("-o", "--output",
+                        help="output file, by default standard output")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS.keys()),
+                        default="csv", help="output format (default: csv)")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="number of compositions solved at once "
+                             "(default: 1000)")
+    args = parser.parse_args(argv)
+
+    db = DB()
+    if args.db is not None:
+        if not os.path.exists(args.db):
+            parser.error("database file not found: {0:s}".format(args.db))
+        db.switch_session(args.db)
+
+    try:
+        infile = sys.stdin if args.input == "-" else open(args.input)
+    except (IOError, OSError) as e:
+        parser.error("cannot read {0:s}: {1}".format(args.input, e.strerror))
+
+    try:
+        output = open_output(args.output, args.format)
+    except (ValueError, IOError, OSError) as e:
+        if infile is not sys.stdin:
+            infile.close()
+        parser.error(str(e))
+
+    try:
+        if os.path.splitext(args.input)[1].lower() == ".json":
+            chemicals, components, compositions = read_json(infile)
+        else:
+            chemicals = []
+            components, compositions = read_csv(infile)
+
+        if args.chemicals is not None:
+            chemicals = split_list(args.chemicals)
+        if args.components is not None:
+            components = split_list(args.components)
+
+        if len(chemicals) == 0:
+            parser.error("no chemicals given, use --chemicals")
+
+        run(db.session, chemicals, components, compositions, output,
+            fmt=args.format, chunk_size=args.chunk_size)
+    except (ValueError, ImportError) as e:
+        sys.exit("zbc-batch: error: {0}".format(e))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+def parse_grid(session, specs):
+    '''
+    Parse the component specifications of a sweep into a list of components
+    and a `CompositionGrid`. Every specification has the form
+    "COMPONENT=VALUES" or "COMPONENT/BASE=VALUES" for values relative to
+    the moles of the BASE component, where VALUES is a single number, a comma
+    separated list or a "start:stop:step" range.
+
+    Returns:
+        a tuple with the list of `Component` objects and the grid
+    '''
+
+    components = []
+    fixed = {}
+    axes = []
+
+    for i, spec in enumerate(specs):
+        if "=" not in spec:
+            raise ValueError("wrong component specification: {0:s}".format(spec))
+        label, values = spec.split("=", 1)
+        if "/" in label:
+            label, base = label.split("/", 1)
+        else:
+            base = None
+        components.append(find_record(session, Component, label))
+        values = parse_values(values)
+        if base is None and len(values) == 1:
+            fixed[i] = values[0]
+        else:
+            axes.append((i, values, base))
+
+    ids = [c.id for c in components]
+    for k, (i, values, base) in enumerate(axes):
+        if base is not None:
+            basecomp = find_record(session, Component, base)
+            if basecomp.id not in ids:
+                raise ValueError("base component '{0:s}' is not a part of the "
+                                 "sweep".format(base))
+            axes[k] = (i, values, ids.index(basecomp.id))
+
+    return components, CompositionGrid(len(components), fixed, axes)
+
+
+def sweep_main(argv=None):
+    '''Entry point of the zbc-sweep script.'''
+
+    parser = argparse.ArgumentParser(
+        prog="zbc-sweep",
+        description="Calculate the batch for all the compositions on a grid, "
+                    "e.g. zbc-sweep -c 1,3,9,10 -s Al2O3=1 -s SiO2=10:40:5 "
+                    "-s Na2O/SiO2=0.1,0.2 -s H2O/SiO2=10:40:10")
+    parser.add_argument("-c", "--chemicals", required=True,
+                        help="comma separated list of chemicals (ids, names, "
+                             "short names or formulas)")
+    parser.add_argument("-s", "--component", action="append", required=True,
+                        dest="components", metavar="SPEC",
+                        help="component and its moles as COMPONENT=VALUES or "
+                             "COMPONENT/BASE=VALUES for ratios, VALUES is a "
+                             "number, a comma separated list or a "
+                             "start:stop:step range, can be repeated")
+    parser.add_argument("-d", "--db", help="path to the database file")
+    parser.add_argument("-o", "--output",
+                        help="output file, by default standard output")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS.keys()),
+                        default="csv", help="output format (default: csv)")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="number of compositions solved at once "
+                             "(default: 10000)")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="number of worker processes, 0 for all the "
+                             "cores (default: 1)")
+    parser.add_argument("--decimals", type=int,
+                        help="round the masses to that many decimals")
+    parser.add_argument("--valid-only", action="store_true",
+                        help="skip the compositions requiring negative "
+                             "masses of chemicals")
+    args = parser.parse_args(argv)
+
+    db = DB()
+    if args.db is not None:
+        if not os.path.exists(args.db):
+            parser.error("database file not found: {0:s}".format(args.db))
+        db.switch_session(args.db)
+
+    try:
+        output = open_output(args.output, args.format)
+    except (ValueError, IOError, OSError) as e:
+        parser.error(str(e))
+
+    try:
+        model = BatchCalculator()
+        model.components, grid = parse_grid(db.session, args.components)
+        model.chemicals = [find_record(db.session, Chemical, c)
+                           for c in split_list(args.chemicals)]
+        writer = WRITERS[args.format](output, model.components, model.chemicals)
+        options = {"chunk_size": args.chunk_size, "decimals": args.decimals,
+                   "valid_only": args.valid_only}
+        if args.processes == 1:
+            results = sweep(model, grid, db.session, **options)
+        else:
+            results = parallel_sweep(model, grid, db.session,
+                                     processes=args.processes or None,
+                                     **options)
+        for moles, masses in results:
+            writer.write(moles, masses)
+        writer.close()
+    except (ValueError, ImportError) as e:
+        sys.exit("zbc-sweep: error: {0}".format(e))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def import_main(argv=None):
+    '''Entry point of the zbc-import script.'''
+
+    parser = argparse.ArgumentParser(
+        prog="zbc-import",
+        description="Import chemicals, components or batch records from a "
+                    "CSV or JSON file into the database")
+    parser.add_argument("table", choices=TABLES, help="table to import into")
+    parser.add_argument("input", help="CSV, JSON or JSON lines file")
+    parser.add_argument("-d", "--db", help="path to the database file")
+    parser.add_argument("-f", "--format", choices=["csv", "json", "jsonl"],
+                        help="input format, guessed from the extension by "
+                             "default")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="only validate the records")
+    args = parser.parse_args(argv)
+
+    db = DB()
+    if args.db is not None:
+        if not os.path.exists(args.db):
+            parser.error("database file not found: {0:s}".format(args.db))
+        db.switch_session(args.db)
+
+    try:
+        report = import_file(db.session, args.table, args.input,
+                             fmt=args.format, dry_run=args.dry_run)
+    except (ValueError, IOError) as e:
+        sys.exit("zbc-import: error: {0}".format(e))
+    except IntegrityError as e:
+        # e.g. a record violating a unique index, the import is rolled back
+        sys.exit("zbc-import: error: nothing imported, the records conflict "
+                 "with the database: {0}".format(e.orig))
+
+    print(report)
+    if len(report.errors) > 0:
+        sys.exit(1)
+
+
+def index_main(argv=None):
+    '''Entry point of the zbc-index script.'''
+
+    parser = argparse.ArgumentParser(
+        prog="zbc-index",
+        description="Catalogue the .zbc files found under the given "
+                    "directories and list the ones matching the conditions")
+    parser.add_argument("directories", nargs="*",
+                        help="directories to scan, only the new and modified "
+                             "files are read")
+    parser.add_argument("-i", "--index", default="zbcindex.db",
+                        help="path to the catalogue (default: %(default)s)")
+    parser.add_argument("-c", "--chemical", action="append", default=[],
+                        help="list only the files using the chemical, given "
+                             "by id, name, short name or formula, can be "
+                             "repeated")
+    parser.add_argument("-r", "--ratio", action="append", default=[],
+                        help="condition on a molar ratio, e.g. "
+                             "\"SiO2/Al2O3>20\", can be repeated")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="do not print the scan summary")
+    args = parser.parse_args(argv)
+
+    try:
+        ratios = [parse_ratio(r) for r in args.ratio]
+    except ValueError as e:
+        parser.error(str(e))
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error("directory not found: {0:s}".format(directory))
+
+    with Catalogue(args.index) as catalogue:
+        for directory in args.directories:
+            report = catalogue.scan(directory)
+            if not args.quiet:
+                print("{0:s}: {1}".format(directory, report), file=sys.stderr)
+
+        if len(args.directories) == 0 or args.chemical or ratios:
+            for path in catalogue.query(args.chemical, ratios):
+                print(path)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -29,156 +29,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import wx
-import os
-import sys
 
 from collections import OrderedDict
 
 from ObjectListView import ObjectListView
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from batchcalc import dialogs
+from batchcalc.database import DB
 from batchcalc.model import (Chemical, Component, Electrolyte, Kind, Category,
                              Reaction, PhysicalForm, Batch, Synthesis,
                              SynthesisComponent, SynthesisChemical)
 
-from batchcalc.utils import get_columns, get_resource_path
+from batchcalc.utils import get_columns
 
 
 __version__ = "0.3.1"
 
 
-#['batches', 'components', 'categories', 'chemicals', 'electrolytes', 'kinds',
-# 'reactions', 'physical_forms', 'syntheses']
-
-
-class Singleton(type):
-
-    _instances = {}
-
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
-
-
-class DB(object):
-    __metaclass__ = Singleton
-
-    def __init__(self):
-
-        self.session = self.get_session()
-
-    @property
-    def dbpath(self):
-        '''
-        Depending on the execution environment get the proper database path.
-        '''
-
-        return get_resource_path('data', 'zeolite.db')
-
-    def get_session(self):
-        '''
-        When the new database is chosen, close the old session and establish a
-        new one.
-        '''
-
-        engine = create_engine("sqlite:///{path:s}".format(path=self.dbpath),
-                               echo=False)
-        Session = sessionmaker(bind=engine, expire_on_commit=False,
-                               autoflush=False)
-        return Session()
-
-    def switch_session(self, dbpath):
-
-        try:
-            self.session.close()
-        except:
-            pass
-
-        engine = create_engine("sqlite:///{path:s}".format(path=dbpath),
-                               echo=False)
-        Session = sessionmaker(bind=engine, expire_on_commit=False,
-                               autoflush=False)
-        self.session = Session()
-
-    def get_batches(self):
-        '''
-        Return all batch records from the database.
-        '''
-
-        return self.session.query(Batch).order_by(Batch.id).all()
-
-    def get_components(self):
-        '''
-        Return all component records from the database.
-        '''
-
-        return self.session.query(Component).order_by(Component.id).all()
-
-    def get_categories(self):
-        '''
-        Return the list of category records from the database.
-        '''
-
-        return self.session.query(Category).order_by(Category.id).all()
-
-    def get_chemicals(self, components=None, showall=False):
-        '''
-        Return chemicals that are sources for the components present in the
-        components list, of the list is empty return all the components.
-        '''
-
-        if showall:
-            query = self.session.query(Chemical).order_by(Chemical.id).all()
-        else:
-            compset = set()
-            for comp in components:
-                temp = self.session.query(Chemical).join(Batch).\
-                    filter(Batch.component_id == comp.id).all()
-                compset.update(temp)
-                query = sorted(list(compset), key=lambda x: x.id)
-        return query
-
-    def get_electrolytes(self):
-        '''
-        Return the list of electrolyte records from the database.
-        '''
-
-        return self.session.query(Electrolyte).order_by(Electrolyte.id).all()
-
-    def get_kinds(self):
-        '''
-        Return the list of kind records from the database.
-        '''
-
-        return self.session.query(Kind).order_by(Kind.id).all()
-
-    def get_physical_forms(self):
-        '''
-        Return the list of physicalform records from the database.
-        '''
-
-        return self.session.query(PhysicalForm).order_by(PhysicalForm.id).all()
-
-    def get_reactions(self):
-        '''
-        Return the list of reaction records from the database.
-        '''
-
-        return self.session.query(Reaction).order_by(Reaction.id).all()
-
-    def get_syntheses(self):
-        '''
-        Return the list of synthesis records from the database.
-        '''
-
-        return self.session.query(Synthesis).order_by(Synthesis.id).all()
-
-
 class ChemicalsDialog(wx.Dialog):
 
     def __init__(self, parent, model, cols=None, id=wx.ID_ANY,
@@ -414,7 +281,8 @@ class AddModifyBatchRecordDialog(wx.Dialog):
         """
 
         data = self.get_data()
-        add_batch_record(self.db.session, data)
+        with self.db.session_scope() as session:
+            add_batch_record(session, data, commit=False)
         dialogs.show_message_dlg("Batch record added", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
 
@@ -431,7 +299,8 @@ class AddModifyBatchRecordDialog(wx.Dialog):
         """
 
         data = self.get_data()
-        modify_batch_record(self.db.session, self.record.id, data)
+        with self.db.session_scope() as session:
+            modify_batch_record(session, self.record.id, data, commit=False)
         dialogs.show_message_dlg("Batch record modified", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
         self.Destroy()
@@ -695,7 +564,8 @@ class AddModifyChemicalRecordDialog(wx.Dialog):
 
         data = self.get_data()
 
-        add_chemical_record(self.db.session, data)
+        with self.db.session_scope() as session:
+            add_chemical_record(session, data, commit=False)
 
         dialogs.show_message_dlg("Chemical added", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
@@ -732,7 +602,8 @@ class AddModifyChemicalRecordDialog(wx.Dialog):
             return
 
         data = self.get_data()
-        modify_chemical_record(self.db.session, self.record.id, data)
+        with self.db.session_scope() as session:
+            modify_chemical_record(session, self.record.id, data, commit=False)
         self.Destroy()
 
     def OnSaveRecord(self, event):
@@ -904,7 +775,8 @@ class AddModifyComponentRecordDialog(wx.Dialog):
 
         data = self.get_data()
 
-        add_component_record(self.db.session, data)
+        with self.db.session_scope() as session:
+            add_component_record(session, data, commit=False)
 
         dialogs.show_message_dlg("Component added", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
@@ -936,7 +808,9 @@ class AddModifyComponentRecordDialog(wx.Dialog):
 
         data = self.get_data()
 
-        modify_component_record(self.db.session, self.record.id, data)
+        with self.db.session_scope() as session:
+            modify_component_record(session, self.record.id, data,
+                                    commit=False)
         dialogs.show_message_dlg("Component modified", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
 
@@ -1192,7 +1066,8 @@ class AddModifySynthesisRecordDialog(wx.Dialog):
         data = self.get_textctrl_data()
         data.update(self.get_model_data())
 
-        add_synthesis_record(db.session, data)
+        with db.session_scope() as session:
+            add_synthesis_record(session, data, commit=False)
 
         dialogs.show_message_dlg("Synthesis added", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
@@ -1220,7 +1095,9 @@ class AddModifySynthesisRecordDialog(wx.Dialog):
 
         data = self.get_textctrl_data()
 
-        modify_synthesis_record(db.session, self.record.id, data)
+        with db.session_scope() as session:
+            modify_synthesis_record(session, self.record.id, data,
+                                    commit=False)
 
         dialogs.show_message_dlg("Synthesis modified", "Success!",
                                  wx.OK | wx.ICON_INFORMATION)
@@ -1263,14 +1140,14 @@ class AddModifySynthesisRecordDialog(wx.Dialog):
         and return as a dictionary.
         '''
 
+        # only the ids are set, the model objects may have been expunged
+        # from the session, see DB.trim
         data = {'components': [], 'chemicals': []}
         for component in self.model.components:
             data['components'].append(SynthesisComponent(component_id=component.id,
-                                                         component=component,
                                                          moles=component.moles))
         for chemical in self.model.chemicals:
             data['chemicals'].append(SynthesisChemical(chemical_id=chemical.id,
-                                                       chemical=chemical,
                                                        mass=chemical.mass))
 
         return data
@@ -1289,9 +1166,29 @@ def print_attrs(inst):
 ################################################################################
 
 # Batch controller methods
+#
+# All the functions below commit the changes by default, with commit=False
+# the changes are only flushed so that many of them can be grouped into one
+# transaction, e.g.
+#
+#     with DB().transaction() as session:
+#         for data in records:
+#             add_chemical_record(session, data, commit=False)
 
 
-def add_batch_record(session, data):
+def _commit(session, commit):
+    """
+    Commit the changes or, if `commit` is False, only flush them and leave
+    the transaction to the caller.
+    """
+
+    if commit:
+        session.commit()
+    else:
+        session.flush()
+
+
+def add_batch_record(session, data, commit=True):
     """
     Add a Batch record to the database, the data should be in the form of
     a dictionary:
@@ -1302,20 +1199,20 @@ def add_batch_record(session, data):
 
     batch = Batch(**data)
     session.add(batch)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_batch_record(session, id_num):
+def delete_batch_record(session, id_num, commit=True):
     """
     Delete an exisitng Batch record.
     """
 
     batch = session.query(Batch).get(id_num)
     session.delete(batch)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_batch_record(session, id_num, data):
+def modify_batch_record(session, id_num, data, commit=True):
     """
     Edit/Modify an existing Batch record.
     """
@@ -1329,13 +1226,13 @@ def modify_batch_record(session, id_num, data):
     if data['reaction_id'] is not None:
         batch._reaction = session.query(Reaction).get(data['reaction_id'])
     session.add(batch)
-    session.commit()
+    _commit(session, commit)
 
 
 # Chemical controller methods
 
 
-def add_chemical_record(session, data):
+def add_chemical_record(session, data, commit=True):
     """
     Add a Chemical record to the database, the data should be in the form of
     a dictionary:
@@ -1367,20 +1264,20 @@ def add_chemical_record(session, data):
         chemical._electrolyte = session.query(Electrolyte).filter(Electrolyte.name == electrolyte).one()
 
     session.add(chemical)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_chemical_record(session, id_num):
+def delete_chemical_record(session, id_num, commit=True):
     """
     Delete a Chemical record.
     """
 
     chemical = session.query(Chemical).get(id_num)
     session.delete(chemical)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_chemical_record(session, id_num, data):
+def modify_chemical_record(session, id_num, data, commit=True):
     """
     Edit/Modify Chemical record in the database,
     """
@@ -1409,13 +1306,13 @@ def modify_chemical_record(session, id_num, data):
         chemical._electrolyte = session.query(Electrolyte).filter(Electrolyte.name == electrolyte).one()
 
     session.add(chemical)
-    session.commit()
+    _commit(session, commit)
 
 
 # Compoment controller methods
 
 
-def add_component_record(session, data):
+def add_component_record(session, data, commit=True):
     """
     Add a Component record to the database, the data should be in the form of
     a dictionary:
@@ -1434,20 +1331,20 @@ def add_component_record(session, data):
         component._category = session.query(Category).filter(Category.name == category).one()
 
     session.add(component)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_component_record(session, id_num):
+def delete_component_record(session, id_num, commit=True):
     """
     Delete a Component record.
     """
 
     component = session.query(Component).get(id_num)
     session.delete(component)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_component_record(session, id_num, data):
+def modify_component_record(session, id_num, data, commit=True):
     """
     Edit/Modify Component record in the database,
     """
@@ -1465,30 +1362,30 @@ def modify_component_record(session, id_num, data):
         component._category = session.query(Category).filter(Category.name == category).one()
 
     session.add(component)
-    session.commit()
+    _commit(session, commit)
 
 
 # Reaction controller methods
 
 
-def add_reaction_record(session, data):
+def add_reaction_record(session, data, commit=True):
 
     reaction = Reaction(reaction=data)
     session.add(reaction)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_reaction_record(session, id_num):
+def delete_reaction_record(session, id_num, commit=True):
     """
     Delete a Reaction record.
     """
 
     reaction = session.query(Reaction).get(id_num)
     session.delete(reaction)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_reaction_record(session, id_num, data):
+def modify_reaction_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing Reaction record in the database
     """
@@ -1496,30 +1393,30 @@ def modify_reaction_record(session, id_num, data):
     reaction = session.query(Reaction).get(id_num)
     reaction.reaction = data
     session.add(reaction)
-    session.commit()
+    _commit(session, commit)
 
 
 # Category controller methods
 
 
-def add_category_record(session, data):
+def add_category_record(session, data, commit=True):
 
     category = Category(name=data)
     session.add(category)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_category_record(session, id_num):
+def delete_category_record(session, id_num, commit=True):
     """
     Delete a category record.
     """
 
     category = session.query(Category).get(id_num)
     session.delete(category)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_category_record(session, id_num, data):
+def modify_category_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing Category record in the database
     """
@@ -1527,13 +1424,13 @@ def modify_category_record(session, id_num, data):
     category = session.query(Category).get(id_num)
     category.name = data
     session.add(category)
-    session.commit()
+    _commit(session, commit)
 
 
 # Kinds controller methods
 
 
-def fill_kinds_table(session):
+def fill_kinds_table(session, commit=True):
     """
     Fill the kinds table with allowed values
     """
@@ -1541,30 +1438,32 @@ def fill_kinds_table(session):
     kinds = ["mixture", "solution", "reactant"]
 
     for kind in kinds:
-        add_kind_record(session, kind)
+        add_kind_record(session, kind, commit=False)
+
+    _commit(session, commit)
 
 
-def add_kind_record(session, data):
+def add_kind_record(session, data, commit=True):
     """
     Add a Kind record.
     """
 
     kind = Kind(name=data)
     session.add(kind)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_kind_record(session, id_num):
+def delete_kind_record(session, id_num, commit=True):
     """
     Delete a Kind record.
     """
 
     kind = session.query(Kind).get(id_num)
     session.delete(kind)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_kind_record(session, id_num, data):
+def modify_kind_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing Kind record in the database
     """
@@ -1572,13 +1471,13 @@ def modify_kind_record(session, id_num, data):
     kind = session.query(Kind).get(id_num)
     kind.name = data
     session.add(kind)
-    session.commit()
+    _commit(session, commit)
 
 
 # Physical_forms controller methods
 
 
-def fill_physical_forms_table(session):
+def fill_physical_forms_table(session, commit=True):
     """
     Fill the physical_forms table with allowed values
     """
@@ -1586,30 +1485,32 @@ def fill_physical_forms_table(session):
     phfs = ["crystals", "solid", "liquid", "gas"]
 
     for phf in phfs:
-        add_physical_form_record(session, phf)
+        add_physical_form_record(session, phf, commit=False)
 
+    _commit(session, commit)
 
-def add_physical_form_record(session, data):
+
+def add_physical_form_record(session, data, commit=True):
     """
     Add a PhysicalForm record.
     """
 
     phf = PhysicalForm(form=data)
     session.add(phf)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_physical_form_record(session, id_num):
+def delete_physical_form_record(session, id_num, commit=True):
     """
     Delete a PhysicalForm record.
     """
 
     phf = session.query(PhysicalForm).get(id_num)
     session.delete(phf)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_physical_form_record(session, id_num, data):
+def modify_physical_form_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing PhysicalForm record in the database
     """
@@ -1617,13 +1518,13 @@ def modify_physical_form_record(session, id_num, data):
     phf = session.query(PhysicalForm).get(id_num)
     phf.form = data
     session.add(phf)
-    session.commit()
+    _commit(session, commit)
 
 
 # Electrolyte controller methods
 
 
-def fill_electrolytes_table(session):
+def fill_electrolytes_table(session, commit=True):
     """
     Fill the electrolyte table with allowed values
     """
@@ -1632,30 +1533,32 @@ def fill_electrolytes_table(session):
              "weak base"]
 
     for elec in elecs:
-        add_electrolyte_record(session, elec)
+        add_electrolyte_record(session, elec, commit=False)
+
+    _commit(session, commit)
 
 
-def add_electrolyte_record(session, data):
+def add_electrolyte_record(session, data, commit=True):
     """
     Add a Electrolyte record.
     """
 
     elec = Electrolyte(name=data)
     session.add(elec)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_electrolyte_record(session, id_num):
+def delete_electrolyte_record(session, id_num, commit=True):
     """
     Delete a Electrolyte record.
     """
 
     elec = session.query(Electrolyte).get(id_num)
     session.delete(elec)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_electrolyte_record(session, id_num, data):
+def modify_electrolyte_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing Electrolyte record in the database
     """
@@ -1663,13 +1566,13 @@ def modify_electrolyte_record(session, id_num, data):
     elec = session.query(Electrolyte).get(id_num)
     elec.name = data
     session.add(elec)
-    session.commit()
+    _commit(session, commit)
 
 
 # Synthesis controller methods
 
 
-def add_synthesis_record(session, data):
+def add_synthesis_record(session, data, commit=True):
     """
     Add a Synthesis record.
     """
@@ -1680,10 +1583,10 @@ def add_synthesis_record(session, data):
     if 'components' in data.keys():
         synth.components = data['components']
     session.add(synth)
-    session.commit()
+    _commit(session, commit)
 
 
-def modify_synthesis_record(session, id_num, data):
+def modify_synthesis_record(session, id_num, data, commit=True):
     """
     Modify/Edit an existing Synthesis record in the database
     """
@@ -1694,14 +1597,14 @@ def modify_synthesis_record(session, id_num, data):
         setattr(synth, k, data[k])
 
     session.add(synth)
-    session.commit()
+    _commit(session, commit)
 
 
-def delete_synthesis_record(session, id_num):
+def delete_synthesis_record(session, id_num, commit=True):
     """
     Delete a Synthesis record.
     """
 
     synth = session.query(Synthesis).get(id_num)
     session.delete(synth)
-    session.commit()
+    _commit(session, commit)
@@ -0,0 +1,1158 @@
+# database.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from functools import partial
+import atexit
+import itertools
+import os
+import sqlite3
+import warnings
+import weakref
+
+from sqlalchemy import (and_, create_engine, event, func, inspect, or_,
+                        text)
+from sqlalchemy.orm import (sessionmaker, close_all_sessions, joinedload,
+                            selectinload, Session)
+from sqlalchemy.pool import QueuePool
+
+from batchcalc.migrations import SEARCH_COLUMNS, fts5_available, migrate
+from batchcalc.model import (Chemical, Component, Electrolyte, Kind, Category,
+                             Reaction, PhysicalForm, Batch, Synthesis,
+                             SynthesisChemical, SynthesisComponent)
+from batchcalc.utils import get_resource_path
+
+
+__version__ = "0.3.1"
+
+
+#['batches', 'components', 'categories', 'chemicals', 'electrolytes', 'kinds',
+# 'reactions', 'physical_forms', 'syntheses']
+
+
+_REVISIONS = defaultdict(int)
+_CHANGES = defaultdict(int)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_revision(session):
+    '''Increase the revision of the database after every commit.'''
+
+    _REVISIONS[str(session.bind.url)] += 1
+
+
+@event.listens_for(Session, "after_rollback")
+def _bump_changes(session):
+    '''
+    Invalidate the cached data after a rollback, it could have been read
+    from the flushed changes that were just discarded.
+    '''
+
+    _CHANGES[str(session.bind.url)] += 1
+
+
+def _changed_elsewhere(session):
+    '''
+    Return True if another connection (e.g. another process) may have
+    committed to the database since the connection of `session` was last
+    checked, based on the SQLite PRAGMA data_version which is specific to
+    every connection.
+    '''
+
+    connection = session.connection().connection
+    cursor = connection.cursor()
+    try:
+        cursor.execute("PRAGMA data_version")
+        version = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    last = connection.info.get("data_version")
+    connection.info["data_version"] = version
+    return last != version
+
+
+def get_revision(session):
+    '''
+    Return the revision of the database bound to `session` as a tuple
+    (database url, number of commits made in this process, number of other
+    changes seen: rollbacks and commits of other connections). It is used to
+    invalidate data cached from the database.
+    '''
+
+    url = str(session.bind.url)
+    if _changed_elsewhere(session):
+        _CHANGES[url] += 1
+    return (url, _REVISIONS[url], _CHANGES[url])
+
+
+# relationship paths loaded together with the records by the DB getters,
+# the association proxies (e.g. Chemical.kind) read them without a query
+EAGER_RELATIONSHIPS = {
+    Batch: [(Batch._chemical,), (Batch._component,), (Batch._reaction,)],
+    Chemical: [(Chemical._kind,), (Chemical._electrolyte,),
+               (Chemical._physical_form,)],
+    Component: [(Component._category,)],
+    Synthesis: [(Synthesis.chemicals, SynthesisChemical.chemical),
+                (Synthesis.components, SynthesisComponent.component)],
+}
+
+
+def eager_options(cls, loading="joined"):
+    '''
+    Return the query options loading the `EAGER_RELATIONSHIPS` of `cls`.
+
+    Args:
+        cls :
+            Mapped class
+        loading : str
+            "joined" or "selectin" strategy for the many-to-one relationships,
+            collections are always loaded with "selectin", None or "lazy" for
+            no eager loading
+
+    Returns:
+        list of loader options
+    '''
+
+    if loading in [None, "lazy"]:
+        return []
+    elif loading not in ["joined", "selectin"]:
+        raise ValueError("unknown loading strategy: {0}".format(loading))
+
+    options = []
+    for path in EAGER_RELATIONSHIPS.get(cls, []):
+        option = None
+        for attr in path:
+            if attr.property.uselist or loading == "selectin":
+                loader = selectinload
+            else:
+                loader = joinedload
+            if option is None:
+                option = loader(attr)
+            else:
+                option = getattr(option, loader.__name__)(attr)
+        options.append(option)
+    return options
+
+
+class QueryCounter(object):
+    '''
+    Context manager counting the SQL statements executed by `engine`::
+
+        with QueryCounter(db.session.bind) as counter:
+            db.get_chemicals(showall=True)
+        print(counter.count)
+
+    Attributes
+    ----------
+    statements : list
+        Executed statements
+    '''
+
+    def __init__(self, engine):
+
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+
+        return len(self.statements)
+
+    def _callback(self, conn, cursor, statement, parameters, context,
+                  executemany):
+
+        self.statements.append(statement)
+
+    def __enter__(self):
+
+        event.listen(self.engine, "before_cursor_execute", self._callback)
+        return self
+
+    def __exit__(self, *args):
+
+        event.remove(self.engine, "before_cursor_execute", self._callback)
+
+
+@contextmanager
+def assert_max_queries(engine, maximum):
+    '''
+    Context manager raising AssertionError if more than `maximum` SQL
+    statements are executed by `engine` within the block.
+    '''
+
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > maximum:
+        raise AssertionError("{0:d} queries executed, expected at most "
+                             "{1:d}:\n{2:s}".format(counter.count, maximum,
+                                                    "\n".join(counter.statements)))
+
+
+# columns of the synthesis table with an index for sorting
+SYNTHESIS_SORT_KEYS = ["id", "name", "target_material", "laborant",
+                       "temperature"]
+
+
+def synthesis_key(synthesis, sort="id"):
+    '''
+    Return the keyset pagination key of a `synthesis` record.
+    '''
+
+    return (getattr(synthesis, sort), synthesis.id)
+
+
+def _keyset_filter(column, after, descending=False):
+    '''
+    Return the condition selecting the records following the key `after`
+    in the (column, id) order, NULLs sort before any value.
+    '''
+
+    value, last_id = after
+    if column is Synthesis.id:
+        return column < last_id if descending else column > last_id
+
+    if descending:
+        if value is None:
+            return and_(column.is_(None), Synthesis.id < last_id)
+        return or_(column < value,
+                   and_(column == value, Synthesis.id < last_id),
+                   column.is_(None))
+    else:
+        if value is None:
+            return or_(and_(column.is_(None), Synthesis.id > last_id),
+                       column.isnot(None))
+        return or_(column > value,
+                   and_(column == value, Synthesis.id > last_id))
+
+
+class SynthesisPages(object):
+    '''
+    Random access to the synthesis records fetched from the database in
+    pages on demand, used by virtual list controls. The pages are walked
+    with keyset pagination and only the last `maxpages` pages accessed are
+    kept in memory. The pages are dropped when the session of `db` is
+    trimmed, see `DB.trim`, and fetched again with attached records.
+
+    Args:
+        db : DB
+            Database
+        page_size : int
+            Number of records in a page
+        sort : str
+            Column to sort on, see `DB.get_syntheses`
+        descending : bool
+            Sort in descending order
+    '''
+
+    def __init__(self, db, page_size=200, sort="id", descending=False,
+                 maxpages=20):
+
+        self.db = db
+        self.page_size = page_size
+        self.sort = sort
+        self.descending = descending
+        self.maxpages = maxpages
+
+        self.count = db.count_syntheses()
+        # keys of the last record of every page fetched so far
+        self.bounds = []
+        self.pages = OrderedDict()
+        _PAGES.add(self)
+
+    def __len__(self):
+
+        return self.count
+
+    def clear(self):
+        '''
+        Drop the records of the fetched pages, the page boundaries are kept.
+        '''
+
+        self.pages.clear()
+
+    def get_page(self, number):
+        '''
+        Return the list of records on page `number`.
+        '''
+
+        if number in self.pages:
+            self.pages[number] = self.pages.pop(number)
+            return self.pages[number]
+
+        # walk forward from the last known page boundary
+        start = min(number, len(self.bounds))
+        for current in range(start, number + 1):
+            after = self.bounds[current - 1] if current > 0 else None
+            page = self.db.get_syntheses(limit=self.page_size, after=after,
+                                         sort=self.sort,
+                                         descending=self.descending)
+            if len(page) == 0:
+                break
+            if current == len(self.bounds):
+                self.bounds.append(synthesis_key(page[-1], self.sort))
+            self.pages[current] = page
+
+        while len(self.pages) > self.maxpages:
+            self.pages.popitem(last=False)
+        return page
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("synthesis index out of range")
+
+        page = self.get_page(index // self.page_size)
+        return page[index % self.page_size]
+
+
+# mapped classes of the tables covered by DB.search
+SEARCH_CLASSES = OrderedDict([
+    ("chemicals", Chemical),
+    ("components", Component),
+    ("synthesis", Synthesis),
+])
+
+
+def fts_query(string):
+    '''
+    Convert a search string typed by the user into an FTS5 query matching
+    the records containing all the words, the last one also as a prefix.
+    '''
+
+    words = ['"{0:s}"'.format(w.replace('"', '""')) for w in string.split()]
+    if len(words) == 0:
+        return None
+    words[-1] += "*"
+    return " ".join(words)
+
+
+class Singleton(type):
+
+    _instances = {}
+
+    def __call__(cls, *args, **kwargs):
+        if cls not in cls._instances:
+            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+        return cls._instances[cls]
+
+
+# PRAGMAs executed on every new SQLite connection
+PRAGMAS = OrderedDict([
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+])
+
+# file systems on which the shared memory of the WAL mode does not work
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "afs",
+                       "9p", "fuse.sshfs", "davfs", "ncpfs")
+
+
+_ENGINES = {}
+
+# absolute paths of the databases whose schema was checked in this process
+_MIGRATED = set()
+
+
+def _set_pragmas(dbapi_connection, connection_record, pragmas=None):
+    '''Apply the `pragmas` to a new DBAPI connection.'''
+
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        try:
+            cursor.execute("PRAGMA {0:s} = {1}".format(name, value))
+        except sqlite3.Error:
+            pass
+    cursor.close()
+
+
+def is_network_path(path):
+    '''
+    Return True if `path` is on a network share: a UNC path or a remote
+    drive on Windows, a network file system in /proc/mounts elsewhere.
+    '''
+
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        if path.startswith("\\\\"):
+            return True
+        import ctypes
+        drive = os.path.splitdrive(path)[0] + "\\"
+        # DRIVE_REMOTE
+        return ctypes.windll.kernel32.GetDriveTypeW(drive) == 4
+
+    try:
+        with open("/proc/mounts") as fobj:
+            mounts = [line.split()[1:3] for line in fobj]
+    except (IOError, OSError):
+        return False
+    # the longest mount point containing the path
+    best = ("", "")
+    for point, fstype in mounts:
+        point = point.replace("\\040", " ")
+        if (path == point or path.startswith(point.rstrip("/") + "/")) and \
+                len(point) > len(best[0]):
+            best = (point, fstype)
+    return best[1] in NETWORK_FILESYSTEMS
+
+
+def wal_allowed(dbpath):
+    '''
+    Return True if the WAL journal mode can be enabled for the database at
+    `dbpath`. The mode persists in the file, so it is never enabled for the
+    database shipped with the package, for a read-only file and for a file on
+    a network share, where WAL does not work.
+    '''
+
+    path = os.path.abspath(dbpath)
+    if path == os.path.abspath(get_resource_path("data", "zeolite.db")):
+        return False
+    if not os.access(path, os.W_OK) or \
+            not os.access(os.path.dirname(path), os.W_OK):
+        return False
+    return not is_network_path(path)
+
+
+def get_engine(dbpath, pragmas=None, wal=False):
+    '''
+    Return the engine for the SQLite database at `dbpath`. Engines are kept
+    in a registry keyed by the absolute path so that their connection pools
+    are reused whenever the same database is opened again.
+
+    Args:
+        dbpath : str
+            Path to the database file
+        pragmas : dict
+            PRAGMAs applied on connect, `PRAGMAS` by default, used only when
+            the engine is created
+        wal : bool
+            Switch the database to the WAL journal mode, which keeps the
+            frequent small commits cheap, if `wal_allowed`, used only when the
+            engine is created
+    '''
+
+    path = os.path.abspath(dbpath)
+    engine = _ENGINES.get(path)
+    if engine is None:
+        pragmas = OrderedDict(PRAGMAS if pragmas is None else pragmas)
+        if wal and wal_allowed(path):
+            pragmas["journal_mode"] = "WAL"
+        engine = create_engine("sqlite:///{path:s}".format(path=path),
+                               echo=False)
+        event.listen(engine, "connect", partial(_set_pragmas, pragmas=pragmas))
+        _ENGINES[path] = engine
+    return engine
+
+
+# models (e.g. BatchCalculator) whose records are never expunged by DB.trim
+_MODELS = weakref.WeakSet()
+
+
+def register_model(model):
+    '''
+    Keep the records listed by `model` in the session when it is trimmed,
+    they are the records named by `model.lists`, as long as `model` lives.
+    '''
+
+    _MODELS.add(model)
+
+
+# live SynthesisPages whose records are dropped by DB.trim
+_PAGES = weakref.WeakSet()
+
+
+class SnapshotConflictError(Exception):
+    pass
+
+
+class _Snapshot(object):
+    '''
+    Shared-cache in-memory copy of the database at `path`, kept alive by the
+    `holder` connection while the sessions use their own connections.
+    '''
+
+    def __init__(self, path, uri):
+
+        self.path = path
+        self.uri = uri
+        self.holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        disk = sqlite3.connect(path)
+        try:
+            disk.backup(self.holder)
+        finally:
+            disk.close()
+        # committed changes not yet saved to the file
+        self.changed = False
+        # state of the file when it was last read or written
+        self.stamp = self.file_stamp()
+
+    def file_stamp(self):
+        '''
+        Return the modification time and the size of the database file,
+        None if it does not exist.
+        '''
+
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def connect(self):
+        '''Return a new connection to the in-memory copy.'''
+
+        return sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    def save(self, force=False):
+        '''
+        Copy the in-memory database to its file if it has unsaved changes.
+        The whole file is replaced, so unless `force` is True it is not
+        written if it was modified by another program since it was last read
+        or written (based on its modification time and size).
+
+        Returns:
+            True if the file was written
+
+        Raises:
+            SnapshotConflictError: if the file was modified by another program
+        '''
+
+        if not self.changed:
+            return False
+        if not force and self.file_stamp() != self.stamp:
+            raise SnapshotConflictError(
+                "{0:s} was modified by another program since it was loaded, "
+                "the changes were not saved".format(self.path))
+        disk = sqlite3.connect(self.path)
+        try:
+            self.holder.backup(disk)
+        finally:
+            disk.close()
+        self.stamp = self.file_stamp()
+        self.changed = False
+        return True
+
+
+# in-memory snapshot engine -> _Snapshot
+_SNAPSHOTS = {}
+_SNAPSHOT_NUMBERS = itertools.count()
+
+
+def get_snapshot_engine(dbpath):
+    '''
+    Return the engine of an in-memory snapshot of the database at `dbpath`,
+    copied with the SQLite backup API when the engine is created. All the
+    reads and writes are served from memory, every session has its own
+    connection (and transaction) to the shared-cache copy. The copy is
+    written to the database file after every commit, see `_Snapshot.save`,
+    the errors are raised by `Session.commit`.
+    '''
+
+    path = os.path.abspath(dbpath)
+    key = "memory:" + path
+    engine = _ENGINES.get(key)
+    if engine is None:
+        uri = "file:zbc-snapshot-{0:d}?mode=memory&cache=shared".format(
+            next(_SNAPSHOT_NUMBERS))
+        snapshot = _Snapshot(path, uri)
+        # the url tells the snapshots apart, see get_revision
+        engine = create_engine("sqlite:///{0:s}&uri=true".format(uri),
+                               creator=snapshot.connect, poolclass=QueuePool,
+                               echo=False)
+        _SNAPSHOTS[engine] = snapshot
+        _ENGINES[key] = engine
+    return engine
+
+
+@event.listens_for(Session, "after_commit")
+def _write_snapshot(session):
+    '''Write a committed in-memory snapshot through to its file.'''
+
+    snapshot = _SNAPSHOTS.get(session.bind)
+    if snapshot is not None:
+        snapshot.changed = True
+        snapshot.save()
+
+
+def save_snapshot(dbpath=None, force=False):
+    '''
+    Write the committed changes of the in-memory snapshot of the database at
+    `dbpath` (of all the snapshots if None) to the database file, e.g. after
+    a failed write, see `_Snapshot.save`.
+
+    Returns:
+        number of the written files
+    '''
+
+    if dbpath is None:
+        snapshots = list(_SNAPSHOTS.values())
+    else:
+        engine = _ENGINES.get("memory:" + os.path.abspath(dbpath))
+        snapshots = [_SNAPSHOTS[engine]] if engine in _SNAPSHOTS else []
+    return sum(1 for snapshot in snapshots if snapshot.save(force))
+
+
+def migrate_once(dbpath):
+    '''
+    Upgrade the schema of the database at `dbpath` unless it was already
+    checked in this process, a database that cannot be upgraded (e.g.
+    read-only) is used as it is.
+    '''
+
+    path = os.path.abspath(dbpath)
+    if path in _MIGRATED:
+        return
+
+    try:
+        migrate(path)
+    except sqlite3.DatabaseError as e:
+        warnings.warn("cannot upgrade the database schema of {0:s}: "
+                      "{1}".format(dbpath, e))
+    _MIGRATED.add(path)
+
+
+def dispose_engine(dbpath=None):
+    '''
+    Close the pooled connections of the engine for `dbpath` and remove it
+    from the registry, all the engines are disposed if `dbpath` is None. The
+    changes of an in-memory snapshot are saved to its file first. The data
+    cached from the database is invalidated, see `get_revision`, since the
+    file can be replaced before it is opened again.
+    '''
+
+    if dbpath is None:
+        paths = list(_ENGINES.keys())
+        _MIGRATED.clear()
+    else:
+        path = os.path.abspath(dbpath)
+        paths = [path, "memory:" + path]
+        _MIGRATED.discard(path)
+
+    for path in paths:
+        engine = _ENGINES.pop(path, None)
+        if engine is not None:
+            engine.dispose()
+            _CHANGES[str(engine.url)] += 1
+            snapshot = _SNAPSHOTS.pop(engine, None)
+            if snapshot is not None:
+                try:
+                    snapshot.save()
+                finally:
+                    snapshot.holder.close()
+
+
+@atexit.register
+def _close_connections():
+    '''
+    Close all the sessions and connections at exit, closing the last
+    connection checkpoints and removes the WAL files.
+    '''
+
+    close_all_sessions()
+    dispose_engine()
+
+
+class DB(metaclass=Singleton):
+
+    def __init__(self, pragmas=None, loading="joined", snapshot=False,
+                 max_identities=5000, wal=False):
+
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        # use the WAL journal mode where possible, see `get_engine`
+        self.wal = wal
+        # cap on the number of objects held by the session, see `trim`
+        self.max_identities = max_identities
+        # serve the reads from an in-memory copy, see `get_snapshot_engine`
+        self.snapshot = snapshot
+        # eager loading strategy of the getters, see `eager_options`
+        self.loading = loading
+        self._session = None
+        self._transaction_depth = 0
+        self._chemicals_cache = (None, {})
+        self._search_cache = (None, set())
+
+    @property
+    def dbpath(self):
+        '''
+        Depending on the execution environment get the proper database path.
+        '''
+
+        return get_resource_path('data', 'zeolite.db')
+
+    @property
+    def session(self):
+        '''
+        Session of the current database, opened for the default database when
+        it is first used, so that e.g. the scripts working on another database
+        never open (and upgrade) the default one.
+        '''
+
+        if self._session is None:
+            self._session = self.get_session()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+
+        self._session = session
+
+    def get_session(self, dbpath=None):
+        '''
+        Return a new session bound to the database at `dbpath`, the default
+        database is used if `dbpath` is None. The database schema is upgraded
+        first if needed, see `batchcalc.migrations`. In the snapshot mode the
+        session is bound to an in-memory copy of the database.
+        '''
+
+        if dbpath is None:
+            dbpath = self.dbpath
+
+        migrate_once(dbpath)
+
+        if self.snapshot:
+            engine = get_snapshot_engine(dbpath)
+        else:
+            engine = get_engine(dbpath, self.pragmas, self.wal)
+
+        Session = sessionmaker(bind=engine, expire_on_commit=False,
+                               autoflush=False)
+        return Session()
+
+    def switch_session(self, dbpath):
+        '''
+        Close the current session and open a new one for the database at
+        `dbpath`, the engine of the previous database stays in the registry
+        and its snapshot, if any, is saved. The current session is kept if
+        the snapshot cannot be saved.
+        '''
+
+        self.close()
+        self.session = self.get_session(dbpath)
+        self._chemicals_cache = (None, {})
+
+    def close(self):
+        '''
+        Close the current session and save its snapshot, if any, the default
+        database is opened again when the session is next used. The session
+        is kept if the snapshot cannot be saved.
+        '''
+
+        if self._session is None:
+            return
+        try:
+            self._session.close()
+        except:
+            pass
+        self.save()
+        self._session = None
+
+    def create_database(self, dbpath):
+        '''
+        Create a new database with an empty schema at `dbpath`, replacing the
+        file if it exists, and switch to it. The engine of a database opened
+        before at the same path is disposed first so that no pooled
+        connection keeps using the removed file.
+        '''
+
+        self.close()
+        dispose_engine(dbpath)
+        if os.path.exists(dbpath):
+            os.remove(dbpath)
+        self.switch_session(dbpath)
+        self._search_cache = (None, set())
+
+    def save(self, force=False):
+        '''
+        Write the committed changes of the in-memory snapshot of the current
+        database to its file, see `save_snapshot`.
+
+        Returns:
+            True if the file was written
+        '''
+
+        if self._session is None:
+            return False
+        snapshot = _SNAPSHOTS.get(self._session.bind)
+        return snapshot is not None and snapshot.save(force)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Context manager grouping many writes into a single transaction, the
+        changes are committed when the block exits and rolled back if it
+        raises an exception. Nested blocks join the outermost transaction.
+        Use the controller functions with commit=False inside the block::
+
+            with DB().transaction() as session:
+                add_batch_record(session, data, commit=False)
+        '''
+
+        depth = self._transaction_depth
+        self._transaction_depth = depth + 1
+        session = self.session
+        try:
+            yield session
+            if depth == 0:
+                session.commit()
+        except:
+            if depth == 0:
+                session.rollback()
+            raise
+        finally:
+            self._transaction_depth = depth
+
+    @contextmanager
+    def session_scope(self, dbpath=None):
+        '''
+        Context manager providing a new, short-lived session for a single
+        operation or dialog, independent of `DB.session`, bound to the
+        database of `DB.session` if `dbpath` is None. The changes are
+        committed at the exit, rolled back on an exception and the session
+        is closed, releasing all the objects it loaded. The records changed in
+        the scope are then reloaded by `DB.session` when used::
+
+            with DB().session_scope() as session:
+                add_chemical_record(session, data, commit=False)
+        '''
+
+        if dbpath is None:
+            session = sessionmaker(bind=self.session.bind,
+                                   expire_on_commit=False, autoflush=False)()
+        else:
+            session = self.get_session(dbpath)
+
+        # identity key -> True if deleted, of the records written in the scope
+        written = {}
+
+        def collect(session, flush_context):
+            for obj in session.dirty:
+                written[inspect(obj).identity_key] = False
+            for obj in session.deleted:
+                written[inspect(obj).identity_key] = True
+
+        event.listen(session, "after_flush", collect)
+        try:
+            yield session
+            session.commit()
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._refresh(written)
+
+    def _refresh(self, written):
+        '''
+        Expire the copies of the records written by another session in
+        `DB.session` and expunge the deleted ones, the copies with pending
+        changes are left alone.
+        '''
+
+        for key, deleted in written.items():
+            obj = self.session.identity_map.get(key)
+            if obj is None or obj in self.session.dirty:
+                continue
+            if deleted:
+                self.session.expunge(obj)
+            else:
+                self.session.expire(obj)
+
+    def trim(self, maximum=None):
+        '''
+        Expunge the unmodified objects from the session if it holds more than
+        `maximum` (`max_identities` by default) of them, objects with pending
+        changes and the records of the live models (see `register_model`) are
+        kept. The pages of the live `SynthesisPages` of this database are
+        cleared since they would hold detached records. Called by the getters
+        before loading new records.
+
+        Returns:
+            number of the expunged objects
+        '''
+
+        if maximum is None:
+            maximum = self.max_identities
+        identity_map = self.session.identity_map
+        if maximum is None or len(identity_map) <= maximum:
+            return 0
+
+        pending = set(self.session.dirty) | set(self.session.deleted)
+        used = set(id(obj) for model in list(_MODELS)
+                   for name in model.lists for obj in getattr(model, name))
+        clean = [obj for obj in identity_map.values()
+                 if obj not in pending and id(obj) not in used]
+        for obj in clean:
+            self.session.expunge(obj)
+        for pages in list(_PAGES):
+            if pages.db is self:
+                pages.clear()
+        self._chemicals_cache = (None, {})
+        return len(clean)
+
+    def session_stats(self):
+        '''
+        Return a dictionary with the number of objects held by the session:
+        "identities" in the identity map, "new", "dirty" and "deleted" ones
+        and the number of identities per class in "classes".
+        '''
+
+        classes = defaultdict(int)
+        for obj in self.session.identity_map.values():
+            classes[type(obj).__name__] += 1
+
+        return {"identities": len(self.session.identity_map),
+                "new": len(self.session.new),
+                "dirty": len(self.session.dirty),
+                "deleted": len(self.session.deleted),
+                "classes": dict(classes)}
+
+    def get_batches(self):
+        '''
+        Return all batch records from the database.
+        '''
+
+        self.trim()
+        return self.session.query(Batch).\
+            options(*eager_options(Batch, self.loading)).\
+            order_by(Batch.id).all()
+
+    def get_components(self):
+        '''
+        Return all component records from the database.
+        '''
+
+        self.trim()
+        return self.session.query(Component).\
+            options(*eager_options(Component, self.loading)).\
+            order_by(Component.id).all()
+
+    def get_categories(self):
+        '''
+        Return the list of category records from the database.
+        '''
+
+        return self.session.query(Category).order_by(Category.id).all()
+
+    def get_chemicals(self, components=None, showall=False):
+        '''
+        Return chemicals that are sources for the components present in the
+        components list, if the list is empty return all the chemicals.
+
+        The results are cached per set of components until the next commit
+        to the database.
+        '''
+
+        self.trim()
+        options = eager_options(Chemical, self.loading)
+
+        if showall or not components:
+            return self.session.query(Chemical).options(*options).\
+                order_by(Chemical.id).all()
+
+        revision = get_revision(self.session)
+        if self._chemicals_cache[0] != revision:
+            self._chemicals_cache = (revision, {})
+
+        key = frozenset(comp.id for comp in components)
+        cache = self._chemicals_cache[1]
+        if key not in cache:
+            cache[key] = self.session.query(Chemical).options(*options).\
+                join(Batch).\
+                filter(Batch.component_id.in_(key)).\
+                distinct().order_by(Chemical.id).all()
+        return list(cache[key])
+
+    def get_electrolytes(self):
+        '''
+        Return the list of electrolyte records from the database.
+        '''
+
+        return self.session.query(Electrolyte).order_by(Electrolyte.id).all()
+
+    def get_kinds(self):
+        '''
+        Return the list of kind records from the database.
+        '''
+
+        return self.session.query(Kind).order_by(Kind.id).all()
+
+    def get_physical_forms(self):
+        '''
+        Return the list of physicalform records from the database.
+        '''
+
+        return self.session.query(PhysicalForm).order_by(PhysicalForm.id).all()
+
+    def get_reactions(self):
+        '''
+        Return the list of reaction records from the database.
+        '''
+
+        return self.session.query(Reaction).order_by(Reaction.id).all()
+
+    def get_syntheses(self, limit=None, after=None, sort="id",
+                      descending=False):
+        '''
+        Return the list of synthesis records from the database, either all of
+        them or a page of at most `limit` records following the record with
+        the key `after` (keyset pagination).
+
+        Args:
+            limit : int
+                Maximal number of records, all if None
+            after : tuple
+                Key of the last record of the previous page, see
+                `synthesis_key`, None for the first page
+            sort : str
+                Column to sort on, one of `SYNTHESIS_SORT_KEYS`, ties are
+                sorted by id
+            descending : bool
+                Sort in descending order
+        '''
+
+        if sort not in SYNTHESIS_SORT_KEYS:
+            raise ValueError("cannot sort syntheses on: {0}".format(sort))
+
+        self.trim()
+        column = getattr(Synthesis, sort)
+        query = self.session.query(Synthesis).\
+            options(*eager_options(Synthesis, self.loading))
+
+        if after is not None:
+            query = query.filter(_keyset_filter(column, after, descending))
+
+        # NULLs come first in the ascending order in SQLite
+        if descending:
+            query = query.order_by(column.desc(), Synthesis.id.desc())
+        else:
+            query = query.order_by(column, Synthesis.id)
+
+        if limit is not None:
+            query = query.limit(limit)
+
+        return query.all()
+
+    def search(self, string, tables=None, limit=50):
+        '''
+        Search the names, formulas, short names, CAS numbers, descriptions
+        and references of the records with the full-text search index.
+
+        Args:
+            string : str
+                Words to search for, the last one can be incomplete
+            tables : list of str
+                Tables to search, all of `SEARCH_CLASSES` by default
+            limit : int
+                Maximal number of results
+
+        Returns:
+            list of records (Chemical, Component or Synthesis) ordered from
+            the best match
+        '''
+
+        if tables is None:
+            tables = list(SEARCH_CLASSES.keys())
+        for table in tables:
+            if table not in SEARCH_CLASSES:
+                raise ValueError("cannot search table: {0}".format(table))
+
+        query = fts_query(string)
+        if query is None:
+            return []
+
+        indexed = self._search_indexes()
+        hits = []
+        for table in tables:
+            if table in indexed:
+                rows = self.session.execute(text(
+                    "SELECT rowid, rank FROM {0:s}_fts WHERE {0:s}_fts "
+                    "MATCH :query ORDER BY rank LIMIT :limit".format(table)),
+                    {"query": query, "limit": limit}).fetchall()
+            else:
+                rows = self._search_like(table, string, limit)
+            hits.extend((rank, table, rid) for rid, rank in rows)
+
+        hits = sorted(hits, key=lambda x: x[0])[:limit]
+
+        records = {}
+        for table in tables:
+            ids = [rid for rank, t, rid in hits if t == table]
+            if len(ids) > 0:
+                cls = SEARCH_CLASSES[table]
+                for record in self.session.query(cls).\
+                        options(*eager_options(cls, self.loading)).\
+                        filter(cls.id.in_(ids)):
+                    records[(table, record.id)] = record
+
+        return [records[(t, rid)] for rank, t, rid in hits
+                if (t, rid) in records]
+
+    def _search_indexes(self):
+        '''
+        Return the set of tables having a usable full-text search index in
+        the current database, none if SQLite is built without FTS5.
+        '''
+
+        url = str(self.session.bind.url)
+        if self._search_cache[0] != url:
+            tables = set()
+            conn = self.session.connection().connection
+            if fts5_available(conn):
+                names = [r[0] for r in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'")]
+                tables = set(t for t in SEARCH_CLASSES if t + "_fts" in names)
+            self._search_cache = (url, tables)
+        return self._search_cache[1]
+
+    def _search_like(self, table, string, limit):
+        '''
+        Search with LIKE in place of the full-text index, all the hits have
+        the same rank.
+        '''
+
+        cls = SEARCH_CLASSES[table]
+        query = self.session.query(cls.id)
+        for word in string.split():
+            pattern = "%{0:s}%".format(word)
+            query = query.filter(or_(*[getattr(cls, c).like(pattern)
+                                       for c in SEARCH_COLUMNS[table]]))
+        return [(rid, 0.0) for (rid,) in query.order_by(cls.id).limit(limit)]
+
+    def count_syntheses(self):
+        '''
+        Return the number of synthesis records.
+        '''
+
+        return self.session.query(func.count(Synthesis.id)).scalar()
\ No newline at end of file
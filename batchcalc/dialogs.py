@@ -27,8 +27,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import os
 import sys
 
@@ -37,6 +35,8 @@ from ObjectListView import ObjectListView
 import wx
 import wx.lib.agw.genericmessagedialog as GMD
 
+from batchcalc.tex_writer import DEFAULT_TEMPLATE, list_templates
+
 
 __version__ = "0.3.1"
 
@@ -252,6 +252,10 @@ class ExportTexDialog(wx.Dialog):
         comment_lbl = wx.StaticText(panel, -1, "Comment:")
         comment = wx.TextCtrl(panel, -1, "", size=(-1, 100),
                               style=wx.TE_MULTILINE | wx.TE_PROCESS_ENTER)
+        template_lbl = wx.StaticText(panel, -1, "Template:")
+        template = wx.ComboBox(panel, -1, DEFAULT_TEMPLATE,
+                               choices=list_templates(),
+                               style=wx.CB_READONLY)
 
         export_btn = wx.Button(panel, id=wx.ID_OK, label="Export")
         cancel_btn = wx.Button(panel, id=wx.ID_CANCEL)
@@ -305,6 +309,7 @@ class ExportTexDialog(wx.Dialog):
             "author": author,
             "email": email,
             "comment": comment,
+            "template": template,
             "composition": cb_cmpm,
             "batch": cb_bmat,
             "rescale_all": cb_rescaleAll,
@@ -333,6 +338,8 @@ class ExportTexDialog(wx.Dialog):
         fgs_title.Add(email, 0, wx.EXPAND)
         fgs_title.Add(comment_lbl, 0, wx.ALIGN_RIGHT | wx.ALIGN_CENTER_VERTICAL)
         fgs_title.Add(comment, 0, wx.GROW)
+        fgs_title.Add(template_lbl, 0, wx.ALIGN_RIGHT | wx.ALIGN_CENTER_VERTICAL)
+        fgs_title.Add(template, 0, wx.EXPAND)
 
         main_sizer.Add(fgs_title, 0, wx.EXPAND | wx.ALL, 10)
         main_sizer.Add(sbc_bs, 0, wx.EXPAND | wx.ALL, 10)
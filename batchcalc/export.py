@@ -0,0 +1,436 @@
+# export.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Bulk export of the stored syntheses to pdf reports (zbc-export).
+
+The syntheses are selected by id or with a full-text search. The masses of
+all the syntheses sharing the same chemicals and components are recalculated
+at once from their compositions, and the reports are rendered in a pool of
+worker processes. A failure to render one report is recorded and does not
+stop the others.
+'''
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from batchcalc.calculator import BatchCalculator, solve_masses
+from batchcalc.database import DB, eager_options
+from batchcalc.model import Chemical, Component, Synthesis
+from batchcalc.pdf_writer import create_pdf
+
+__version__ = "0.3.1"
+
+
+# options of the report, same as returned by dialogs.ExportPdfDialog, an
+# empty title or author is replaced by the name or laborant of the synthesis
+DEFAULT_OPTIONS = {
+    "title": "",
+    "author": "",
+    "comment": "",
+    "composition": True,
+    "batch": True,
+    "rescale_all": True,
+    "rescale_to": True,
+    "rescale_item": True,
+}
+
+
+def parse_ids(string):
+    '''
+    Parse a comma separated list of ids and inclusive ranges, e.g.
+    "1,4,10-20".
+
+    Returns:
+        sorted list of int
+    '''
+
+    ids = set()
+    for field in string.split(","):
+        field = field.strip()
+        if field == "":
+            continue
+        try:
+            if "-" in field:
+                start, stop = [int(x) for x in field.split("-")]
+                ids.update(range(start, stop + 1))
+            else:
+                ids.add(int(field))
+        except ValueError:
+            raise ValueError("wrong id or range: {0:s}".format(field))
+    return sorted(ids)
+
+
+def select_syntheses(db, ids=None, search=None):
+    '''
+    Return the synthesis records with the given `ids` and matching the
+    `search` words, all the records if neither is given.
+
+    Args:
+        db : DB
+            Database
+        ids : list of int
+            Ids of the records
+        search : str
+            Words searched in the names, target materials, descriptions
+            and references, see `DB.search`
+    '''
+
+    query = db.session.query(Synthesis).\
+        options(*eager_options(Synthesis, db.loading))
+
+    if ids is not None:
+        query = query.filter(Synthesis.id.in_(ids))
+    if search:
+        found = db.search(search, tables=["synthesis"],
+                          limit=max(db.count_syntheses(), 1))
+        query = query.filter(Synthesis.id.in_([s.id for s in found]))
+
+    return query.order_by(Synthesis.id).all()
+
+
+def report_flags(synthesis, options):
+    '''
+    Return the flags of `pdf_writer.create_pdf` for the `synthesis`, same as
+    set by the export of a single record in the GUI.
+    '''
+
+    flags = dict(DEFAULT_OPTIONS)
+    flags.update(options)
+    flags["title"] = flags["title"] or synthesis.name or ""
+    flags["author"] = flags["author"] or synthesis.laborant or ""
+    flags["id"] = synthesis.id
+    flags["target"] = synthesis.target_material
+    flags["temp"] = synthesis.temperature
+    flags["ref"] = synthesis.reference
+    flags["desc"] = synthesis.description
+    flags["cryst"] = synthesis.crystallization_time
+    return flags
+
+
+def export_jobs(session, syntheses, directory, options):
+    '''
+    Recalculate the masses of the `syntheses` and return the list of export
+    jobs together with the list of (synthesis id, message) errors.
+
+    The syntheses are grouped by their chemicals and components and the
+    masses of every group are solved in one vectorized step.
+
+    Returns:
+        (jobs, errors) tuple, every job is a tuple (synthesis id, path,
+        components, chemicals, moles, masses, batch matrix, flags)
+    '''
+
+    groups = OrderedDict()
+    for synthesis in syntheses:
+        key = (tuple(c.chemical_id for c in synthesis.chemicals),
+               tuple(c.component_id for c in synthesis.components))
+        groups.setdefault(key, []).append(synthesis)
+
+    # load everything the reports use, the objects are sent to the worker
+    # processes detached from the session
+    chemical_ids = set(i for key in groups for i in key[0])
+    component_ids = set(i for key in groups for i in key[1])
+    session.query(Chemical).options(*eager_options(Chemical)).\
+        filter(Chemical.id.in_(chemical_ids)).all()
+    session.query(Component).options(*eager_options(Component)).\
+        filter(Component.id.in_(component_ids)).all()
+
+    jobs = []
+    errors = []
+    for group in groups.values():
+        model = BatchCalculator()
+        model.chemicals = [c.chemical for c in group[0].chemicals]
+        model.components = [c.component for c in group[0].components]
+        try:
+            model.check_selection(session)
+            problem = model.get_problem(session)
+            moles = np.array([[c.moles for c in s.components] for s in group],
+                             dtype=float)
+            masses = solve_masses(problem, moles)
+        except ValueError as err:
+            errors.extend((s.id, str(err)) for s in group)
+            continue
+
+        for synthesis, row, mrow in zip(group, moles, masses):
+            path = os.path.join(directory,
+                                "synthesis_{0:d}.pdf".format(synthesis.id))
+            jobs.append((synthesis.id, path, model.components, model.chemicals,
+                         row, mrow, problem.B, report_flags(synthesis, options)))
+
+    return jobs, errors
+
+
+def detached_job(job):
+    '''
+    Return a copy of the export `job` whose records are detached copies of
+    the session objects, same as the copies received by the worker
+    processes, so that `render` never modifies the objects of the session.
+    '''
+
+    return pickle.loads(pickle.dumps(job, pickle.HIGHEST_PROTOCOL))
+
+
+def render(job):
+    '''
+    Render the pdf report of a single export job, see `export_jobs`. The
+    moles and masses are set on the records of the job, pass a
+    `detached_job` when rendering in the process owning the session.
+
+    Returns:
+        (synthesis id, path, error message or None) tuple
+    '''
+
+    sid, path, components, chemicals, moles, masses, B, flags = job
+
+    model = BatchCalculator()
+    model.components = components
+    model.chemicals = chemicals
+    for component, m in zip(components, moles):
+        component.moles = float(m)
+    for chemical, m in zip(chemicals, masses):
+        chemical.mass = float(m)
+    model.B = B
+    model.calculated = True
+
+    try:
+        create_pdf(path, model, flags)
+    except Exception as err:
+        return sid, path, "{0:s}: {1}".format(type(err).__name__, err)
+    return sid, path, None
+
+
+class ExportReport(object):
+    '''
+    Result of a bulk export.
+
+    Attributes
+    ----------
+    exported : list
+        (synthesis id, path) tuples of the written reports
+    errors : list
+        (synthesis id, message) tuples for the failed reports
+    cancelled : bool
+        True if the export was stopped by the progress callback
+    '''
+
+    def __init__(self):
+
+        self.exported = []
+        self.errors = []
+        self.cancelled = False
+
+    def __str__(self):
+
+        lines = ["{0:d} report(s) exported, {1:d} failed{2:s}".format(
+                 len(self.exported), len(self.errors),
+                 ", cancelled" if self.cancelled else "")]
+        for sid, message in self.errors:
+            lines.append("  synthesis {0:d}: {1:s}".format(sid, message))
+        return "\n".join(lines)
+
+
+def render_jobs(jobs, report=None, total=None, processes=None, callback=None,
+                start_method=None):
+    '''
+    Render the export `jobs`, see `export_jobs`, in a pool of worker
+    processes. Does not use the session, so it can run in a background
+    thread when the `jobs` are detached, see `detached_job`.
+
+    Args:
+        jobs : list
+            Export jobs
+        report : ExportReport
+            Report to complete, e.g. with the errors of `export_jobs`, a new
+            one if None
+        total : int
+            Total number of the reports passed to `callback`, the number of
+            the jobs and errors in `report` if None
+        processes : int
+            Number of worker processes, all the cores if None, never more
+            than the jobs, 1 renders the reports in the calling process
+        callback : callable
+            Called as callback(done, total) after every report, returning
+            False cancels the remaining reports
+        start_method : str
+            Start method of the worker processes, e.g. "spawn" in a GUI
+            application that must not be forked, the platform default if None
+
+    Returns:
+        ExportReport
+    '''
+
+    if report is None:
+        report = ExportReport()
+    done = len(report.errors)
+    if total is None:
+        total = len(jobs) + done
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+
+    if processes <= 1:
+        pool = None
+        results = (render(detached_job(job)) for job in jobs)
+    else:
+        context = multiprocessing.get_context(start_method)
+        pool = context.Pool(processes)
+        results = pool.imap_unordered(render, jobs)
+
+    try:
+        for sid, path, error in results:
+            if error is None:
+                report.exported.append((sid, path))
+            else:
+                report.errors.append((sid, error))
+            done += 1
+            if callback is not None and callback(done, total) is False:
+                report.cancelled = True
+                break
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    report.exported.sort()
+    report.errors.sort()
+    return report
+
+
+def export_pdfs(session, syntheses, directory, options=None, processes=None,
+                callback=None, start_method=None):
+    '''
+    Export the pdf reports of the `syntheses` to the `directory`, one file
+    per synthesis named synthesis_<id>.pdf.
+
+    Args:
+        session :
+            SQLAlchemy session
+        syntheses : list of Synthesis
+            Records to export, see `select_syntheses`
+        directory : str
+            Output directory, created if needed
+        options : dict
+            Report options, see `DEFAULT_OPTIONS`
+        processes, callback, start_method :
+            See `render_jobs`
+
+    Returns:
+        ExportReport
+    '''
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    report = ExportReport()
+    jobs, report.errors = export_jobs(session, syntheses, directory,
+                                      options or {})
+    return render_jobs(jobs, report, len(syntheses), processes=processes,
+                       callback=callback, start_method=start_method)
+
+
+def main(argv=None):
+    '''Entry point of the zbc-export script.'''
+
+    parser = argparse.ArgumentParser(
+        prog="zbc-export",
+        description="Export the pdf reports of the stored syntheses")
+    parser.add_argument("-o", "--output", default=".",
+                        help="output directory (default: current directory)")
+    parser.add_argument("-i", "--ids",
+                        help="ids of the syntheses, e.g. \"1,4,10-20\", all "
+                             "by default")
+    parser.add_argument("-s", "--search",
+                        help="export only the syntheses matching the words")
+    parser.add_argument("-d", "--db", help="path to the database file")
+    parser.add_argument("-j", "--processes", type=int, default=0,
+                        help="number of worker processes, 0 (default) uses "
+                             "all the cores")
+    parser.add_argument("--comment", default="",
+                        help="comment added to every report")
+    parser.add_argument("--no-composition", action="store_true",
+                        help="omit the composition matrix")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="omit the batch matrix")
+    parser.add_argument("--no-results", action="store_true",
+                        help="omit the rescaled results")
+    args = parser.parse_args(argv)
+
+    db = DB()
+    if args.db is not None:
+        if not os.path.exists(args.db):
+            parser.error("database file not found: {0:s}".format(args.db))
+        db.switch_session(args.db)
+
+    try:
+        ids = parse_ids(args.ids) if args.ids is not None else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    options = {
+        "comment": args.comment,
+        "composition": not args.no_composition,
+        "batch": not args.no_batch,
+        "rescale_all": not args.no_results,
+        "rescale_to": not args.no_results,
+        "rescale_item": not args.no_results,
+    }
+
+    syntheses = select_syntheses(db, ids=ids, search=args.search)
+    if len(syntheses) == 0:
+        sys.exit("zbc-export: error: no syntheses selected")
+
+    def progress(done, total):
+        print("\r{0:d}/{1:d}".format(done, total), end="", file=sys.stderr)
+        sys.stderr.flush()
+
+    report = export_pdfs(db.session, syntheses, args.output, options,
+                         processes=args.processes or None, callback=progress)
+    print(file=sys.stderr)
+
+    print(report)
+    if len(report.errors) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,360 @@
+# importer.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Bulk import of chemicals, components and batch records (coefficients) from
+CSV or JSON files.
+
+The records are read lazily, validated one by one against the lookup tables
+kept in memory and inserted in chunks with a single executemany statement
+per chunk, all in one transaction. The columns of every table are:
+
+    chemicals  : name, formula, molwt, kind, short_name, concentration, cas,
+                 physical_form, density, electrolyte, pk, smiles
+    components : name, formula, molwt, category, short_name
+    batch      : chemical, component, coefficient, reaction
+
+where kind, physical_form, electrolyte and category are given by name, the
+chemical and component of a batch record by id or name (and formula for
+components) and the reaction by id.
+'''
+
+import csv
+import io
+import json
+import os
+
+from batchcalc.model import (Batch, Category, Chemical, Component,
+                             Electrolyte, Kind, PhysicalForm, Reaction)
+
+__version__ = "0.3.1"
+
+
+TABLES = ["chemicals", "components", "batch"]
+
+# kinds of the chemicals that cannot be imported without a concentration
+CONCENTRATION_KINDS = ["solution", "reactant"]
+
+
+def read_records(fobj, fmt="csv"):
+    '''
+    Iterate over the records of a file as dictionaries. The records of a
+    "jsonl" file are the JSON strings of its lines, decoded by
+    `import_records`, so that a malformed line is rejected and reported like
+    an invalid record.
+
+    Args:
+        fobj : file
+            Open file
+        fmt : str
+            "csv" for a file with a header, "jsonl" for a file with one JSON
+            object per line or "json" for a JSON list of objects
+
+    Yields:
+        (line number, record) tuples
+    '''
+
+    if fmt == "csv":
+        reader = csv.DictReader(fobj)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for lineno, line in enumerate(fobj, start=1):
+            if line.strip():
+                yield lineno, line
+    elif fmt == "json":
+        for number, record in enumerate(json.load(fobj), start=1):
+            yield number, record
+    else:
+        raise ValueError("unknown format: {0:s}".format(fmt))
+
+
+class Lookups(object):
+    '''
+    In-memory maps of the names to the ids of the records referenced by the
+    imported data, read once from the database.
+    '''
+
+    def __init__(self, session):
+
+        self.kinds = dict(session.query(Kind.name, Kind.id))
+        self.physical_forms = dict(session.query(PhysicalForm.form,
+                                                 PhysicalForm.id))
+        self.electrolytes = dict(session.query(Electrolyte.name,
+                                               Electrolyte.id))
+        self.categories = dict(session.query(Category.name, Category.id))
+        self.reactions = set(i for (i,) in session.query(Reaction.id))
+        self.chemicals = {}
+        self.components = {}
+        self.refresh(session)
+
+    def refresh(self, session):
+        '''Re-read the chemicals and components.'''
+
+        self.chemical_ids = set()
+        self.chemicals.clear()
+        for cid, name in session.query(Chemical.id, Chemical.name):
+            self.chemical_ids.add(cid)
+            self.chemicals.setdefault(name, []).append(cid)
+
+        self.component_ids = set()
+        self.components.clear()
+        for cid, name, formula in session.query(Component.id, Component.name,
+                                                Component.formula):
+            self.component_ids.add(cid)
+            self.components.setdefault(name, []).append(cid)
+            if formula != name:
+                self.components.setdefault(formula, []).append(cid)
+
+
+def _text(record, key, required=False):
+
+    value = record.get(key)
+    if value is not None and not isinstance(value, (int, float)):
+        value = value.strip()
+    if value is None or value == "":
+        if required:
+            raise ValueError("missing {0:s}".format(key))
+        return None
+    return value
+
+
+def _float(record, key, required=False):
+
+    value = _text(record, key, required)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError("{0:s} is not a number: {1}".format(key, value))
+
+
+def _lookup(mapping, record, key, required=False):
+
+    value = _text(record, key, required)
+    if value is None or value == "Undefined":
+        if required:
+            raise ValueError("missing {0:s}".format(key))
+        return None
+    if value not in mapping:
+        raise ValueError("unknown {0:s}: {1}".format(key, value))
+    return mapping[value]
+
+
+def _reference(names, ids, record, key):
+
+    value = "{}".format(_text(record, key, required=True))
+    if value.isdigit() and int(value) in ids:
+        return int(value)
+    matches = names.get(value, [])
+    if len(matches) == 0:
+        raise ValueError("unknown {0:s}: {1:s}".format(key, value))
+    elif len(set(matches)) > 1:
+        raise ValueError("ambiguous {0:s}: {1:s}".format(key, value))
+    return matches[0]
+
+
+def chemical_row(record, lookups):
+    '''Convert a chemical record to the column values of the table.'''
+
+    kind = _text(record, "kind")
+    concentration = _float(record, "concentration",
+                           required=kind in CONCENTRATION_KINDS)
+
+    return {"name": _text(record, "name", required=True),
+            "formula": _text(record, "formula", required=True),
+            "molwt": _float(record, "molwt", required=True),
+            "short_name": _text(record, "short_name"),
+            "kind_id": _lookup(lookups.kinds, record, "kind", required=True),
+            "concentration": concentration,
+            "cas": _text(record, "cas"),
+            "physical_form_id": _lookup(lookups.physical_forms, record,
+                                        "physical_form"),
+            "density": _float(record, "density"),
+            "electrolyte_id": _lookup(lookups.electrolytes, record,
+                                      "electrolyte"),
+            "pk": _float(record, "pk"),
+            "smiles": _text(record, "smiles")}
+
+
+def component_row(record, lookups):
+    '''Convert a component record to the column values of the table.'''
+
+    return {"name": _text(record, "name", required=True),
+            "formula": _text(record, "formula", required=True),
+            "molwt": _float(record, "molwt", required=True),
+            "short_name": _text(record, "short_name"),
+            "category_id": _lookup(lookups.categories, record, "category",
+                                   required=True)}
+
+
+def batch_row(record, lookups):
+    '''Convert a batch record to the column values of the table.'''
+
+    reaction = _text(record, "reaction")
+    if reaction is not None:
+        reaction = int(reaction)
+        if reaction not in lookups.reactions:
+            raise ValueError("unknown reaction: {0:d}".format(reaction))
+
+    return {"chemical_id": _reference(lookups.chemicals, lookups.chemical_ids,
+                                      record, "chemical"),
+            "component_id": _reference(lookups.components,
+                                       lookups.component_ids, record,
+                                       "component"),
+            "coefficient": _float(record, "coefficient", required=True),
+            "reaction_id": reaction}
+
+
+_CONVERTERS = {
+    "chemicals": (Chemical, chemical_row),
+    "components": (Component, component_row),
+    "batch": (Batch, batch_row),
+}
+
+
+class ImportReport(object):
+    '''
+    Result of an import.
+
+    Attributes
+    ----------
+    table : str
+        Name of the table
+    inserted : int
+        Number of the inserted (or valid in a dry run) records
+    errors : list
+        (line number, message) tuples for the rejected records
+    dry_run : bool
+        True if nothing was written to the database
+    '''
+
+    def __init__(self, table, dry_run=False):
+
+        self.table = table
+        self.inserted = 0
+        self.errors = []
+        self.dry_run = dry_run
+
+    def __str__(self):
+
+        lines = ["{0:s}: {1:d} record(s) {2:s}, {3:d} rejected".format(
+                 self.table, self.inserted,
+                 "valid" if self.dry_run else "inserted", len(self.errors))]
+        for lineno, message in self.errors:
+            lines.append("  line {0:d}: {1:s}".format(lineno, message))
+        return "\n".join(lines)
+
+
+def import_records(session, table, records, dry_run=False, lookups=None,
+                   chunk_size=1000):
+    '''
+    Validate and insert the `records` into the `table`. Invalid records are
+    skipped and reported, the valid ones are inserted with executemany in
+    chunks of `chunk_size` within a single transaction, which is committed
+    at the end unless `dry_run` is True.
+
+    Args:
+        session :
+            SQLAlchemy session
+        table : str
+            One of `TABLES`
+        records : iterable
+            (line number, dict or JSON string) tuples, see `read_records`
+        dry_run : bool
+            Only validate the records
+        lookups : Lookups
+            Lookup tables, read from the database if not given
+
+    Returns:
+        ImportReport
+    '''
+
+    if table not in _CONVERTERS:
+        raise ValueError("cannot import into table: {0:s}".format(table))
+
+    cls, convert = _CONVERTERS[table]
+    insert = cls.__table__.insert()
+    if lookups is None:
+        lookups = Lookups(session)
+
+    report = ImportReport(table, dry_run)
+    rows = []
+
+    try:
+        for lineno, record in records:
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                rows.append(convert(record, lookups))
+            except (ValueError, TypeError, AttributeError) as e:
+                report.errors.append((lineno, "{0}".format(e)))
+                continue
+            if len(rows) >= chunk_size:
+                if not dry_run:
+                    session.execute(insert, rows)
+                report.inserted += len(rows)
+                rows = []
+
+        if len(rows) > 0:
+            if not dry_run:
+                session.execute(insert, rows)
+            report.inserted += len(rows)
+
+        if dry_run:
+            session.rollback()
+        else:
+            session.commit()
+    except:
+        session.rollback()
+        raise
+
+    return report
+
+
+def import_file(session, table, path, fmt=None, dry_run=False):
+    '''
+    Import the records of the `table` from the file at `path`, the format is
+    guessed from the extension if `fmt` is None.
+
+    Returns:
+        ImportReport
+    '''
+
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower().lstrip(".")
+        fmt = ext if ext in ["json", "jsonl"] else "csv"
+
+    with io.open(path, newline="" if fmt == "csv" else None,
+                 encoding="utf-8") as fobj:
+        return import_records(session, table, read_records(fobj, fmt),
+                              dry_run=dry_run)
@@ -0,0 +1,257 @@
+# migrations.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Versioned schema migrations of the SQLite database.
+
+The schema version is stored in the `user_version` PRAGMA of the database,
+databases created before the migrations were introduced have version 0. Every
+entry of `MIGRATIONS` upgrades the schema by one version with a list of SQL
+statements, all the pending upgrades are applied in order, each one in its
+own transaction together with the new version number. Empty databases (e.g.
+created with "New database") get the tables from the model followed by all
+the upgrade steps, which therefore have to be idempotent.
+'''
+
+from collections import OrderedDict
+import sqlite3
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from batchcalc.model import Base
+
+__version__ = "0.3.1"
+
+
+class MigrationError(Exception):
+    pass
+
+
+# columns of the full-text search indexes, see DB.search
+SEARCH_COLUMNS = OrderedDict([
+    ("chemicals", ["name", "formula", "short_name", "cas"]),
+    ("components", ["name", "formula", "short_name"]),
+    ("synthesis", ["name", "target_material", "description", "reference"]),
+])
+
+
+def fts_statements(table, columns):
+    '''
+    Return the statements creating an external content FTS5 index
+    `<table>_fts` over the `columns` of `table`, the triggers keeping it in
+    sync and populating it.
+    '''
+
+    fts = "{0:s}_fts".format(table)
+    cols = ", ".join(columns)
+    new = ", ".join("new." + c for c in columns)
+    old = ", ".join("old." + c for c in columns)
+
+    insert = ("INSERT INTO {fts:s}(rowid, {cols:s}) "
+              "VALUES (new.id, {new:s});").format(fts=fts, cols=cols, new=new)
+    delete = ("INSERT INTO {fts:s}({fts:s}, rowid, {cols:s}) "
+              "VALUES ('delete', old.id, {old:s});").format(fts=fts, cols=cols,
+                                                            old=old)
+    trigger = ("CREATE TRIGGER IF NOT EXISTS {fts:s}_{event:s} AFTER "
+               "{EVENT:s} ON {table:s} BEGIN {body:s} END")
+
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts:s} USING fts5({cols:s}, "
+        "content='{table:s}', content_rowid='id')".format(fts=fts, cols=cols,
+                                                           table=table),
+        trigger.format(fts=fts, event="insert", EVENT="INSERT", table=table,
+                       body=insert),
+        trigger.format(fts=fts, event="delete", EVENT="DELETE", table=table,
+                       body=delete),
+        trigger.format(fts=fts, event="update", EVENT="UPDATE", table=table,
+                       body=delete + " " + insert),
+        "INSERT INTO {fts:s}({fts:s}) VALUES ('rebuild')".format(fts=fts),
+    ]
+
+
+def fts5_available(conn):
+    '''Return True if the SQLite library of `conn` is built with FTS5.'''
+
+    return bool(conn.execute(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+def search_statements(conn):
+    '''
+    Return the statements creating the full-text search indexes of the
+    `SEARCH_COLUMNS`, none if SQLite of `conn` lacks FTS5 since the triggers
+    would then make every write to the indexed tables fail.
+    '''
+
+    if not fts5_available(conn):
+        return []
+    return [statement for table, columns in SEARCH_COLUMNS.items()
+            for statement in fts_statements(table, columns)]
+
+
+def check_search_triggers(conn, fts5=None):
+    '''
+    Make the full-text search triggers usable with the SQLite library of
+    `conn`: drop them if it lacks FTS5 (`fts5` is detected if None), writes
+    to the indexed tables would fail otherwise, and create the missing ones
+    and rebuild the indexes if it has FTS5.
+
+    Returns:
+        True if the database was changed
+    '''
+
+    if fts5 is None:
+        fts5 = fts5_available(conn)
+    names = set(row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"))
+
+    statements = []
+    for table, columns in SEARCH_COLUMNS.items():
+        fts = "{0:s}_fts".format(table)
+        triggers = ["{0:s}_{1:s}".format(fts, event)
+                    for event in ["insert", "delete", "update"]]
+        if not fts5:
+            statements.extend("DROP TRIGGER {0:s}".format(name)
+                              for name in triggers if name in names)
+        elif fts in names and not all(name in names for name in triggers):
+            statements.extend(fts_statements(table, columns)[1:])
+
+    for statement in statements:
+        conn.execute(statement)
+    return len(statements) > 0
+
+
+# (version, description, SQL statements) of the upgrade steps in order, the
+# statements can be given as a function of the connection returning them,
+# the index names follow the SQLAlchemy convention used for `index=True`
+# columns
+MIGRATIONS = [
+    (1, "indexes on the foreign keys of the batch and synthesis tables",
+     ["CREATE INDEX IF NOT EXISTS ix_batch_chemical_id "
+      "ON batch (chemical_id)",
+      "CREATE INDEX IF NOT EXISTS ix_batch_component_id "
+      "ON batch (component_id)",
+      "CREATE INDEX IF NOT EXISTS ix_synthesischemicals_synthesis_id "
+      "ON synthesischemicals (synthesis_id)",
+      "CREATE INDEX IF NOT EXISTS ix_synthesiscomponents_synthesis_id "
+      "ON synthesiscomponents (synthesis_id)"]),
+    (2, "indexes on the sortable columns of the synthesis table",
+     ["CREATE INDEX IF NOT EXISTS ix_synthesis_{0:s} "
+      "ON synthesis ({0:s}, id)".format(column)
+      for column in ["name", "target_material", "laborant", "temperature"]]),
+    (3, "full-text search indexes", search_statements),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    '''Return the schema version of the database open as `conn`.'''
+
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def schema_statements():
+    '''
+    Return the SQL statements creating the current schema from the model.
+    '''
+
+    dialect = sqlite.dialect()
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append("{0}".format(
+            CreateTable(table).compile(dialect=dialect)).strip())
+        for index in sorted(table.indexes, key=lambda x: x.name):
+            statements.append("{0}".format(
+                CreateIndex(index).compile(dialect=dialect)).strip())
+    return statements
+
+
+def _apply(conn, statements, version):
+    '''
+    Execute the `statements` and set the schema `version` in a single
+    transaction.
+    '''
+
+    if callable(statements):
+        statements = statements(conn)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("PRAGMA user_version = {0:d}".format(version))
+    except:
+        cursor.execute("ROLLBACK")
+        raise
+    else:
+        cursor.execute("COMMIT")
+
+
+def migrate(dbpath):
+    '''
+    Upgrade the schema of the database at `dbpath` to `SCHEMA_VERSION`, the
+    full-text search triggers are checked as well, see
+    `check_search_triggers`.
+
+    Returns:
+        list of (version, description) tuples of the applied upgrades
+    '''
+
+    conn = sqlite3.connect(dbpath, isolation_level=None)
+    try:
+        version = get_schema_version(conn)
+        if version > SCHEMA_VERSION:
+            raise MigrationError("database schema version {0:d} is newer than "
+                                 "the supported {1:d}".format(version,
+                                                              SCHEMA_VERSION))
+        elif version == SCHEMA_VERSION:
+            check_search_triggers(conn)
+            return []
+
+        ntables = conn.execute("SELECT count(*) FROM sqlite_master "
+                               "WHERE type = 'table'").fetchone()[0]
+        if ntables == 0:
+            statements = schema_statements()
+            for number, description, steps in MIGRATIONS:
+                statements.extend(steps(conn) if callable(steps) else steps)
+            _apply(conn, statements, SCHEMA_VERSION)
+            return [(SCHEMA_VERSION, "create the schema")]
+
+        applied = []
+        for number, description, statements in MIGRATIONS:
+            if number > version:
+                _apply(conn, statements, number)
+                applied.append((number, description))
+        return applied
+    finally:
+        conn.close()
@@ -27,11 +27,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import re
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship, reconstructor
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.associationproxy import association_proxy
@@ -156,12 +154,20 @@ class Synthesis(ObjRepr, Base):
     components = relationship("SynthesisComponent")
     chemicals = relationship("SynthesisChemical")
 
+    # indexes for the keyset pagination, see DB.get_syntheses
+    __table_args__ = (
+        Index("ix_synthesis_name", "name", "id"),
+        Index("ix_synthesis_target_material", "target_material", "id"),
+        Index("ix_synthesis_laborant", "laborant", "id"),
+        Index("ix_synthesis_temperature", "temperature", "id"),
+    )
+
 
 class SynthesisChemical(ObjRepr, Base):
     __tablename__ = "synthesischemicals"
 
     id = Column(Integer, primary_key=True)
-    synthesis_id = Column(Integer, ForeignKey("synthesis.id"))
+    synthesis_id = Column(Integer, ForeignKey("synthesis.id"), index=True)
     chemical_id = Column(Integer, ForeignKey("chemicals.id"))
     chemical = relationship("Chemical")
     mass = Column(Float, nullable=False)
@@ -171,7 +177,7 @@ class SynthesisComponent(ObjRepr, Base):
     __tablename__ = "synthesiscomponents"
 
     id = Column(Integer, primary_key=True)
-    synthesis_id = Column(Integer, ForeignKey("synthesis.id"))
+    synthesis_id = Column(Integer, ForeignKey("synthesis.id"), index=True)
     component_id = Column(Integer, ForeignKey("components.id"))
     component = relationship("Component")
     moles = Column(Float, nullable=False)
@@ -270,8 +276,10 @@ class Batch(Base):
     __tablename__ = 'batch'
 
     id = Column(Integer, primary_key=True)
-    chemical_id = Column(Integer, ForeignKey('chemicals.id'), nullable=False)
-    component_id = Column(Integer, ForeignKey('components.id'), nullable=False)
+    chemical_id = Column(Integer, ForeignKey('chemicals.id'), nullable=False,
+                         index=True)
+    component_id = Column(Integer, ForeignKey('components.id'), nullable=False,
+                          index=True)
     reaction_id = Column(Integer, ForeignKey('reactions.id'), nullable=True)
     coefficient = Column(Float, nullable=True)
 
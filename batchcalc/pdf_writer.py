@@ -27,8 +27,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import datetime
 import numpy as np
 from reportlab.lib.enums import TA_JUSTIFY, TA_RIGHT, TA_CENTER, TA_LEFT
@@ -37,7 +35,6 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.platypus.flowables import KeepTogether
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
-from batchcalc import controller as ctrl
 
 
 __version__ = "0.3.1"
@@ -145,11 +142,13 @@ def composition_results_table(model):
 
 
 def batch_table(model):
+    '''
+    Return the table with the batch matrix of the last calculation, the
+    model is not recalculated so that the reports can be rendered without the
+    database.
+    '''
 
-    db = ctrl.DB()
-
-    temp = np.array(map(lambda x: "{0:8.4f}".format(x), model.get_B_matrix(db.session).reshape(model.B.size)))
-    data = temp.reshape(model.get_B_matrix(db.session).shape).tolist()
+    data = [["{0:8.4f}".format(x) for x in row] for row in np.asarray(model.B)]
     for row, chemical in zip(data, model.chemicals):
         row.insert(0, chemical.formula + " ({0:6.2f}%)".format(chemical.concentration * 100))
     data.insert(0, ['Compound'] + [c.formula for c in model.components])
@@ -0,0 +1,294 @@
+# sweep.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Sweeps over a Cartesian grid of compositions.
+
+Every component is either fixed or varied over a list of values. A varied
+component can also be given relative to another component, e.g. H2O/SiO2,
+in which case its number of moles is the value times the moles of the base
+component. The grid is enumerated lazily in chunks so that the memory stays
+bounded for grids of any size. Large grids can be distributed over a pool of
+processes with `parallel_sweep`.
+'''
+
+from collections import deque
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+from batchcalc.calculator import BatchProblem, solve_masses
+
+__version__ = "0.3.1"
+
+
+def parse_values(string):
+    '''
+    Parse a string with the values of a sweep axis, either a comma separated
+    list "10,20,40" or an inclusive range "start:stop:step", e.g. "10:40:5".
+
+    Returns:
+        numpy.ndarray with the values
+    '''
+
+    string = string.strip()
+    if ":" in string:
+        fields = [float(x) for x in string.split(":")]
+        if len(fields) != 3:
+            raise ValueError("range should be given as start:stop:step, "
+                             "got: {0:s}".format(string))
+        start, stop, step = fields
+        if step <= 0.0 or stop < start:
+            raise ValueError("wrong range: {0:s}".format(string))
+        return np.arange(start, stop + 0.5 * step, step)
+    else:
+        return np.asarray([float(x) for x in string.split(",") if x.strip()],
+                          dtype=float)
+
+
+class CompositionGrid(object):
+    '''
+    Cartesian grid of compositions over `ncomponents` components.
+
+    Args:
+        ncomponents : int
+            Number of components
+        fixed : dict
+            Component index -> number of moles, for the components that are
+            not varied
+        axes : list of tuples
+            (component index, values, base component index) for every varied
+            component, the base index is None for absolute values, otherwise
+            the moles are calculated as value times the moles of the base
+            component, which has to be fixed or varied with absolute values
+    '''
+
+    def __init__(self, ncomponents, fixed, axes):
+
+        self.ncomponents = ncomponents
+        self.fixed = dict(fixed)
+        self.axes = [(i, np.asarray(v, dtype=float), b) for i, v, b in axes]
+
+        indices = list(self.fixed.keys()) + [a[0] for a in self.axes]
+        if sorted(indices) != list(range(ncomponents)):
+            raise ValueError("every component has to be either fixed or "
+                             "varied exactly once")
+
+        absolute = set(self.fixed.keys()) | set(i for i, v, b in self.axes
+                                                if b is None)
+        for i, values, base in self.axes:
+            if len(values) == 0:
+                raise ValueError("no values given for component {0:d}".format(i))
+            if base is not None and base not in absolute:
+                raise ValueError("the base of a ratio has to be fixed or "
+                                 "varied with absolute values")
+
+        self.shape = tuple(len(v) for i, v, b in self.axes)
+
+    def __len__(self):
+
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    def compositions(self, start, stop):
+        '''
+        Return the compositions with flat grid indices from `start` to `stop`
+        as a 2-D array with one row per composition.
+        '''
+
+        flat = np.arange(start, stop, dtype=np.int64)
+        moles = np.empty((len(flat), self.ncomponents), dtype=float)
+
+        for i, value in self.fixed.items():
+            moles[:, i] = value
+
+        coords = np.unravel_index(flat, self.shape)
+        for (i, values, base), coord in zip(self.axes, coords):
+            if base is None:
+                moles[:, i] = values[coord]
+        for (i, values, base), coord in zip(self.axes, coords):
+            if base is not None:
+                moles[:, i] = values[coord] * moles[:, base]
+
+        return moles
+
+    def chunks(self, chunk_size):
+        '''
+        Iterate over the grid in chunks of at most `chunk_size` compositions.
+        '''
+
+        for start in range(0, len(self), chunk_size):
+            yield self.compositions(start, min(start + chunk_size, len(self)))
+
+
+def postprocess(moles, masses, decimals=None, valid_only=False, tol=1.0e-8):
+    '''
+    Post-process a chunk of results.
+
+    Args:
+        moles : numpy.ndarray
+            Compositions, one per row
+        masses : numpy.ndarray
+            Masses of chemicals, one row per composition
+        decimals : int
+            Round the masses to that many decimals, no rounding if None
+        valid_only : bool
+            Drop the compositions that require a negative mass of any of the
+            chemicals, i.e. cannot be prepared from the selected chemicals
+        tol : float
+            Tolerance for the negative masses
+
+    Returns:
+        (moles, masses) tuple
+    '''
+
+    if valid_only:
+        valid = np.all(masses >= -tol, axis=1)
+        moles = moles[valid]
+        masses = masses[valid]
+    if decimals is not None:
+        # adding zero turns the -0.0 into 0.0
+        masses = np.round(masses, decimals) + 0.0
+    return moles, masses
+
+
+def sweep(model, grid, session, chunk_size=10000, decimals=None,
+          valid_only=False):
+    '''
+    Calculate the masses of the chemicals for all the compositions on the
+    `grid`, the batch matrix is factorized once and every chunk is solved
+    in a single vectorized step.
+
+    Args:
+        model : BatchCalculator
+            Calculator with the chemicals and components selected
+        grid : CompositionGrid
+            Grid of compositions over `model.components`
+        session :
+            SQLAlchemy session
+        chunk_size : int
+            Number of compositions solved at once
+        decimals : int
+            See `postprocess`
+        valid_only : bool
+            See `postprocess`
+
+    Yields:
+        (moles, masses) tuples of 2-D arrays for every chunk
+    '''
+
+    if grid.ncomponents != len(model.components):
+        raise ValueError("grid and model have different number of components")
+
+    for moles in grid.chunks(chunk_size):
+        masses = model.calculate_masses_many(moles, session)
+        yield postprocess(moles, masses, decimals, valid_only)
+
+
+# state of a worker process set by _init_worker
+_WORKER = {}
+
+
+def _init_worker(shared, problem, grid, options):
+    '''
+    Initialize a worker process with the batch problem, whose factorized
+    batch matrix is a view of the shared memory.
+    '''
+
+    problem._Binv = np.frombuffer(shared, dtype=float).reshape(
+        (len(problem.chemicals), len(problem.components)))
+    _WORKER["problem"] = problem
+    _WORKER["grid"] = grid
+    _WORKER["options"] = options
+
+
+def _solve_chunk(bounds):
+    '''Solve the compositions with flat grid indices in `bounds`.'''
+
+    moles = _WORKER["grid"].compositions(*bounds)
+    masses = solve_masses(_WORKER["problem"], moles)
+    return postprocess(moles, masses, **_WORKER["options"])
+
+
+def parallel_sweep(model, grid, session, processes=None, chunk_size=10000,
+                   decimals=None, valid_only=False, max_pending=None):
+    '''
+    Same as `sweep` but the chunks are distributed over a pool of
+    `processes` worker processes (all the cores by default). The inverse of
+    the transposed batch matrix is calculated once and placed in the shared
+    memory, the workers receive it together with the rest of the
+    `BatchProblem` snapshot only once, when they are started. The chunks are
+    yielded in the grid order.
+
+    At most `max_pending` chunks (twice the number of processes by default)
+    are submitted and not yet yielded at any time, so the memory stays
+    bounded when the consumer is slower than the workers.
+    '''
+
+    if grid.ncomponents != len(model.components):
+        raise ValueError("grid and model have different number of components")
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if max_pending is None:
+        max_pending = 2 * processes
+    elif max_pending < 1:
+        raise ValueError("max_pending has to be at least 1")
+
+    problem = model.get_problem(session)
+    binv = problem.Binv
+
+    shared = RawArray("d", binv.size)
+    np.frombuffer(shared, dtype=float)[:] = binv.ravel()
+
+    # the inverse is sent through the shared memory only
+    snapshot = BatchProblem(problem.chemicals, problem.components,
+                            problem.kinds, problem.concentrations,
+                            problem.molwts, problem.B)
+    options = {"decimals": decimals, "valid_only": valid_only}
+
+    bounds = ((start, min(start + chunk_size, len(grid)))
+              for start in range(0, len(grid), chunk_size))
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(shared, snapshot, grid, options))
+    pending = deque()
+    try:
+        for bound in bounds:
+            pending.append(pool.apply_async(_solve_chunk, (bound,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
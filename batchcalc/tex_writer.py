@@ -27,28 +27,109 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
 import os
 import sys
 import datetime
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 from batchcalc.utils import get_resource_path
 
 __version__ = "0.3.1"
 
 
-def get_report_as_string(flags, model):
+DEFAULT_TEMPLATE = "report_color.tex"
+
+# environment variable with the directories of the user templates separated
+# by os.pathsep, searched before the templates of the package
+TEMPLATE_PATH_VARIABLE = "ZBC_TEMPLATE_PATH"
+
+# environments created by get_environment, keyed by the template search path
+# and the bytecode cache directory
+_ENVIRONMENTS = {}
+
+
+def get_template_path(extra=None):
+    '''
+    Return the template search path as a tuple of directories: `extra`
+    directories, the ones from the ZBC_TEMPLATE_PATH environment variable and
+    the directory with the templates of the package.
+    '''
+
+    paths = list(extra or [])
+    env = os.environ.get(TEMPLATE_PATH_VARIABLE, "")
+    paths.extend(p for p in env.split(os.pathsep) if p != "")
+    paths.append(get_resource_path("templates", "tex"))
+    return tuple(os.path.abspath(p) for p in paths)
+
+
+def get_environment(searchpath=None, cache_dir=None):
+    '''
+    Return the Jinja environment for the TeX templates in `searchpath`, see
+    `get_template_path`. The environment is created once per search path and
+    cache directory and reused, so that every template is parsed only once
+    per process. The compiled templates are also stored in a bytecode cache
+    on disk for the other processes.
+
+    Args:
+        searchpath : tuple of str
+            Template directories, `get_template_path()` by default
+        cache_dir : str
+            Directory of the bytecode cache, by default a private directory
+            in the system temporary directory
+    '''
+
+    if searchpath is None:
+        searchpath = get_template_path()
+
+    key = (searchpath, cache_dir)
+    env = _ENVIRONMENTS.get(key)
+    if env is None:
+        env = Environment('<*', '*>', '<<', '>>', '<#', '#>',
+                          autoescape=False,
+                          loader=FileSystemLoader(list(searchpath)),
+                          bytecode_cache=FileSystemBytecodeCache(cache_dir))
+        _ENVIRONMENTS[key] = env
+    return env
+
+
+def list_templates():
+    '''
+    Return the names of the available TeX templates.
+    '''
+
+    return get_environment().list_templates(extensions=["tex"])
+
+
+def get_template(name=None):
+    '''
+    Return the compiled template `name`, either a name of a template on the
+    search path, e.g. "report_basic.tex", or a path to a template file.
+    '''
+
+    if name is None:
+        name = DEFAULT_TEMPLATE
+
+    if os.path.isfile(name):
+        directory, name = os.path.split(os.path.abspath(name))
+        return get_environment(get_template_path([directory])).get_template(name)
+    return get_environment().get_template(name)
+
+
+def get_report_as_string(flags, model, template=None):
     '''
     Return a string with a report in the TeX format.
+
+    Args:
+        flags : dict
+            Report options, see `dialogs.ExportTexDialog`
+        model : BatchCalculator
+            Calculator with the results
+        template : str
+            Name or path of the template, see `get_template`,
+            `DEFAULT_TEMPLATE` if None
     '''
 
-    env = Environment('<*', '*>', '<<', '>>', '<#', '#>',
-                      autoescape=False,
-                      extensions=['jinja2.ext.autoescape'],
-                      loader=FileSystemLoader(get_resource_path("templates", "tex")))
-    template = env.get_template('report_color.tex')
+    template = get_template(template)
 
     flags['date'] = datetime.datetime.now().strftime("%H:%M:%S %d.%m.%Y")
     flags['molar_ratios'] = r':'.join(['{0}{1}'.format(x.moles, x.tex_label()) for x in model.components])
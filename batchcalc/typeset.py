@@ -0,0 +1,283 @@
+# typeset.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Typesetting of the TeX reports with pdflatex.
+
+The pdf files are cached under the hash of the TeX source and of the
+pdflatex command, so a report that did not change is not typeset again. The
+volatile parts of the source, like the date of a report, can be left out of
+the hash. The least recently used files are removed when the cache grows too
+large and the ones not used for a long time are removed as well.
+Every compile runs in its own temporary directory and the results are moved
+into the cache atomically, so that several reports can be typeset at the same
+time, also from different processes. pdflatex is run again only as long as
+the .aux file changes, usually once or twice.
+'''
+
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+__version__ = "0.3.1"
+
+
+PDFLATEX_OPTIONS = ["-halt-on-error", "-interaction=nonstopmode"]
+
+# limits of the pdf cache: total size in bytes and age in seconds
+CACHE_MAX_SIZE = 100 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+# lines of the .aux file read back by the next pass
+_AUX_REFERENCES = ("\\newlabel", "\\bibcite", "\\@writefile")
+
+
+class TypesetError(Exception):
+    '''
+    pdflatex failed, the `log` attribute holds the contents of its log file.
+    '''
+
+    def __init__(self, message, log=""):
+
+        super(TypesetError, self).__init__(message)
+        self.log = log
+
+
+def get_cache_dir():
+    '''
+    Return the default directory of the pdf cache.
+    '''
+
+    return os.path.join(os.path.expanduser("~"), ".cache", "batchcalc", "pdf")
+
+
+def source_hash(texdata, command, volatile=()):
+    '''
+    Return the hex digest identifying the pdf typeset from `texdata` with
+    the `command` (list of the executable and options), the `volatile`
+    strings are removed from `texdata` first.
+    '''
+
+    for string in volatile:
+        if string:
+            texdata = texdata.replace(string, "")
+    sha = hashlib.sha256()
+    for arg in command:
+        sha.update(arg.encode("utf-8") + b"\0")
+    sha.update(texdata.encode("utf-8"))
+    return sha.hexdigest()
+
+
+def prune_cache(cache_dir, max_size=CACHE_MAX_SIZE, max_age=CACHE_MAX_AGE,
+                keep=None):
+    '''
+    Remove the pdf files not used for more than `max_age` seconds from the
+    cache and then the least recently used ones until the cache takes at
+    most `max_size` bytes. The file `keep` is never removed.
+
+    Returns:
+        number of the removed files
+    '''
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not name.endswith(".pdf") or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # removed concurrently
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for mtime, size, path in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+
+    removed = 0
+    now = time.time()
+    for mtime, size, path in sorted(entries):
+        if now - mtime <= max_age and total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def _read(path):
+    '''Return the contents of a file or None if it does not exist.'''
+
+    if not os.path.exists(path):
+        return None
+    with io.open(path, "rb") as fobj:
+        return fobj.read()
+
+
+def needs_rerun(aux_before, aux_after):
+    '''
+    Decide from the .aux files before and after a pass whether another pass
+    is needed, i.e. whether the references read from the .aux changed.
+    '''
+
+    if aux_after == aux_before:
+        return False
+    if aux_before is None:
+        # the first pass only needs a second one if something is referenced
+        lines = (aux_after or b"").decode("utf-8", "replace").splitlines()
+        return any(line.startswith(_AUX_REFERENCES) for line in lines)
+    return True
+
+
+def run_pdflatex(texdata, workdir, pdflatex="pdflatex", max_passes=3,
+                 jobname="report"):
+    '''
+    Typeset `texdata` in `workdir` running pdflatex until the .aux file is
+    stable, at most `max_passes` times.
+
+    Returns:
+        (path to the pdf file, number of passes) tuple
+
+    Raises:
+        TypesetError if pdflatex cannot be run or fails
+    '''
+
+    texfile = os.path.join(workdir, jobname + ".tex")
+    with io.open(texfile, "w", encoding="utf-8") as fobj:
+        fobj.write(texdata)
+
+    command = [pdflatex] + PDFLATEX_OPTIONS + [jobname + ".tex"]
+    auxfile = os.path.join(workdir, jobname + ".aux")
+    aux = _read(auxfile)
+
+    for npass in range(1, max_passes + 1):
+        try:
+            proc = subprocess.Popen(command, cwd=workdir,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+        except OSError as err:
+            raise TypesetError("cannot run {0:s}: {1}".format(pdflatex, err))
+        output = proc.communicate()[0]
+
+        if proc.returncode != 0:
+            log = _read(os.path.join(workdir, jobname + ".log")) or output
+            raise TypesetError("pdflatex failed with return code {0:d}".format(
+                               proc.returncode),
+                               log.decode("utf-8", "replace"))
+
+        newaux = _read(auxfile)
+        if not needs_rerun(aux, newaux):
+            break
+        aux = newaux
+
+    return os.path.join(workdir, jobname + ".pdf"), npass
+
+
+def get_pdf(texdata, output=None, pdflatex="pdflatex", cache_dir=None,
+            max_passes=3, volatile=()):
+    '''
+    Return the pdf typeset from `texdata`, reusing the cached one if the same
+    source, apart from the `volatile` strings, was already typeset with the
+    same `pdflatex`. The cache is pruned when a new pdf is added, see
+    `prune_cache`.
+
+    Args:
+        texdata : str
+            TeX source
+        output : str
+            Path where the pdf is copied, if given
+        pdflatex : str
+            pdflatex executable
+        cache_dir : str
+            Directory of the cache, `get_cache_dir()` by default
+        max_passes : int
+            Maximal number of pdflatex runs
+        volatile : iterable of str
+            Parts of `texdata` left out of the cache key, e.g. the date of
+            the report, the cached pdf has the ones it was typeset with
+
+    Returns:
+        path of the pdf, `output` if given, otherwise the cached file
+
+    Raises:
+        TypesetError if pdflatex fails
+    '''
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # created by a concurrent compile
+            if not os.path.isdir(cache_dir):
+                raise
+
+    key = source_hash(texdata, [pdflatex] + PDFLATEX_OPTIONS, volatile)
+    cached = os.path.join(cache_dir, key + ".pdf")
+
+    if os.path.exists(cached):
+        try:
+            # mark as recently used
+            os.utime(cached, None)
+        except OSError:
+            pass
+    else:
+        workdir = tempfile.mkdtemp(prefix="zbc-tex-")
+        try:
+            pdf, npass = run_pdflatex(texdata, workdir, pdflatex, max_passes)
+            # move into place in one step, the partial file has a unique name
+            fd, partial = tempfile.mkstemp(suffix=".part", dir=cache_dir)
+            os.close(fd)
+            shutil.copyfile(pdf, partial)
+            try:
+                os.rename(partial, cached)
+            except OSError:
+                # the target exists on windows, typeset concurrently
+                os.remove(partial)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        prune_cache(cache_dir, keep=cached)
+
+    if output is None:
+        return cached
+    shutil.copyfile(cached, output)
+    return output
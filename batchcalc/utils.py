@@ -32,7 +32,6 @@
 import os
 import sys
 from collections import OrderedDict
-from ObjectListView import ColumnDefn
 
 
 __version__ = "0.3.1"
@@ -117,4 +116,7 @@ def get_columns(cols):
             list of keys from COLUMNS dict
     '''
 
+    # imported here so that the module can be used without the GUI
+    from ObjectListView import ColumnDefn
+
     return [ColumnDefn(**COLUMNS[col]) for col in cols]
@@ -29,12 +29,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from __future__ import print_function, unicode_literals
-
+import argparse
+import io
+import multiprocessing
 import os
-import pickle
-import subprocess
+import sqlite3
 import sys
+import threading
 import traceback
 
 import numpy as np
@@ -43,31 +44,30 @@ import wx
 import wx.grid as gridlib
 from wx.lib.wordwrap import wordwrap
 
-from ObjectListView import ObjectListView
+from ObjectListView import ObjectListView, VirtualObjectListView
 
 from batchcalc.tex_writer import get_report_as_string
+from batchcalc.typeset import TypesetError, get_pdf
 from batchcalc.pdf_writer import create_pdf, create_pdf_composition
 from batchcalc.calculator import BatchCalculator
 from batchcalc import controller as ctrl
 from batchcalc import dialogs
+from batchcalc import zbcfile
 
-from batchcalc.utils import get_columns
+from batchcalc.database import (SYNTHESIS_SORT_KEYS, SnapshotConflictError,
+                                SynthesisPages)
+from batchcalc.export import (ExportReport, detached_job, export_jobs,
+                              render_jobs, select_syntheses)
+from batchcalc.utils import COLUMNS, get_columns
 
 __version__ = "0.3.1"
 
 
-def clean_tex(fname):
-    '''Clean the auxiliary tex files.'''
-
-    exts = [".out", ".aux", ".log"]
-    fbase = os.path.splitext(fname)[0]
-    for fil in [fbase + ext for ext in exts]:
-        if os.path.exists(fil):
-            os.remove(fil)
-
-
 class AddModifyDBBaseFrame(wx.Frame):
 
+    # table searched with the full-text index, None if not searchable
+    search_table = None
+
     def __init__(self, parent, cols=None, id=wx.ID_ANY, title="Edit Database",
                  pos=wx.DefaultPosition, size=(500, 300),
                  style=wx.DEFAULT_FRAME_STYLE, name=""):
@@ -100,6 +100,12 @@ class AddModifyDBBaseFrame(wx.Frame):
         showAllBtn.Bind(wx.EVT_BUTTON, self.onShowAllRecords)
         btnSizer.Add(showAllBtn, 0, wx.ALL, 5)
 
+        if self.search_table is not None:
+            self.search = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+            self.search.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.onSearch)
+            self.search.Bind(wx.EVT_TEXT_ENTER, self.onSearch)
+            mainSizer.Add(self.search, 0, wx.ALL | wx.EXPAND, 5)
+
         mainSizer.Add(self.olv, 1, wx.ALL | wx.EXPAND, 5)
         mainSizer.Add(btnSizer, 0, wx.CENTER)
         self.SetSizer(mainSizer)
@@ -123,7 +129,17 @@ class AddModifyDBBaseFrame(wx.Frame):
         """
         Searches database based on the user's filter choice and keyword
         """
-        print("searching")
+
+        if self.search_table is None:
+            return
+
+        string = self.search.GetValue().strip()
+        if string == "":
+            self.show_all()
+            return
+
+        db = ctrl.DB()
+        self.set_olv(db.search(string, tables=[self.search_table], limit=500))
 
     def onShowAllRecords(self, event):
         '''Updates the record list to show all of them'''
@@ -178,7 +194,8 @@ class AddModifyBatchTableFrame(AddModifyDBBaseFrame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_batch_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_batch_record(session, sel_row.id, commit=False)
         self.show_all()
 
     def onShowAllRecords(self, event):
@@ -203,6 +220,8 @@ class AddModifyBatchTableFrame(AddModifyDBBaseFrame):
 
 class AddModifyChemicalTableFrame(AddModifyDBBaseFrame):
 
+    search_table = "chemicals"
+
     def __init__(self, parent, **kwargs):
 
         super(AddModifyChemicalTableFrame, self).__init__(parent, **kwargs)
@@ -246,7 +265,8 @@ class AddModifyChemicalTableFrame(AddModifyDBBaseFrame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_chemical_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_chemical_record(session, sel_row.id, commit=False)
         self.show_all()
 
     def onShowAllRecords(self, event):
@@ -271,6 +291,8 @@ class AddModifyChemicalTableFrame(AddModifyDBBaseFrame):
 
 class AddModifyComponentTableFrame(AddModifyDBBaseFrame):
 
+    search_table = "components"
+
     def __init__(self, parent, **kwargs):
 
         super(AddModifyComponentTableFrame, self).__init__(parent, **kwargs)
@@ -314,16 +336,10 @@ class AddModifyComponentTableFrame(AddModifyDBBaseFrame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_component_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_component_record(session, sel_row.id, commit=False)
         self.show_all()
 
-    def onSearch(self, event):
-        """
-        Searches database based on the user's filter choice and keyword
-        """
-
-        pass
-
     def onShowAllRecords(self, event):
         '''Updates the record list to show all of them'''
 
@@ -368,7 +384,8 @@ class AddModifyCategoryTableFrame(AddModifyDBBaseFrame):
         if dlg.ShowModal() == wx.ID_OK:
             category = dlg.GetValue()
             if category != "":
-                ctrl.add_category_record(db.session, category)
+                with db.session_scope() as session:
+                    ctrl.add_category_record(session, category, commit=False)
             else:
                 ed = wx.MessageDialog(None, "Nothing entered",
                                       "", wx.OK | wx.ICON_INFORMATION)
@@ -393,7 +410,9 @@ class AddModifyCategoryTableFrame(AddModifyDBBaseFrame):
         if dlg.ShowModal() == wx.ID_OK:
             category = dlg.GetValue()
             if category != "":
-                ctrl.modify_category_record(db.session, sel_row.id, category)
+                with db.session_scope() as session:
+                    ctrl.modify_category_record(session, sel_row.id, category,
+                                                commit=False)
             else:
                 ed = wx.MessageDialog(None, "Nothing entered",
                                       "", wx.OK | wx.ICON_INFORMATION)
@@ -410,7 +429,8 @@ class AddModifyCategoryTableFrame(AddModifyDBBaseFrame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_category_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_category_record(session, sel_row.id, commit=False)
         self.show_all()
 
     def onShowAllRecords(self, event):
@@ -456,7 +476,8 @@ class AddModifyReactionTableFrame(AddModifyDBBaseFrame):
         if dlg.ShowModal() == wx.ID_OK:
             reaction = dlg.GetValue()
             if reaction != "":
-                ctrl.add_reaction_record(db.session, reaction)
+                with db.session_scope() as session:
+                    ctrl.add_reaction_record(session, reaction, commit=False)
             else:
                 ed = wx.MessageDialog(None, "Nothing entered",
                                       "", wx.OK | wx.ICON_INFORMATION)
@@ -481,7 +502,9 @@ class AddModifyReactionTableFrame(AddModifyDBBaseFrame):
         if dlg.ShowModal() == wx.ID_OK:
             reaction = dlg.GetValue()
             if reaction != "":
-                ctrl.modify_reaction_record(db.session, sel_row.id, reaction)
+                with db.session_scope() as session:
+                    ctrl.modify_reaction_record(session, sel_row.id, reaction,
+                                                commit=False)
             else:
                 ed = wx.MessageDialog(None, "Nothing entered",
                                       "", wx.OK | wx.ICON_INFORMATION)
@@ -498,7 +521,8 @@ class AddModifyReactionTableFrame(AddModifyDBBaseFrame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_reaction_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_reaction_record(session, sel_row.id, commit=False)
         self.show_all()
 
     def onShowAllRecords(self, event):
@@ -565,13 +589,20 @@ class ShowSynthesesFrame(wx.Frame):
 
         self.model = BatchCalculator()
 
+        # the records are fetched in pages when the list is scrolled
+        self.pages = None
+        self.sort = "id"
+        self.descending = False
+
         mainSizer = wx.BoxSizer(wx.VERTICAL)
         btnSizer = wx.BoxSizer(wx.HORIZONTAL)
 
-        self.olv = ObjectListView(self, style=wx.LC_REPORT | wx.SUNKEN_BORDER)
+        self.olv = VirtualObjectListView(self, style=wx.LC_REPORT | wx.SUNKEN_BORDER)
         self.olv.evenRowsBackColor = "#DCF0C7"
         self.olv.oddRowsBackColor = "#FFFFFF"
         self.olv.SetEmptyListMsg("No Records Found")
+        self.olv.SetObjectGetter(self.get_synthesis)
+        self.olv.Bind(wx.EVT_LIST_COL_CLICK, self.OnColumnClick)
 
         # create the button row
 
@@ -591,6 +622,10 @@ class ShowSynthesesFrame(wx.Frame):
         exportRecordBtn.Bind(wx.EVT_BUTTON, self.onExportRecord)
         btnSizer.Add(exportRecordBtn, 0, wx.ALL, 5)
 
+        bulkExportBtn = wx.Button(self, label="Export Many")
+        bulkExportBtn.Bind(wx.EVT_BUTTON, self.onBulkExport)
+        btnSizer.Add(bulkExportBtn, 0, wx.ALL, 5)
+
         cancelBtn = wx.Button(self, label="Cancel")
         cancelBtn.Bind(wx.EVT_BUTTON, self.OnCloseFrame)
         self.Bind(wx.EVT_CLOSE, self.OnCloseFrame)
@@ -660,7 +695,7 @@ class ShowSynthesesFrame(wx.Frame):
             flags['cryst'] = sel_row.crystallization_time
             path = self.OnSavePdf()
             try:
-                create_pdf(path, db.session, self.model, flags)
+                create_pdf(path, self.model, flags)
             except:
                 dlg = wx.MessageDialog(None, "An error occured while generating pdf",
                                        "", wx.OK | wx.ICON_ERROR)
@@ -673,6 +708,90 @@ class ShowSynthesesFrame(wx.Frame):
                 dlg.ShowModal()
                 dlg.Destroy()
 
+    def onBulkExport(self, event):
+        '''
+        Export the pdf reports of the selected records, or of all the records
+        if none is selected, into a directory. The reports are rendered in
+        parallel in worker processes, started with "spawn" so that the GUI
+        process is not forked, driven by a background thread.
+        '''
+
+        db = ctrl.DB()
+
+        syntheses = self.olv.GetSelectedObjects()
+        if len(syntheses) == 0:
+            syntheses = select_syntheses(db)
+        if len(syntheses) == 0:
+            dialogs.show_message_dlg("No records to export", "Error")
+            return
+
+        dlg = dialogs.ExportPdfDialog(parent=self, id=-1)
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        options = dlg.get_data()
+        dlg.Destroy()
+
+        dlg = wx.DirDialog(self, message="Choose the output directory",
+                           defaultPath=os.getcwd())
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        directory = dlg.GetPath()
+        dlg.Destroy()
+
+        # the session is used only here, the thread gets detached copies
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        report = ExportReport()
+        jobs, report.errors = export_jobs(db.session, syntheses, directory,
+                                          options)
+        jobs = [detached_job(job) for job in jobs]
+
+        progress = wx.ProgressDialog("Exporting", "Exporting the reports ...",
+                                     maximum=len(syntheses), parent=self,
+                                     style=wx.PD_APP_MODAL | wx.PD_CAN_ABORT |
+                                     wx.PD_ELAPSED_TIME | wx.PD_REMAINING_TIME)
+        cancel = threading.Event()
+
+        def update(done, total):
+            if cancel.is_set():
+                return
+            result = progress.Update(done, "{0:d} of {1:d}".format(done, total))
+            # a tuple (continue, skip) in the newer versions of wxPython
+            if isinstance(result, tuple):
+                result = result[0]
+            if not result:
+                cancel.set()
+
+        def callback(done, total):
+            wx.CallAfter(update, done, total)
+            return not cancel.is_set()
+
+        def finish(report, error):
+            progress.Destroy()
+            if error is not None:
+                dialogs.show_message_dlg(error, "Export failed")
+            elif len(report.errors) > 0:
+                dialogs.show_message_dlg(str(report),
+                                         "Export finished with errors")
+            else:
+                dialogs.show_message_dlg(str(report), "Export finished",
+                                         flag=wx.OK | wx.ICON_INFORMATION)
+
+        def export():
+            try:
+                render_jobs(jobs, report, len(syntheses), callback=callback,
+                            start_method="spawn")
+            except Exception:
+                wx.CallAfter(finish, report, traceback.format_exc())
+            else:
+                wx.CallAfter(finish, report, None)
+
+        thread = threading.Thread(target=export)
+        thread.daemon = True
+        thread.start()
+
     def OnSavePdf(self):
         '''
         Open the file dialog to choose the name of the pdf file.
@@ -702,7 +821,8 @@ class ShowSynthesesFrame(wx.Frame):
         if sel_row is None:
             dialogs.show_message_dlg("No row selected", "Error")
             return
-        ctrl.delete_synthesis_record(db.session, sel_row.id)
+        with db.session_scope() as session:
+            ctrl.delete_synthesis_record(session, sel_row.id, commit=False)
         self.show_all()
 
     def onLoadRecord(self, event):
@@ -733,19 +853,42 @@ class ShowSynthesesFrame(wx.Frame):
 
         self.Destroy()
 
-    def set_olv(self, syntheses):
-        '''Put current Synthesis objects in the OLV'''
+    def get_synthesis(self, index):
+        '''Return the Synthesis object in the row `index` of the OLV'''
+
+        return self.pages[index]
+
+    def OnColumnClick(self, event):
+        '''
+        Sort the records on the clicked column if it is indexed, clicking
+        the same column again reverses the order.
+        '''
+
+        attr = COLUMNS[self.cols[event.GetColumn()]]["valueGetter"]
+        if attr not in SYNTHESIS_SORT_KEYS:
+            return
+        if attr == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort = attr
+            self.descending = False
+        self.show_all()
+
+    def set_olv(self, pages):
+        '''Show the Synthesis objects from `pages` in the OLV'''
 
+        self.pages = pages
         olv_cols = get_columns(self.cols)
         self.olv.SetColumns(olv_cols)
-        self.olv.SetObjects(syntheses)
+        self.olv.SetItemCount(len(pages))
+        self.olv.RepopulateList()
 
     def show_all(self):
-        '''Get all synthesis records and put them in the OLV'''
+        '''Show all synthesis records in the OLV, fetched page by page'''
 
         db = ctrl.DB()
-        syntheses = db.get_syntheses()
-        self.set_olv(syntheses)
+        pages = SynthesisPages(db, sort=self.sort, descending=self.descending)
+        self.set_olv(pages)
 
 
 class CustomDataTable(gridlib.PyGridTableBase):
@@ -1406,7 +1549,10 @@ class InverseBatch(wx.Frame):
 
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
-            db.switch_session(path)
+            try:
+                db.switch_session(path)
+            except (SnapshotConflictError, sqlite3.Error) as e:
+                dialogs.show_message_dlg(str(e), "Error")
         dlg.Destroy()
 
     def OnExit(self, event):
@@ -1664,14 +1810,21 @@ class MainFrame(wx.Frame):
 
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
-            db.switch_session(path)
-            self.model = BatchCalculator()
-            self.update_all_objectlistviews()
+            try:
+                db.switch_session(path)
+            except (SnapshotConflictError, sqlite3.Error) as e:
+                dialogs.show_message_dlg(str(e), "Error")
+            else:
+                self.model = BatchCalculator()
+                self.update_all_objectlistviews()
         dlg.Destroy()
 
     def OnExit(self, event):
         db = ctrl.DB()
-        db.session.close()
+        try:
+            db.close()
+        except (SnapshotConflictError, sqlite3.Error) as e:
+            dialogs.show_message_dlg(str(e), "Error")
         self.Close()
 
     def OnExportTex(self, event):
@@ -1688,8 +1841,10 @@ class MainFrame(wx.Frame):
         if result == wx.ID_OK:
             flags = etexdialog.get_data()
             # get the string with contents of the TeX report
-            tex = get_report_as_string(flags, self.model)
-            self.OnSaveTeX(tex, flags['typeset'], flags['pdflatex'])
+            tex = get_report_as_string(flags, self.model,
+                                       template=flags['template'])
+            self.OnSaveTeX(tex, flags['typeset'], flags['pdflatex'],
+                           volatile=[flags['date']])
 
     def OnExportPdf(self, event):
         '''
@@ -1759,15 +1914,13 @@ class MainFrame(wx.Frame):
 
         if dlg.ShowModal() == wx.ID_OK:
             path = dlg.GetPath()
-            if os.path.exists(path):
-                os.remove(path)
-
             db = ctrl.DB()
-            db.switch_session(path)
+            db.create_database(path)
             # fill the tables
-            ctrl.fill_kinds_table(db.session)
-            ctrl.fill_physical_forms_table(db.session)
-            ctrl.fill_electrolytes_table(db.session)
+            with db.transaction() as session:
+                ctrl.fill_kinds_table(session, commit=False)
+                ctrl.fill_physical_forms_table(session, commit=False)
+                ctrl.fill_electrolytes_table(session, commit=False)
             dlg = wx.MessageDialog(None, "Successfully created new database",
                                    "", wx.OK | wx.ICON_INFORMATION)
             dlg.ShowModal()
@@ -1795,23 +1948,22 @@ class MainFrame(wx.Frame):
             # This returns a Python list of files that were selected.
             path = dlg.GetPath()
 
-            # open the file and read the actual data
-            fp = open(path, 'rb')
-            (self.model.components, self.model.chemicals,
-             self.model.A, self.model.B, self.model.X,
-             self.model.scale_all, self.model.sample_scale,
-             self.model.sample_size, self.model.selections) = pickle.load(fp)
-
-            fp.close()
-
-            self.update_all_objectlistviews()
+            # open the file and read the actual data, files saved by the
+            # older versions are pickles and are converted on the fly
+            try:
+                zbcfile.load(path).load_into(self.model, ctrl.DB().session)
+            except (ValueError, IOError, KeyError) as err:
+                dialogs.show_message_dlg("Cannot open {0:s}:\n{1:s}".format(
+                    path, str(err)), "Error")
+            else:
+                self.update_all_objectlistviews()
 
         dlg.Destroy()
 
     def OnSave(self, event):
         '''
         Open the save file dialog and save the model data to
-        a file as a pickle.
+        a .zbc file.
         '''
 
         wildcard = "ZBC Files (*.zbc)|*.zbc|"     \
@@ -1833,14 +1985,7 @@ class MainFrame(wx.Frame):
             if not os.path.splitext(path)[1] == '.zbc':
                 path += '.zbc'
 
-            data = (self.model.components,
-                    self.model.chemicals,
-                    self.model.A, self.model.B, self.model.X,
-                    self.model.scale_all, self.model.sample_scale,
-                    self.model.sample_size, self.model.selections)
-            fp = file(path, 'wb')  # Create file anew
-            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
-            fp.close()
+            zbcfile.save(path, self.model)
 
         dlg.Destroy()
 
@@ -1881,13 +2026,16 @@ class MainFrame(wx.Frame):
         else:
             return
 
-    def OnSaveTeX(self, texdata, typeset, pdflatex):
+    def OnSaveTeX(self, texdata, typeset, pdflatex, volatile=()):
+        '''
+        Save the TeX report and typeset it in the background if `typeset` is
+        True, the `volatile` parts of the report (its date) are not compared
+        when a cached pdf is looked up.
+        '''
 
         texwildcard = "TeX Files (*.tex)|*tex|"     \
                       "All files (*.*)|*.*"
 
-        opts = "-halt-on-error"
-
         dlg = wx.FileDialog(self, message="Save file as ...",
                             defaultDir=os.getcwd(), defaultFile="",
                             wildcard=texwildcard,
@@ -1898,35 +2046,43 @@ class MainFrame(wx.Frame):
             if not os.path.splitext(path)[1] == '.tex':
                 path += '.tex'
 
-            fp = file(path, 'w')  # Create file anew
-            fp.write(texdata)
-            fp.close()
+            with io.open(path, 'w', encoding='utf-8') as fp:
+                fp.write(texdata)
 
             if typeset:
-                if pdflatex is not None:
-                    os.chdir(os.path.split(path)[0])
-                    retcode = subprocess.call([pdflatex, opts, path], )
-                    if retcode != 0:
-                        dlg = wx.MessageDialog(None,
-                                               "There were problems generating the pdf, check the log file {l:s}, return code: {r:d}".format(l=path.replace(".tex", ".log"), r=retcode),
-                                               "", wx.OK | wx.ICON_WARNING)
-                        dlg.ShowModal()
-                        dlg.Destroy()
-                    else:
-                        # run again and clean the auxiliary files
-                        retcode = subprocess.call([pdflatex, opts, path])
-                        clean_tex(path)
-                        dlg = wx.MessageDialog(None,
-                                              "PDF generated successfully",
-                                               "", wx.OK | wx.ICON_INFORMATION)
-                        dlg.ShowModal()
-                        dlg.Destroy()
+                if pdflatex:
+                    thread = threading.Thread(target=self.typeset_tex,
+                                              args=(texdata, path, pdflatex,
+                                                    volatile))
+                    thread.daemon = True
+                    thread.start()
                 else:
-                    dlg = wx.MessageDialog(None,
-                                           "pdflatex not found, PDF not generated",
-                                           "", wx.OK | wx.ICON_WARNING)
-                    dlg.ShowModal()
-                    dlg.Destroy()
+                    dialogs.show_message_dlg("pdflatex not found, PDF not "
+                                             "generated", "",
+                                             wx.OK | wx.ICON_WARNING)
+
+        dlg.Destroy()
+
+    def typeset_tex(self, texdata, path, pdflatex, volatile=()):
+        '''
+        Typeset the TeX report saved at `path` into a pdf next to it, run in a
+        background thread. An unchanged report is taken from the cache.
+        '''
+
+        base = os.path.splitext(path)[0]
+        try:
+            get_pdf(texdata, output=base + ".pdf", pdflatex=pdflatex,
+                    volatile=volatile)
+        except TypesetError as err:
+            with io.open(base + ".log", "w", encoding="utf-8") as fp:
+                fp.write(err.log)
+            message = "There were problems generating the pdf, check the " \
+                      "log file {0:s}: {1}".format(base + ".log", err)
+            wx.CallAfter(dialogs.show_message_dlg, message, "",
+                         wx.OK | wx.ICON_WARNING)
+        else:
+            wx.CallAfter(dialogs.show_message_dlg, "PDF generated successfully",
+                         "", wx.OK | wx.ICON_INFORMATION)
 
     def OnShowB(self, event):
 
@@ -1991,7 +2147,24 @@ class ZeoGui(wx.App):
         return True
 
 
-def main():
+def main(argv=None):
+
+    # the worker processes of the bulk export start the frozen executable
+    # again, they have to run the worker code instead of the GUI
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(prog="zbc",
+                                     description="Zeolite Batch Calculator")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="keep a copy of the database in memory and "
+                             "write the changes through to the file")
+    parser.add_argument("--wal", action="store_true",
+                        help="use the WAL journal mode for a database on a "
+                             "local disk")
+    args = parser.parse_args(argv)
+
+    # the first instance of the singleton decides the mode
+    ctrl.DB(snapshot=args.snapshot, wal=args.wal)
 
     app = ZeoGui(False)
 
@@ -0,0 +1,293 @@
+# zbcfile.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Reading and writing of the calculation (.zbc) files.
+
+A .zbc file is a zip archive with two members:
+
+    header.json : format version, ids, labels, moles and masses of the
+                  selected components and chemicals, the scaling settings
+                  and the ids of the chemicals selected for the sample
+    arrays.npz  : the A, B and X matrices of the calculation
+
+Opening a file only parses the header, the matrices are read on first
+access and the ORM objects are queried from the database only when they are
+asked for. Files written by the older versions, which pickled the model
+objects, are still read and converted to the same representation.
+'''
+
+import io
+import json
+import pickle
+import zipfile
+
+import numpy as np
+
+from batchcalc.model import Chemical, Component
+
+__version__ = "0.3.1"
+
+
+FORMAT_VERSION = 1
+
+HEADER = "header.json"
+ARRAYS = "arrays.npz"
+MATRICES = ("A", "B", "X")
+
+
+def _item(obj, **values):
+    '''Header entry with the id and labels of a chemical or component.'''
+
+    entry = {"id": obj.id, "name": obj.name, "formula": obj.formula,
+             "short_name": obj.short_name}
+    entry.update(values)
+    return entry
+
+
+def make_header(model):
+    '''
+    Build the header of a .zbc file from the state of the `model`.
+
+    Args:
+        model : BatchCalculator
+
+    Returns:
+        dict that can be serialized to JSON
+    '''
+
+    return {
+        "format": "zbc",
+        "version": FORMAT_VERSION,
+        "components": [_item(z, moles=float(z.moles))
+                       for z in model.components],
+        "chemicals": [_item(c, mass=float(c.mass)) for c in model.chemicals],
+        "scale_all": float(model.scale_all),
+        "sample_scale": float(model.sample_scale),
+        "sample_size": float(model.sample_size),
+        "selections": [c.id for c in model.selections],
+    }
+
+
+def save(path, model):
+    '''
+    Write the state of the `model` to a .zbc file.
+
+    Args:
+        path : str
+            Path of the file
+        model : BatchCalculator
+            Calculator with the chemicals and components selected
+    '''
+
+    header = json.dumps(make_header(model), indent=1, sort_keys=True)
+
+    buff = io.BytesIO()
+    np.savez(buff, **dict((name, np.asarray(getattr(model, name)))
+                          for name in MATRICES))
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(HEADER, header.encode("utf-8"))
+        # the matrices are small and compressed already by the zip
+        archive.writestr(ARRAYS, buff.getvalue())
+
+
+def _load_pickle(path):
+    '''
+    Read a file written with pickle by the older versions and return the
+    header and the matrices, ValueError is raised if it cannot be read.
+    '''
+
+    try:
+        with open(path, "rb") as fobj:
+            # numpy arrays pickled under python 2
+            data = pickle.load(fobj, encoding="latin1")
+
+        (components, chemicals, A, B, X, scale_all, sample_scale, sample_size,
+         selections) = data
+
+        header = {
+            "format": "zbc",
+            "version": 0,
+            "components": [_item(z, moles=float(getattr(z, "moles", 1.0)))
+                           for z in components],
+            "chemicals": [_item(c, mass=float(getattr(c, "mass", 0.0)))
+                          for c in chemicals],
+            "scale_all": float(scale_all),
+            "sample_scale": float(sample_scale),
+            "sample_size": float(sample_size),
+            "selections": [c.id for c in selections],
+        }
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+            IndexError, KeyError, TypeError, ValueError, OverflowError) as e:
+        # random or truncated data, or objects of unknown classes
+        raise ValueError("cannot read {0:s}: {1}".format(path, e))
+    return header, {"A": A, "B": B, "X": X}
+
+
+def read_header(path):
+    '''
+    Return the header of the .zbc archive at `path`, nothing else is read.
+    ValueError is raised if the file is not an archive of a supported
+    version, legacy pickles are never loaded.
+    '''
+
+    if not zipfile.is_zipfile(path):
+        raise ValueError("not a zbc archive: {0:s}".format(path))
+    try:
+        with zipfile.ZipFile(path) as archive:
+            header = json.loads(archive.read(HEADER).decode("utf-8"))
+    except (zipfile.BadZipfile, KeyError) as e:
+        raise ValueError("cannot read {0:s}: {1}".format(path, e))
+    if not isinstance(header, dict) or header.get("format") != "zbc":
+        raise ValueError("not a zbc file: {0:s}".format(path))
+    if header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError("{0:s} was written by a newer version, "
+                         "format version {1:d} is not supported".format(
+                             path, header["version"]))
+    return header
+
+
+class ZbcFile(object):
+    '''
+    Lazily loaded .zbc file.
+
+    Args:
+        path : str
+            Path of the file, either a .zbc archive or a legacy pickle
+
+    Attributes:
+        header : dict
+            Parsed header, see `make_header`
+        legacy : bool
+            True if the file was written with pickle
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        self._arrays = None
+
+        if zipfile.is_zipfile(path):
+            self.legacy = False
+            self.header = read_header(path)
+        else:
+            self.legacy = True
+            self.header, self._arrays = _load_pickle(path)
+
+    @property
+    def component_ids(self):
+        return [z["id"] for z in self.header["components"]]
+
+    @property
+    def chemical_ids(self):
+        return [c["id"] for c in self.header["chemicals"]]
+
+    @property
+    def moles(self):
+        return np.array([z["moles"] for z in self.header["components"]])
+
+    @property
+    def masses(self):
+        return np.array([c["mass"] for c in self.header["chemicals"]])
+
+    @property
+    def arrays(self):
+        '''Dictionary with the A, B and X matrices, read on first access.'''
+
+        if self._arrays is None:
+            with zipfile.ZipFile(self.path) as archive:
+                npz = np.load(io.BytesIO(archive.read(ARRAYS)))
+                self._arrays = dict((name, npz[name]) for name in MATRICES)
+        return self._arrays
+
+    def components(self, session):
+        '''
+        Return the components from the database in the stored order with
+        the stored number of moles set.
+        '''
+
+        objs = _fetch(session, Component, self.component_ids)
+        for obj, entry in zip(objs, self.header["components"]):
+            obj.moles = entry["moles"]
+        return objs
+
+    def chemicals(self, session):
+        '''
+        Return the chemicals from the database in the stored order with the
+        stored masses set.
+        '''
+
+        objs = _fetch(session, Chemical, self.chemical_ids)
+        for obj, entry in zip(objs, self.header["chemicals"]):
+            obj.mass = entry["mass"]
+        return objs
+
+    def load_into(self, model, session):
+        '''
+        Set the state of the `model` from the file, the components and
+        chemicals are queried from the database bound to `session`.
+        '''
+
+        model.components = self.components(session)
+        model.chemicals = self.chemicals(session)
+        for name in MATRICES:
+            setattr(model, name, self.arrays[name])
+        model.scale_all = self.header["scale_all"]
+        model.sample_scale = self.header["sample_scale"]
+        model.sample_size = self.header["sample_size"]
+        selected = set(self.header["selections"])
+        model.selections = [c for c in model.chemicals if c.id in selected]
+
+
+def _fetch(session, cls, ids):
+    '''
+    Query the records of `cls` with `ids` in one statement and return them in
+    the order of `ids`.
+    '''
+
+    if len(ids) == 0:
+        return []
+
+    found = dict((obj.id, obj) for obj in
+                 session.query(cls).filter(cls.id.in_(ids)))
+    missing = [i for i in ids if i not in found]
+    if len(missing) > 0:
+        raise ValueError("{0:s} with ids {1} not found in the database".format(
+                         cls.__tablename__, missing))
+    return [found[i] for i in ids]
+
+
+def load(path):
+    '''Open a .zbc file, see `ZbcFile`.'''
+
+    return ZbcFile(path)
@@ -0,0 +1,335 @@
+# zbcindex.py
+#
+# -*- coding: utf-8 -*-
+#
+#    Zeolite Batch Calculator
+#
+# A program for calculating the correct amount of reagents (batch) for a
+# particular zeolite composition given by the molar ratio of its components.
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Lukasz Mentel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Catalogue of the .zbc calculation files found in a directory tree.
+
+The catalogue is a small SQLite database with one row per file and the
+components (with moles) and chemicals (with masses) of every calculation,
+taken from the file headers. Only the headers of the .zbc archives are
+read, the legacy pickled files are listed as such but never loaded, since
+unpickling a file can run arbitrary code. Scans are incremental, a file is
+read again only when its modification time or size changed, and the files
+that disappeared are dropped. Queries select the files by the chemicals they use
+and by the molar ratios of the components, e.g. all the files using TMAOH
+with SiO2/Al2O3 > 20::
+
+    >>> catalogue = Catalogue("zbcindex.db")
+    >>> catalogue.scan("/shared/calculations")
+    >>> catalogue.query(chemicals=["TMAOH"], ratios=["SiO2/Al2O3>20"])
+'''
+
+import os
+import re
+import sqlite3
+import zipfile
+
+from batchcalc.zbcfile import read_header
+
+__version__ = "0.3.1"
+
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS files ("
+    "id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, mtime REAL NOT NULL, "
+    "size INTEGER NOT NULL, status TEXT NOT NULL, version INTEGER, "
+    "error TEXT)",
+    "CREATE TABLE IF NOT EXISTS file_components ("
+    "file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE, "
+    "position INTEGER NOT NULL, component_id INTEGER, name TEXT, "
+    "formula TEXT, short_name TEXT, moles REAL)",
+    "CREATE TABLE IF NOT EXISTS file_chemicals ("
+    "file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE, "
+    "position INTEGER NOT NULL, chemical_id INTEGER, name TEXT, "
+    "formula TEXT, short_name TEXT, mass REAL)",
+    "CREATE INDEX IF NOT EXISTS ix_file_components_file_id "
+    "ON file_components (file_id, formula)",
+    "CREATE INDEX IF NOT EXISTS ix_file_chemicals_file_id "
+    "ON file_chemicals (file_id)",
+    "CREATE INDEX IF NOT EXISTS ix_file_chemicals_chemical_id "
+    "ON file_chemicals (chemical_id)",
+    "CREATE INDEX IF NOT EXISTS ix_file_chemicals_name "
+    "ON file_chemicals (name)",
+    "CREATE INDEX IF NOT EXISTS ix_file_chemicals_short_name "
+    "ON file_chemicals (short_name)",
+]
+
+# status of the files in the catalogue
+INDEXED = "indexed"
+LEGACY = "legacy"
+UNREADABLE = "unreadable"
+
+OPERATORS = ["<=", ">=", "!=", "<", ">", "="]
+
+_RATIO = re.compile(r"^\s*([^/<>=!\s]+)\s*/\s*([^/<>=!\s]+)\s*"
+                    r"(<=|>=|!=|<|>|=)\s*([-+0-9.eE]+)\s*$")
+
+
+def parse_ratio(string):
+    '''
+    Parse a condition on a molar ratio of two components, e.g.
+    "SiO2/Al2O3>20", the components are given by formula, short name or name.
+
+    Returns:
+        (numerator, denominator, operator, value) tuple
+    '''
+
+    match = _RATIO.match(string)
+    if match is None:
+        raise ValueError("wrong ratio condition: {0:s}, expected e.g. "
+                         "SiO2/Al2O3>20".format(string))
+    num, den, op, value = match.groups()
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError("wrong value in: {0:s}".format(string))
+    return num, den, op, value
+
+
+class ScanReport(object):
+    '''
+    Result of a scan.
+
+    Attributes
+    ----------
+    added : int
+        Number of the new files
+    updated : int
+        Number of the files read again since they changed
+    removed : int
+        Number of the files dropped from the catalogue
+    unchanged : int
+        Number of the files skipped
+    legacy : list
+        Paths of the new or changed legacy pickled files, not indexed
+    errors : list
+        (path, message) tuples for the files that could not be read
+    '''
+
+    def __init__(self):
+
+        self.added = 0
+        self.updated = 0
+        self.removed = 0
+        self.unchanged = 0
+        self.legacy = []
+        self.errors = []
+
+    def __str__(self):
+
+        lines = ["{0:d} added, {1:d} updated, {2:d} removed, {3:d} unchanged, "
+                 "{4:d} legacy (not indexed), {5:d} unreadable".format(
+                     self.added, self.updated, self.removed, self.unchanged,
+                     len(self.legacy), len(self.errors))]
+        for path, message in self.errors:
+            lines.append("  {0:s}: {1:s}".format(path, message))
+        return "\n".join(lines)
+
+
+def find_files(root, extension=".zbc"):
+    '''Iterate over the paths of the files with `extension` under `root`.'''
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(extension):
+                yield os.path.join(dirpath, name)
+
+
+class Catalogue(object):
+    '''
+    Catalogue of .zbc files stored in the SQLite database at `path`, which
+    is created if needed.
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+
+    def close(self):
+
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+
+        return self.conn.execute("SELECT count(*) FROM files").fetchone()[0]
+
+    def scan(self, root):
+        '''
+        Bring the catalogue up to date with the .zbc files under `root`. Only
+        the new and modified files (by modification time and size) are read,
+        the entries of the files under `root` that no longer exist are
+        removed. Everything is written in a single transaction.
+
+        Returns:
+            ScanReport
+        '''
+
+        root = os.path.abspath(root)
+        prefix = os.path.join(root, "")
+        report = ScanReport()
+
+        known = dict((path, (fid, mtime, size)) for fid, path, mtime, size in
+                     self.conn.execute(
+                         "SELECT id, path, mtime, size FROM files "
+                         "WHERE substr(path, 1, ?) = ?",
+                         (len(prefix), prefix)))
+
+        with self.conn:
+            for path in find_files(root):
+                try:
+                    stat = os.stat(path)
+                except OSError as err:
+                    report.errors.append((path, str(err)))
+                    continue
+
+                entry = known.pop(path, None)
+                if entry is not None:
+                    if entry[1:] == (stat.st_mtime, stat.st_size):
+                        report.unchanged += 1
+                        continue
+                    self.conn.execute("DELETE FROM files WHERE id = ?",
+                                      (entry[0],))
+                    report.updated += 1
+                else:
+                    report.added += 1
+
+                status, error = self._add(path, stat)
+                if status == LEGACY:
+                    report.legacy.append(path)
+                elif status == UNREADABLE:
+                    report.errors.append((path, error))
+
+            for fid, mtime, size in known.values():
+                self.conn.execute("DELETE FROM files WHERE id = ?", (fid,))
+                report.removed += 1
+
+        return report
+
+    def _add(self, path, stat):
+        '''
+        Read the header of the file and insert it into the catalogue. Legacy
+        pickled files are inserted as `LEGACY` without reading them and an
+        unreadable file is kept as `UNREADABLE` with the error message, so
+        that neither is read again until it changes.
+
+        Returns:
+            (status, error message or None) tuple
+        '''
+
+        try:
+            if not zipfile.is_zipfile(path):
+                self._insert(path, stat, LEGACY)
+                return LEGACY, None
+            header = read_header(path)
+            components = [(i, z["id"], z["name"], z["formula"],
+                           z["short_name"], z["moles"])
+                          for i, z in enumerate(header["components"])]
+            chemicals = [(i, c["id"], c["name"], c["formula"],
+                          c["short_name"], c["mass"])
+                         for i, c in enumerate(header["chemicals"])]
+        except (ValueError, KeyError, TypeError, EnvironmentError) as err:
+            error = str(err) or repr(err)
+            self._insert(path, stat, UNREADABLE, error=error)
+            return UNREADABLE, error
+
+        fid = self._insert(path, stat, INDEXED, version=header.get("version"))
+        self.conn.executemany(
+            "INSERT INTO file_components (file_id, position, component_id, "
+            "name, formula, short_name, moles) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(fid,) + row for row in components])
+        self.conn.executemany(
+            "INSERT INTO file_chemicals (file_id, position, chemical_id, "
+            "name, formula, short_name, mass) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(fid,) + row for row in chemicals])
+        return INDEXED, None
+
+    def _insert(self, path, stat, status, version=None, error=None):
+        '''Insert the row of the file and return its id.'''
+
+        return self.conn.execute(
+            "INSERT INTO files (path, mtime, size, status, version, error) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size, status, version,
+             error)).lastrowid
+
+    def query(self, chemicals=None, ratios=None):
+        '''
+        Select the files using all the `chemicals` and satisfying all the
+        `ratios` conditions.
+
+        Args:
+            chemicals : list of str
+                Chemicals given by id, name, short name or formula
+            ratios : list
+                Conditions on molar ratios, either strings like
+                "SiO2/Al2O3>20" or tuples returned by `parse_ratio`
+
+        Returns:
+            list of paths
+        '''
+
+        sql = ["SELECT path FROM files WHERE status = ?"]
+        params = [INDEXED]
+
+        for chemical in chemicals or []:
+            sql.append("AND id IN (SELECT file_id FROM file_chemicals "
+                       "WHERE chemical_id = ? OR name = ? OR short_name = ? "
+                       "OR formula = ?)")
+            params.extend([chemical] * 4)
+
+        moles = ("(SELECT moles FROM file_components WHERE file_id = files.id "
+                 "AND (formula = ? OR short_name = ? OR name = ?))")
+        for ratio in ratios or []:
+            if not isinstance(ratio, tuple):
+                ratio = parse_ratio(ratio)
+            num, den, op, value = ratio
+            if op not in OPERATORS:
+                raise ValueError("wrong operator: {0:s}".format(op))
+            # division by zero and missing components give NULL, which
+            # never satisfies the condition
+            sql.append("AND {0:s} * 1.0 / {0:s} {1:s} ?".format(moles, op))
+            params.extend([num] * 3 + [den] * 3 + [value])
+
+        sql.append("ORDER BY path")
+        return [row[0] for row in self.conn.execute(" ".join(sql), params)]
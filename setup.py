@@ -29,18 +29,26 @@ setup(
     entry_points={
         'console_scripts': [
             'zbc = batchcalc.zbc:main',
+            'zbc-batch = batchcalc.cli:main',
+            'zbc-sweep = batchcalc.cli:sweep_main',
+            'zbc-import = batchcalc.cli:import_main',
+            'zbc-index = batchcalc.cli:index_main',
+            'zbc-export = batchcalc.export:main',
         ],
     },
     include_package_data=True,
+    python_requires='>=3.7',
     install_requires=[
         'numpy>=1.8.1',
-        'sqlalchemy>=0.9.7',
+        'sqlalchemy>=1.4',
         'jinja2>=2.7.3',
         'reportlab',
         'wxpython',
         'objectlistview',
-        'six',
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
     long_description=readme(),
     packages=["batchcalc"],
     classifiers=[
@@ -48,6 +56,7 @@ setup(
         'Environment :: Console',
         'License :: MIT',
         'Operating System :: POSIX :: Linux',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
     ],
 )
@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batchcalc.database import DB, dispose_engine
+
+
+class TempDBTestCase(unittest.TestCase):
+    '''
+    Test case working on a temporary copy of the packaged database, which is
+    the current database of the DB singleton during every test, so that the
+    packaged file is never modified.
+    '''
+
+    def setUp(self):
+        self.db = DB()
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbpath = os.path.join(self.tmpdir, 'zeolite.db')
+        shutil.copy(self.db.dbpath, self.dbpath)
+        self.db.switch_session(self.dbpath)
+        self.session = self.db.session
+
+    def tearDown(self):
+        self.db.close()
+        dispose_engine(self.dbpath)
+        shutil.rmtree(self.tmpdir)
@@ -0,0 +1,174 @@
+import sqlite3
+import unittest
+
+import numpy as np
+
+from batchcalc.calculator import (BatchCalculator, BatchProblem,
+                                  get_source_index, get_weight_fraction_table,
+                                  solve_masses, solve_moles)
+from batchcalc.model import Batch, Chemical, Component
+
+from dbtestcase import TempDBTestCase
+
+
+class TestBatchMatrix(TempDBTestCase):
+
+    def setUp(self):
+        super(TestBatchMatrix, self).setUp()
+        self.bc = BatchCalculator()
+        # Na2O, Al2O3, SiO2, H2O
+        self.bc.components = [self.session.query(Component).get(i)
+                              for i in [1, 3, 4, 5]]
+        # NaOH, sodium aluminate, fumed silica, water
+        self.bc.chemicals = [self.session.query(Chemical).get(i)
+                             for i in [1, 3, 9, 10]]
+
+    def test_B_matrix(self):
+        B = self.bc.get_B_matrix(self.session)
+        self.assertEqual(B.shape, (4, 4))
+        np.testing.assert_allclose(B[0], [0.75929763, 0.0, 0.0, 0.24070237])
+        np.testing.assert_allclose(B[1], [0.37805817, 0.62194183, 0.0, 0.0])
+        np.testing.assert_allclose(B[2:], np.eye(4)[2:])
+
+    def test_B_matrix_edited_concentration(self):
+        B = self.bc.get_B_matrix(self.session)
+        self.bc.chemicals[0].concentration = 0.5
+        Bc = self.bc.get_B_matrix(self.session)
+        self.assertNotAlmostEqual(B[0, 0], Bc[0, 0])
+        self.assertAlmostEqual(Bc[0].sum(), 1.0)
+        np.testing.assert_allclose(B[1:], Bc[1:])
+
+    def test_calculate_masses_many(self):
+        moles = np.array([[1.0, 1.0, 10.0, 100.0],
+                          [2.0, 1.0, 20.0, 200.0],
+                          [3.5, 0.5, 15.0, 150.0]])
+        masses = self.bc.calculate_masses_many(moles, self.session)
+        self.assertEqual(masses.shape, (3, 4))
+        for row, mrow in zip(moles, masses):
+            for comp, m in zip(self.bc.components, row):
+                comp.moles = m
+            self.bc.calculate_masses(self.session)
+            np.testing.assert_allclose([c.mass for c in self.bc.chemicals],
+                                       mrow, atol=1.0e-8)
+
+    def test_calculate_masses_many_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            self.bc.calculate_masses_many(np.ones((2, 3)), self.session)
+
+    def test_calculate_moles_many(self):
+        moles = np.array([[1.0, 1.0, 10.0, 100.0],
+                          [2.0, 1.0, 20.0, 200.0],
+                          [3.5, 0.5, 15.0, 150.0]])
+        masses = self.bc.calculate_masses_many(moles, self.session)
+        before = [c.moles for c in self.bc.components]
+        np.testing.assert_allclose(
+            self.bc.calculate_moles_many(masses, self.session), moles)
+        self.assertEqual([c.moles for c in self.bc.components], before)
+
+        for chem, m in zip(self.bc.chemicals, masses[2]):
+            chem.mass = m
+        self.bc.calculate_moles(self.session)
+        np.testing.assert_allclose([c.moles for c in self.bc.components],
+                                   moles[2])
+
+    def test_check_selection(self):
+        self.bc.check_selection(self.session)
+        silica = self.bc.chemicals.pop(2)
+        with self.assertRaises(ValueError):
+            self.bc.check_selection(self.session)
+        self.bc.chemicals.insert(2, silica)
+
+    def test_get_sources(self):
+        h2o = self.bc.components[3]
+        self.assertEqual([c.id for c in self.bc.get_sources(h2o, self.session)],
+                         [1, 10])
+
+    def test_problem_cache(self):
+        self.bc.calculate_masses(self.session)
+        problem = self.bc._problem
+        self.bc.components[0].moles = 2.0
+        self.bc.calculate_masses(self.session)
+        self.assertIs(self.bc._problem, problem)
+        self.bc.chemicals[0].concentration = 0.9
+        self.bc.calculate_masses(self.session)
+        self.assertIsNot(self.bc._problem, problem)
+
+
+class TestBatchProblem(unittest.TestCase):
+
+    def setUp(self):
+        # 50 % NaOH solution and water for Na2O and H2O
+        self.problem = BatchProblem([1, 2], [1, 2], ["reactant", "mixture"],
+                                    [0.5, 1.0], [61.98, 18.015],
+                                    [[0.75, 0.25], [0.0, 1.0]])
+
+    def test_solve(self):
+        moles = np.array([[1.0, 10.0], [2.0, 5.0]])
+        masses = solve_masses(self.problem, moles)
+        np.testing.assert_allclose(masses[:, 0], moles[:, 0] * 61.98 / 0.75 / 0.5)
+        np.testing.assert_allclose(solve_moles(self.problem, masses), moles)
+
+    def test_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            solve_masses(self.problem, np.ones(3))
+        with self.assertRaises(ValueError):
+            BatchProblem([1], [1, 2], ["mixture"], [1.0], [1.0, 1.0], np.eye(2))
+
+
+class TestWeightFractionTable(TempDBTestCase):
+
+    def test_recalculated_after_commit(self):
+        session = self.db.session
+        table = get_weight_fraction_table(session)
+        self.assertIs(get_weight_fraction_table(session), table)
+        naoh = session.query(Chemical).get(1)
+        naoh.concentration = 0.5
+        session.commit()
+        newtable = get_weight_fraction_table(session)
+        self.assertIsNot(newtable, table)
+        self.assertEqual(newtable.concentrations[1], 0.5)
+
+    def test_source_index_rebuilt_after_commit(self):
+        session = self.db.session
+        index = get_source_index(session)
+        self.assertIs(get_source_index(session), index)
+        self.assertNotIn(21, index.supplies)
+        session.add(Batch(chemical_id=21, component_id=5, coefficient=1.0))
+        session.commit()
+        newindex = get_source_index(session)
+        self.assertIsNot(newindex, index)
+        self.assertIn(21, newindex.sources[5])
+
+    def test_recalculated_after_external_commit(self):
+        session = self.db.session
+        table = get_weight_fraction_table(session)
+        self.assertIs(get_weight_fraction_table(session), table)
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("UPDATE chemicals SET concentration = 0.5 WHERE id = 1")
+        conn.commit()
+        conn.close()
+        newtable = get_weight_fraction_table(session)
+        self.assertIsNot(newtable, table)
+        self.assertEqual(newtable.concentrations[1], 0.5)
+
+    def test_recalculated_after_rollback(self):
+        session = self.db.session
+        session.add(Batch(chemical_id=21, component_id=5, coefficient=1.0))
+        session.flush()
+        self.assertIn(21, get_source_index(session).sources[5])
+        session.rollback()
+        self.assertNotIn(21, get_source_index(session).sources[5])
+
+    def test_missing_concentration(self):
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("UPDATE chemicals SET concentration = NULL WHERE id = 2")
+        conn.commit()
+        conn.close()
+        table = get_weight_fraction_table(self.db.session)
+        self.assertIsInstance(table.errors[2], TypeError)
+        self.assertIn(1, table.chemicals)
+        self.assertNotIn(1, table.errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from batchcalc import cli
+from batchcalc.model import Chemical, Component
+
+from dbtestcase import TempDBTestCase
+
+
+class TestCli(TempDBTestCase):
+
+    def test_find_record(self):
+        self.assertEqual(cli.find_record(self.session, Chemical, "1").id, 1)
+        self.assertEqual(cli.find_record(self.session, Chemical, "fumed silica").id, 9)
+        self.assertEqual(cli.find_record(self.session, Component, "TMAOH").id, 7)
+        self.assertEqual(cli.find_record(self.session, Component, "Al2O3").id, 3)
+
+    def test_find_record_errors(self):
+        with self.assertRaises(ValueError):
+            cli.find_record(self.session, Chemical, "SiO2")
+        with self.assertRaises(ValueError):
+            cli.find_record(self.session, Chemical, "unobtainium")
+
+    def test_run_csv(self):
+        components, rows = cli.read_csv(io.StringIO("Na2O,Al2O3,SiO2,H2O\n"
+                                                    "1,1,10,100\n"
+                                                    "2,1,20,200\n"))
+        output = io.StringIO()
+        count = cli.run(self.session, ["1", "3", "9", "10"], components, rows,
+                        output, chunk_size=1)
+        self.assertEqual(count, 2)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0].split(",")[:4], ["Na2O", "Al2O3", "SiO2", "H2O"])
+        self.assertEqual(len(lines), 3)
+        masses = [float(x) for x in lines[2].split(",")[4:]]
+        self.assertAlmostEqual(masses[1], 163.94022, places=5)
+        self.assertAlmostEqual(masses[2], 1201.686, places=5)
+
+    def test_main_json(self):
+        inp = os.path.join(self.tmpdir, "input.json")
+        out = os.path.join(self.tmpdir, "output.json")
+        with open(inp, "w") as fobj:
+            json.dump({"chemicals": ["NaOH", "sodium aluminate", "fumed silica", "water"],
+                       "compositions": [{"Na2O": 1.0, "Al2O3": 1.0, "SiO2": 10.0, "H2O": 100.0}]},
+                      fobj)
+        cli.main([inp, "-f", "json", "-o", out])
+        with open(out) as fobj:
+            records = [json.loads(line) for line in fobj]
+        self.assertEqual(len(records), 1)
+        self.assertAlmostEqual(records[0]["masses"]["fumed silica"], 600.843, places=5)
+
+    def test_main_missing_input(self):
+        inp = os.path.join(self.tmpdir, "missing.csv")
+        out = os.path.join(self.tmpdir, "output.csv")
+        with self.assertRaises(SystemExit) as ctx:
+            cli.main([inp, "-c", "1,3,9,10", "-o", out])
+        self.assertEqual(ctx.exception.code, 2)
+        self.assertFalse(os.path.exists(out))
+
+    def test_no_gui_imports(self):
+        # checked in a new interpreter, the tests may have imported them
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = ("import sys, batchcalc.cli; print(' '.join(m for m in "
+                "['wx', 'ObjectListView', 'reportlab'] if m in sys.modules))")
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+        self.assertEqual(output.strip(), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,364 @@
+import os
+import shutil
+import sqlite3
+import unittest
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.database import (DB, SnapshotConflictError, SynthesisPages,
+                                assert_max_queries, dispose_engine,
+                                get_engine, get_revision, save_snapshot,
+                                wal_allowed)
+from batchcalc.model import Batch, Chemical, Component, Kind, Synthesis
+
+from dbtestcase import TempDBTestCase
+
+
+class TestEngineRegistry(TempDBTestCase):
+
+    def test_engine_reused(self):
+        self.db.switch_session(self.dbpath)
+        engine = self.db.session.bind
+        self.db.close()
+        self.db.switch_session(self.dbpath)
+        self.assertIs(self.db.session.bind, engine)
+        self.assertIs(get_engine(self.dbpath), engine)
+
+    def test_pragmas(self):
+        self.db.switch_session(self.dbpath)
+        conn = self.db.session.connection()
+        self.assertEqual(conn.exec_driver_sql("PRAGMA journal_mode").scalar(),
+                         "delete")
+        self.assertEqual(conn.exec_driver_sql("PRAGMA temp_store").scalar(), 2)
+        self.assertEqual(conn.exec_driver_sql("PRAGMA synchronous").scalar(), 1)
+
+    def test_wal_opt_in(self):
+        self.db.close()
+        dispose_engine(self.dbpath)
+        engine = get_engine(self.dbpath, wal=True)
+        with engine.connect() as conn:
+            self.assertEqual(
+                conn.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+
+    def test_wal_not_allowed(self):
+        self.assertTrue(wal_allowed(self.dbpath))
+        self.assertFalse(wal_allowed(self.db.dbpath))
+        os.chmod(self.dbpath, 0o444)
+        try:
+            if not os.access(self.dbpath, os.W_OK):
+                self.assertFalse(wal_allowed(self.dbpath))
+        finally:
+            os.chmod(self.dbpath, 0o644)
+
+    def test_dispose(self):
+        engine = get_engine(self.dbpath)
+        dispose_engine(self.dbpath)
+        self.assertIsNot(get_engine(self.dbpath), engine)
+
+    def test_create_database(self):
+        revision = get_revision(self.db.session)
+        self.db.close()
+        self.db.create_database(self.dbpath)
+        self.assertTrue(os.path.exists(self.dbpath))
+        self.assertEqual(self.db.session.query(Kind).count(), 0)
+        self.assertNotEqual(get_revision(self.db.session), revision)
+
+        self.db.session.add(Kind(name="new"))
+        self.db.session.commit()
+        self.db.create_database(self.dbpath)
+        self.assertEqual(self.db.session.query(Kind).count(), 0)
+
+
+class TestTransaction(TempDBTestCase):
+
+    def test_single_commit(self):
+        revision = get_revision(self.db.session)
+        with self.db.transaction() as session:
+            session.add(Kind(name="first"))
+            with self.db.transaction():
+                session.add(Kind(name="second"))
+            session.flush()
+        self.assertEqual(get_revision(self.db.session)[1], revision[1] + 1)
+        self.assertEqual(self.db.session.query(Kind).count(), 5)
+
+    def test_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction() as session:
+                session.add(Kind(name="first"))
+                session.flush()
+                raise RuntimeError("failed")
+        self.assertEqual(self.db.session.query(Kind).count(), 3)
+
+
+class TestGetChemicals(TempDBTestCase):
+
+    def test_sources(self):
+        session = self.db.session
+        comps = [session.query(Component).get(i) for i in [1, 4]]
+        expected = sorted(set(b.chemical_id for b in session.query(Batch).
+                              filter(Batch.component_id.in_([1, 4]))))
+        chemicals = self.db.get_chemicals(components=comps)
+        self.assertEqual([c.id for c in chemicals], expected)
+        self.assertEqual(self.db.get_chemicals(components=comps[::-1]),
+                         chemicals)
+
+    def test_invalidated_after_commit(self):
+        session = self.db.session
+        comps = [session.query(Component).get(1)]
+        chemicals = self.db.get_chemicals(components=comps)
+        self.assertNotIn(21, [c.id for c in chemicals])
+        session.add(Batch(chemical_id=21, component_id=1, coefficient=1.0))
+        session.commit()
+        self.assertIn(21, [c.id for c in self.db.get_chemicals(components=comps)])
+
+
+class TestEagerLoading(TempDBTestCase):
+
+    def tearDown(self):
+        self.db.loading = "joined"
+        super(TestEagerLoading, self).tearDown()
+
+    def test_listings(self):
+        engine = self.db.session.bind
+        with assert_max_queries(engine, 1):
+            for chem in self.db.get_chemicals(showall=True):
+                chem.kind, chem.electrolyte, chem.physical_form
+        with assert_max_queries(engine, 1):
+            for comp in self.db.get_components():
+                comp.category
+        with assert_max_queries(engine, 1):
+            for batch in self.db.get_batches():
+                batch.chemical, batch.component, batch.reaction
+        with assert_max_queries(engine, 3):
+            for synth in self.db.get_syntheses():
+                [c.chemical.name for c in synth.chemicals]
+                [c.component.name for c in synth.components]
+
+    def test_lazy(self):
+        self.db.loading = "lazy"
+        with self.assertRaises(AssertionError):
+            with assert_max_queries(self.db.session.bind, 1):
+                for chem in self.db.get_chemicals(showall=True):
+                    chem.kind
+
+
+class TestSynthesisPages(TempDBTestCase):
+
+    def setUp(self):
+        super(TestSynthesisPages, self).setUp()
+        session = self.db.session
+        for i in range(57):
+            session.add(Synthesis(name=None if i % 7 == 0 else "s{0:d}".format(i % 5),
+                                  temperature=float(i % 3)))
+        session.commit()
+
+    def test_pages(self):
+        session = self.db.session
+        for sort in ["id", "name", "temperature"]:
+            for descending in [False, True]:
+                column = getattr(Synthesis, sort)
+                if descending:
+                    order = [column.desc(), Synthesis.id.desc()]
+                else:
+                    order = [column, Synthesis.id]
+                expected = [s.id for s in session.query(Synthesis).order_by(*order)]
+                pages = SynthesisPages(self.db, page_size=10, sort=sort,
+                                       descending=descending, maxpages=2)
+                self.assertEqual(len(pages), len(expected))
+                self.assertEqual(pages[45].id, expected[45])
+                self.assertEqual([pages[i].id for i in range(len(pages))],
+                                 expected)
+                self.assertLessEqual(len(pages.pages), 2)
+
+    def test_wrong_sort(self):
+        with self.assertRaises(ValueError):
+            self.db.get_syntheses(sort="description")
+
+
+class TestSearch(TempDBTestCase):
+
+    def test_search(self):
+        results = self.db.search("sod")
+        self.assertIn("sodium oxide", [r.name for r in results])
+        self.assertIn("sodium hydroxide", [r.name for r in results])
+        self.assertEqual([r.id for r in self.db.search("1310-73-2")], [1])
+        self.assertEqual([r.name for r in self.db.search("Na2O", tables=["components"])],
+                         ["sodium oxide"])
+        self.assertEqual(self.db.search("  "), [])
+
+    def test_triggers(self):
+        session = self.db.session
+        session.add(Chemical(name="xylitol", formula="C5H12O5", molwt=152.15,
+                             _kind_id=1))
+        session.commit()
+        results = self.db.search("xyli", tables=["chemicals"])
+        self.assertEqual([r.formula for r in results], ["C5H12O5"])
+        results[0].name = "pentitol"
+        session.commit()
+        self.assertEqual(self.db.search("xylitol", tables=["chemicals"]), [])
+        session.delete(results[0])
+        session.commit()
+        self.assertEqual(self.db.search("pentitol", tables=["chemicals"]), [])
+
+    def test_without_index(self):
+        path = os.path.join(self.tmpdir, 'noindex.db')
+        shutil.copy(self.dbpath, path)
+        conn = sqlite3.connect(path)
+        for table in ["chemicals", "components", "synthesis"]:
+            for event in ["insert", "delete", "update"]:
+                conn.execute("DROP TRIGGER {0:s}_fts_{1:s}".format(table,
+                                                                   event))
+            conn.execute("DROP TABLE {0:s}_fts".format(table))
+        conn.commit()
+        conn.close()
+        self.db.switch_session(path)
+        try:
+            with self.db.transaction() as session:
+                session.add(Kind(name="pending"))
+                results = self.db.search("sod", tables=["chemicals"])
+                self.assertIn("sodium hydroxide", [r.name for r in results])
+            self.assertEqual(self.db.session.query(Kind).
+                             filter(Kind.name == "pending").count(), 1)
+        finally:
+            self.db.switch_session(self.dbpath)
+            dispose_engine(path)
+
+
+class TestSnapshot(TempDBTestCase):
+
+    def setUp(self):
+        DB().snapshot = True
+        super(TestSnapshot, self).setUp()
+
+    def tearDown(self):
+        self.db.snapshot = False
+        super(TestSnapshot, self).tearDown()
+
+    def kinds(self):
+        conn = sqlite3.connect(self.dbpath)
+        names = [r[0] for r in conn.execute("SELECT name FROM kinds")]
+        conn.close()
+        return names
+
+    def test_save(self):
+        session = self.db.session
+        self.assertIsNot(session.bind, get_engine(self.dbpath))
+        self.assertEqual(session.query(Kind).count(), 3)
+
+        revision = get_revision(session)
+        session.add(Kind(name="snapshot"))
+        session.flush()
+        self.assertNotIn("snapshot", self.kinds())
+        session.commit()
+        self.assertEqual(get_revision(session)[1], revision[1] + 1)
+        self.assertIn("snapshot", self.kinds())
+        self.assertFalse(self.db.save())
+
+    def test_conflict(self):
+        self.db.session.query(Kind).count()
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("INSERT INTO kinds (name) VALUES ('elsewhere')")
+        conn.commit()
+        conn.close()
+
+        self.db.session.add(Kind(name="snapshot"))
+        with self.assertRaises(SnapshotConflictError):
+            self.db.session.commit()
+        self.assertNotIn("snapshot", self.kinds())
+        with self.assertRaises(SnapshotConflictError):
+            self.db.close()
+
+        self.assertEqual(save_snapshot(self.dbpath, force=True), 1)
+        self.assertEqual(self.kinds().count("snapshot"), 1)
+        self.assertNotIn("elsewhere", self.kinds())
+
+    def test_separate_transactions(self):
+        with self.db.transaction() as session:
+            session.add(Kind(name="pending"))
+            session.flush()
+            with self.assertRaises(RuntimeError):
+                with self.db.session_scope(self.dbpath) as other:
+                    other.query(Chemical).count()
+                    raise RuntimeError("failed")
+        self.assertEqual(self.db.session.query(Kind).
+                         filter(Kind.name == "pending").count(), 1)
+
+
+class TestSessionLifecycle(TempDBTestCase):
+
+    def tearDown(self):
+        self.db.max_identities = 5000
+        super(TestSessionLifecycle, self).tearDown()
+
+    def test_session_scope(self):
+        with self.db.session_scope(self.dbpath) as session:
+            self.assertIsNot(session, self.db.session)
+            session.add(Kind(name="scoped"))
+        self.assertEqual(len(session.identity_map), 0)
+        self.assertEqual(self.db.session.query(Kind).count(), 4)
+
+        with self.assertRaises(RuntimeError):
+            with self.db.session_scope(self.dbpath) as session:
+                session.add(Kind(name="failed"))
+                session.flush()
+                raise RuntimeError("failed")
+        self.assertEqual(self.db.session.query(Kind).count(), 4)
+
+    def test_trim(self):
+        self.db.max_identities = 20
+        chemicals = self.db.get_chemicals(showall=True)
+        stats = self.db.session_stats()
+        self.assertGreater(stats["identities"], 20)
+        self.assertEqual(stats["classes"]["Chemical"], len(chemicals))
+
+        chemicals[0].concentration = 0.5
+        self.db.get_components()
+        stats = self.db.session_stats()
+        self.assertLessEqual(stats["identities"], 20)
+        self.assertEqual(stats["dirty"], 1)
+        self.assertIn(chemicals[0], self.db.session)
+        self.assertNotIn(chemicals[1], self.db.session)
+        # the expunged objects keep their loaded attributes
+        self.assertEqual(chemicals[1].kind, "solution")
+
+    def test_trim_keeps_models(self):
+        model = BatchCalculator()
+        # loaded without the eager options, e.g. from a .zbc file
+        model.chemicals = self.db.session.query(Chemical).\
+            filter(Chemical.id.in_([1, 3])).order_by(Chemical.id).all()
+        self.db.get_chemicals(showall=True)
+        self.assertGreater(self.db.trim(0), 0)
+        self.assertIn(model.chemicals[0], self.db.session)
+        self.assertEqual([c.kind for c in model.chemicals],
+                         ["solution", "reactant"])
+
+    def test_trim_clears_pages(self):
+        session = self.db.session
+        for i in range(30):
+            session.add(Synthesis(name="s{0:d}".format(i)))
+        session.commit()
+        pages = SynthesisPages(self.db, page_size=10)
+        synthesis = pages[25]
+        self.db.max_identities = 20
+        self.db.get_components()
+        self.assertEqual(len(pages.pages), 0)
+        self.assertNotIn(synthesis, session)
+        self.assertIn(pages[25], session)
+        self.assertEqual(pages[25].id, synthesis.id)
+
+    def test_scope_refreshes_session(self):
+        kind = self.db.session.query(Kind).filter(Kind.name == "mixture").one()
+        with self.db.session_scope() as session:
+            session.add(Kind(name="scoped"))
+        scoped = self.db.session.query(Kind).\
+            filter(Kind.name == "scoped").one()
+
+        with self.db.session_scope() as session:
+            session.query(Kind).get(kind.id).name = "renamed"
+            session.delete(session.query(Kind).get(scoped.id))
+        self.assertEqual(kind.name, "renamed")
+        self.assertNotIn(scoped, self.db.session)
+        self.assertEqual(self.db.session.query(Kind).count(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
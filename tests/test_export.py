@@ -0,0 +1,102 @@
+import threading
+import unittest
+
+import numpy as np
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.export import (detached_job, export_jobs, export_pdfs,
+                              parse_ids, render_jobs, report_flags,
+                              select_syntheses)
+
+from dbtestcase import TempDBTestCase
+
+
+class TestExport(TempDBTestCase):
+
+    def test_parse_ids(self):
+        self.assertEqual(parse_ids("5, 1,3-4,3"), [1, 3, 4, 5])
+        with self.assertRaises(ValueError):
+            parse_ids("1,a")
+
+    def test_select_syntheses(self):
+        self.assertEqual([s.id for s in select_syntheses(self.db)], [1])
+        self.assertEqual(select_syntheses(self.db, ids=[2, 3]), [])
+
+    def test_jobs_match_single_calculation(self):
+        synthesis = select_syntheses(self.db, ids=[1])[0]
+        jobs, errors = export_jobs(self.db.session, [synthesis], self.tmpdir,
+                                   {"comment": "bulk"})
+        self.assertEqual(errors, [])
+        sid, path, components, chemicals, moles, masses, B, flags = jobs[0]
+        self.assertEqual(sid, 1)
+        self.assertTrue(path.endswith("synthesis_1.pdf"))
+        self.assertEqual(flags["comment"], "bulk")
+        self.assertEqual(flags["title"], synthesis.name)
+
+        model = BatchCalculator()
+        model.components = [c.component for c in synthesis.components]
+        model.chemicals = [c.chemical for c in synthesis.chemicals]
+        for comp, sc in zip(model.components, synthesis.components):
+            comp.moles = sc.moles
+        model.calculate_masses(self.db.session)
+        np.testing.assert_allclose(masses, [c.mass for c in model.chemicals])
+        np.testing.assert_allclose(B, model.B)
+
+    def test_serial_export_keeps_session_objects(self):
+        synthesis = select_syntheses(self.db, ids=[1])[0]
+        chemicals = [c.chemical for c in synthesis.chemicals]
+        components = [c.component for c in synthesis.components]
+        for chemical in chemicals:
+            chemical.mass = 0.0
+        for component in components:
+            component.moles = 1.0
+
+        report = export_pdfs(self.db.session, [synthesis], self.tmpdir,
+                             processes=1)
+        self.assertEqual(len(report.exported) + len(report.errors), 1)
+        self.assertEqual([c.mass for c in chemicals], [0.0] * len(chemicals))
+        self.assertEqual([c.moles for c in components],
+                         [1.0] * len(components))
+        self.assertEqual(len(self.db.session.dirty), 0)
+
+    def test_detached_job(self):
+        synthesis = select_syntheses(self.db, ids=[1])[0]
+        jobs, errors = export_jobs(self.db.session, [synthesis], self.tmpdir,
+                                   {})
+        job = detached_job(jobs[0])
+        for record in job[2] + job[3]:
+            self.assertNotIn(record, self.db.session)
+        self.assertEqual([c.id for c in job[3]], [c.id for c in jobs[0][3]])
+
+    def test_render_jobs_in_thread(self):
+        synthesis = select_syntheses(self.db, ids=[1])[0]
+        jobs, errors = export_jobs(self.db.session, [synthesis], self.tmpdir,
+                                   {})
+        jobs = [detached_job(job) for job in jobs]
+        progress = []
+        reports = []
+
+        def callback(done, total):
+            progress.append((done, total))
+            return True
+
+        # one job never starts more than one process, even with "spawn"
+        thread = threading.Thread(target=lambda: reports.append(
+            render_jobs(jobs, processes=4, callback=callback,
+                        start_method="spawn")))
+        thread.start()
+        thread.join()
+        self.assertEqual(progress, [(1, 1)])
+        self.assertEqual(len(reports[0].exported) + len(reports[0].errors), 1)
+
+    def test_report_flags(self):
+        synthesis = select_syntheses(self.db, ids=[1])[0]
+        flags = report_flags(synthesis, {"title": "Quarterly", "batch": False})
+        self.assertEqual(flags["title"], "Quarterly")
+        self.assertFalse(flags["batch"])
+        self.assertTrue(flags["composition"])
+        self.assertEqual(flags["id"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
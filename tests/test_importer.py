@@ -0,0 +1,74 @@
+import io
+import os
+import sqlite3
+import unittest
+
+from batchcalc import cli
+from batchcalc.importer import import_records, read_records
+from batchcalc.model import Batch, Chemical, Component
+
+from dbtestcase import TempDBTestCase
+
+CHEMICALS = """name,formula,molwt,kind,concentration,physical_form,cas
+sodium silicate,Na2SiO3,122.06,reactant,0.27,liquid,1344-09-8
+potassium silicate,K2SiO3,154.28,reactant,,solid,
+broken,XYZ,abc,reactant,,,
+unknown kind,XYZ,10.0,gas,,,
+"""
+
+BATCH = """{"chemical": "sodium silicate", "component": "Na2O", "coefficient": 1.0}
+{"chemical": "sodium silicate", "component": "SiO2", "coefficient": 1.0}
+{"chemical": "nonexistent", "component": "SiO2", "coefficient": 1.0}
+{"chemical": "sodium silicate", component: "Na2O"}
+"""
+
+
+class TestImport(TempDBTestCase):
+
+    def test_dry_run(self):
+        nchem = self.session.query(Chemical).count()
+        report = import_records(self.session, "chemicals",
+                                read_records(io.StringIO(CHEMICALS)),
+                                dry_run=True)
+        self.assertEqual(report.inserted, 1)
+        self.assertEqual([e[0] for e in report.errors], [3, 4, 5])
+        self.assertIn("missing concentration", report.errors[0][1])
+        self.assertEqual(self.session.query(Chemical).count(), nchem)
+
+    def test_import(self):
+        nchem = self.session.query(Chemical).count()
+        import_records(self.session, "chemicals",
+                       read_records(io.StringIO(CHEMICALS)), chunk_size=1)
+        self.assertEqual(self.session.query(Chemical).count(), nchem + 1)
+        silicate = self.session.query(Chemical).\
+            filter(Chemical.name == "sodium silicate").one()
+        self.assertEqual(silicate.kind, "reactant")
+        self.assertEqual(silicate.physical_form, "liquid")
+        self.assertAlmostEqual(silicate.concentration, 0.27)
+
+        report = import_records(self.session, "batch",
+                                read_records(io.StringIO(BATCH), "jsonl"))
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual([e[0] for e in report.errors], [3, 4])
+        self.assertIn("property name", report.errors[1][1])
+        self.assertEqual(self.session.query(Batch).
+                         filter(Batch.chemical_id == silicate.id).count(), 2)
+
+    def test_conflict(self):
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("CREATE UNIQUE INDEX ux_components_name "
+                     "ON components (name)")
+        conn.close()
+        path = os.path.join(self.tmpdir, "components.csv")
+        with io.open(path, "w", encoding="utf-8") as fobj:
+            fobj.write("name,formula,molwt,category\n"
+                       "sodium oxide,Na2O,61.98,zeolite\n")
+        ncomp = self.session.query(Component).count()
+        with self.assertRaises(SystemExit) as cm:
+            cli.import_main(["components", path, "--db", self.dbpath])
+        self.assertIn("conflict", "{0}".format(cm.exception.code))
+        self.assertEqual(self.session.query(Component).count(), ncomp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import unittest
+
+from batchcalc.database import dispose_engine
+from batchcalc.migrations import (SCHEMA_VERSION, MigrationError,
+                                  check_search_triggers, migrate,
+                                  search_statements)
+from batchcalc.model import Kind
+
+from dbtestcase import TempDBTestCase
+
+
+def indexes(path):
+    conn = sqlite3.connect(path)
+    names = set(row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"))
+    conn.close()
+    return names
+
+
+def get_version(path):
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+class TestMigrations(TempDBTestCase):
+
+    def test_upgrade(self):
+        # downgrade the copy to the initial schema
+        conn = sqlite3.connect(self.dbpath)
+        for name in indexes(self.dbpath):
+            if name.startswith("ix_"):
+                conn.execute("DROP INDEX {0:s}".format(name))
+        conn.execute("PRAGMA user_version = 0")
+        conn.close()
+
+        self.assertEqual([v for v, d in migrate(self.dbpath)],
+                         list(range(1, SCHEMA_VERSION + 1)))
+        self.assertIn("ix_batch_chemical_id", indexes(self.dbpath))
+        self.assertIn("ix_synthesis_name", indexes(self.dbpath))
+        self.assertEqual(migrate(self.dbpath), [])
+
+    def test_new_database(self):
+        path = os.path.join(self.tmpdir, 'new.db')
+        self.db.switch_session(path)
+        self.assertEqual(self.db.session.query(Kind).count(), 0)
+        self.assertIn("ix_batch_component_id", indexes(path))
+        self.assertEqual(self.db.search("water"), [])
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0],
+                         SCHEMA_VERSION)
+        conn.close()
+        dispose_engine(path)
+
+    def test_newer_schema(self):
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("PRAGMA user_version = {0:d}".format(SCHEMA_VERSION + 1))
+        conn.close()
+        with self.assertRaises(MigrationError):
+            migrate(self.dbpath)
+
+    def test_without_fts5(self):
+        class Connection(object):
+            def execute(self, statement):
+                return sqlite3.connect(":memory:").execute("SELECT 0")
+        self.assertEqual(search_statements(Connection()), [])
+        self.assertNotEqual(search_statements(sqlite3.connect(":memory:")),
+                            [])
+
+    def test_packaged_database(self):
+        # the search indexes are added when the database is opened
+        self.assertEqual(get_version(self.db.dbpath), 2)
+        self.assertEqual(get_version(self.dbpath), SCHEMA_VERSION)
+
+    def test_search_triggers(self):
+        conn = sqlite3.connect(self.dbpath, isolation_level=None)
+        self.assertFalse(check_search_triggers(conn))
+        self.assertTrue(check_search_triggers(conn, fts5=False))
+        self.assertEqual(conn.execute("SELECT count(*) FROM sqlite_master "
+                                      "WHERE type = 'trigger'").fetchone()[0],
+                         0)
+        conn.execute("UPDATE chemicals SET name = 'caustic soda' "
+                     "WHERE id = 1")
+        self.assertTrue(check_search_triggers(conn))
+        self.assertEqual(conn.execute("SELECT rowid FROM chemicals_fts "
+                                      "WHERE chemicals_fts MATCH 'caustic'").
+                         fetchall(), [(1,)])
+        conn.close()
+
+    def test_migrate_once(self):
+        self.db.switch_session(self.dbpath)
+        # a downgrade is not noticed while the database stays registered
+        conn = sqlite3.connect(self.dbpath)
+        conn.execute("PRAGMA user_version = 0")
+        conn.close()
+        self.db.switch_session(self.dbpath)
+        self.assertEqual(get_version(self.dbpath), 0)
+        dispose_engine(self.dbpath)
+        self.db.switch_session(self.dbpath)
+        self.assertEqual(get_version(self.dbpath), SCHEMA_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
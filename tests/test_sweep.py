@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.model import Chemical, Component
+from batchcalc.sweep import (CompositionGrid, parse_values, parallel_sweep,
+                             postprocess, sweep)
+
+from dbtestcase import TempDBTestCase
+
+
+class TestCompositionGrid(unittest.TestCase):
+
+    def test_parse_values(self):
+        np.testing.assert_allclose(parse_values("10:40:10"), [10, 20, 30, 40])
+        np.testing.assert_allclose(parse_values("1, 2.5,4"), [1.0, 2.5, 4.0])
+        np.testing.assert_allclose(parse_values("3"), [3.0])
+        with self.assertRaises(ValueError):
+            parse_values("40:10:10")
+
+    def test_grid(self):
+        grid = CompositionGrid(3, {0: 1.0},
+                               [(1, [10.0, 20.0], None), (2, [5.0, 10.0, 15.0], 1)])
+        self.assertEqual(len(grid), 6)
+        moles = np.vstack(list(grid.chunks(4)))
+        self.assertEqual(moles.shape, (6, 3))
+        np.testing.assert_allclose(moles[:, 0], 1.0)
+        np.testing.assert_allclose(moles[:, 1], [10, 10, 10, 20, 20, 20])
+        np.testing.assert_allclose(moles[:, 2], [50, 100, 150, 100, 200, 300])
+
+    def test_grid_errors(self):
+        with self.assertRaises(ValueError):
+            CompositionGrid(2, {0: 1.0}, [])
+        with self.assertRaises(ValueError):
+            CompositionGrid(3, {0: 1.0}, [(1, [1.0], 2), (2, [1.0], 1)])
+
+
+class TestSweep(TempDBTestCase):
+
+    def setUp(self):
+        super(TestSweep, self).setUp()
+        self.model = BatchCalculator()
+        self.model.components = [self.session.query(Component).get(i)
+                                 for i in [1, 3, 4, 5]]
+        self.model.chemicals = [self.session.query(Chemical).get(i)
+                                for i in [1, 3, 9, 10]]
+        self.grid = CompositionGrid(4, {1: 1.0},
+                                    [(0, [0.5, 1.0, 2.0, 3.0], None),
+                                     (2, [10.0, 20.0], None),
+                                     (3, [10.0, 20.0, 30.0], 2)])
+
+    def test_sweep(self):
+        chunks = list(sweep(self.model, self.grid, self.session, chunk_size=5))
+        self.assertEqual(len(chunks), 5)
+        moles = np.vstack([m for m, x in chunks])
+        masses = np.vstack([x for m, x in chunks])
+        np.testing.assert_allclose(
+            masses, self.model.calculate_masses_many(moles, self.session))
+
+    def test_postprocess(self):
+        moles = np.ones((3, 2))
+        masses = np.array([[1.23456, 2.0], [-1.0, 1.0], [0.0, 3.0]])
+        m, x = postprocess(moles, masses, decimals=2, valid_only=True)
+        self.assertEqual(m.shape, (2, 2))
+        np.testing.assert_allclose(x, [[1.23, 2.0], [0.0, 3.0]])
+
+    def test_parallel_sweep(self):
+        serial = list(sweep(self.model, self.grid, self.session, chunk_size=5,
+                            valid_only=True))
+        parallel = list(parallel_sweep(self.model, self.grid, self.session,
+                                       processes=2, chunk_size=5,
+                                       valid_only=True))
+        self.assertEqual(len(serial), len(parallel))
+        for (sm, sx), (pm, px) in zip(serial, parallel):
+            np.testing.assert_allclose(sm, pm)
+            np.testing.assert_allclose(sx, px, atol=1.0e-8)
+        # NaOH is not needed for Na2O = 0.5
+        self.assertEqual(sum(len(m) for m, x in parallel), 18)
+
+    def test_parallel_sweep_bounded(self):
+        serial = list(sweep(self.model, self.grid, self.session, chunk_size=3))
+        parallel = list(parallel_sweep(self.model, self.grid, self.session,
+                                       processes=2, chunk_size=3,
+                                       max_pending=1))
+        self.assertEqual(len(serial), len(parallel))
+        for (sm, sx), (pm, px) in zip(serial, parallel):
+            np.testing.assert_allclose(sm, pm)
+        with self.assertRaises(ValueError):
+            list(parallel_sweep(self.model, self.grid, self.session,
+                                processes=2, max_pending=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from batchcalc import tex_writer
+
+
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+        os.makedirs(self.cachedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        os.environ.pop(tex_writer.TEMPLATE_PATH_VARIABLE, None)
+
+    def test_environment_reused(self):
+        env = tex_writer.get_environment()
+        self.assertIs(tex_writer.get_environment(), env)
+        template = tex_writer.get_template()
+        self.assertIs(tex_writer.get_template(), template)
+        self.assertEqual(template.name, tex_writer.DEFAULT_TEMPLATE)
+
+    def test_list_templates(self):
+        names = tex_writer.list_templates()
+        self.assertIn("report_basic.tex", names)
+        self.assertIn("report_color.tex", names)
+
+    def test_user_templates(self):
+        path = os.path.join(self.tmpdir, "mine.tex")
+        with open(path, "w") as fobj:
+            fobj.write(r"\title{<< title >>}<* if batch *>B<* endif *>")
+        template = tex_writer.get_template(path)
+        self.assertEqual(template.render(title="T", batch=True), r"\title{T}B")
+
+        os.environ[tex_writer.TEMPLATE_PATH_VARIABLE] = self.tmpdir
+        self.assertIn("mine.tex", tex_writer.list_templates())
+        self.assertEqual(tex_writer.get_template("mine.tex").render(title="X"),
+                         r"\title{X}")
+
+    def test_bytecode_cache(self):
+        searchpath = tex_writer.get_template_path()
+        env = tex_writer.get_environment(searchpath, cache_dir=self.cachedir)
+        env.get_template("report_basic.tex")
+        self.assertEqual(len(os.listdir(self.cachedir)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from batchcalc.typeset import TypesetError, get_pdf, needs_rerun, prune_cache
+
+# stands in for pdflatex: writes an .aux with a label if the source has one,
+# a "pdf" with the source and appends every call to $FAKE_PDFLATEX_CALLS
+FAKE_PDFLATEX = r'''#!{python}
+import os
+import sys
+
+name = sys.argv[-1]
+base = os.path.splitext(name)[0]
+with open(name) as fobj:
+    tex = fobj.read()
+with open(os.environ["FAKE_PDFLATEX_CALLS"], "a") as fobj:
+    fobj.write(os.getcwd() + "\n")
+if "\\error" in tex:
+    with open(base + ".log", "w") as fobj:
+        fobj.write("! Undefined control sequence.\n")
+    sys.exit(1)
+with open(base + ".aux", "w") as fobj:
+    fobj.write("\\relax\n")
+    if "\\label" in tex:
+        fobj.write("\\newlabel{{a}}{{{{1}}{{1}}}}\n")
+with open(base + ".pdf", "w") as fobj:
+    fobj.write("%PDF " + tex)
+'''
+
+
+@unittest.skipIf(sys.platform == "win32", "needs an executable script")
+class TestTypeset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+        self.calls = os.path.join(self.tmpdir, "calls")
+        os.environ["FAKE_PDFLATEX_CALLS"] = self.calls
+        self.pdflatex = os.path.join(self.tmpdir, "pdflatex")
+        with open(self.pdflatex, "w") as fobj:
+            fobj.write(FAKE_PDFLATEX.format(python=sys.executable))
+        os.chmod(self.pdflatex, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        del os.environ["FAKE_PDFLATEX_CALLS"]
+
+    def get_calls(self):
+        if not os.path.exists(self.calls):
+            return []
+        with open(self.calls) as fobj:
+            return fobj.read().splitlines()
+
+    def typeset(self, tex, **kwargs):
+        return get_pdf(tex, pdflatex=self.pdflatex, cache_dir=self.cachedir,
+                       **kwargs)
+
+    def test_cached(self):
+        output = os.path.join(self.tmpdir, "report.pdf")
+        self.assertEqual(self.typeset("plain", output=output), output)
+        with open(output) as fobj:
+            self.assertEqual(fobj.read(), "%PDF plain")
+        self.assertEqual(len(self.get_calls()), 1)
+        cached = self.typeset("plain")
+        self.assertTrue(cached.startswith(self.cachedir))
+        self.assertEqual(len(self.get_calls()), 1)
+        self.typeset("changed")
+        self.assertEqual(len(self.get_calls()), 2)
+
+    def test_volatile(self):
+        first = self.typeset("report 10:00:00 01.01.2020",
+                             volatile=["10:00:00 01.01.2020"])
+        second = self.typeset("report 11:30:00 02.01.2020",
+                              volatile=["11:30:00 02.01.2020"])
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.get_calls()), 1)
+        self.typeset("report 11:30:00 02.01.2020")
+        self.assertEqual(len(self.get_calls()), 2)
+
+    def test_prune(self):
+        paths = [self.typeset("document {0:d}".format(i)) for i in range(4)]
+        now = time.time()
+        for age, path in zip([10, 20, 30, 40], paths):
+            os.utime(path, (now - age, now - age))
+        size = os.path.getsize(paths[0])
+
+        self.assertEqual(prune_cache(self.cachedir, max_size=3 * size), 1)
+        self.assertFalse(os.path.exists(paths[3]))
+        self.assertEqual(prune_cache(self.cachedir, max_age=25), 1)
+        self.assertFalse(os.path.exists(paths[2]))
+        self.assertEqual(prune_cache(self.cachedir, max_size=0,
+                                     keep=paths[0]), 1)
+        self.assertEqual(os.listdir(self.cachedir),
+                         [os.path.basename(paths[0])])
+
+    def test_second_pass_only_for_references(self):
+        self.typeset("\\label{a}")
+        calls = self.get_calls()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0], calls[1])
+        self.assertFalse(os.path.exists(calls[0]))
+
+    def test_error(self):
+        with self.assertRaises(TypesetError) as ctx:
+            self.typeset("\\error")
+        self.assertIn("Undefined control sequence", ctx.exception.log)
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_parallel(self):
+        results = {}
+
+        def run(i):
+            results[i] = self.typeset("document {0:d}".format(i))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(self.get_calls())), 4)
+        for i, path in results.items():
+            with open(path) as fobj:
+                self.assertEqual(fobj.read(), "%PDF document {0:d}".format(i))
+
+    def test_needs_rerun(self):
+        self.assertFalse(needs_rerun(None, b"\\relax\n"))
+        self.assertTrue(needs_rerun(None, b"\\relax\n\\newlabel{a}{{1}{1}}\n"))
+        self.assertFalse(needs_rerun(b"\\relax\n", b"\\relax\n"))
+        self.assertTrue(needs_rerun(b"\\relax\n", b"\\relax\n\\bibcite{x}{1}\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import pickle
+import unittest
+import zipfile
+
+import numpy as np
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.model import Chemical, Component
+from batchcalc import zbcfile
+
+from dbtestcase import TempDBTestCase
+
+
+class TestZbcFile(TempDBTestCase):
+
+    def setUp(self):
+        super(TestZbcFile, self).setUp()
+        self.bc = BatchCalculator()
+        # Na2O, Al2O3, SiO2, H2O
+        self.bc.components = [self.session.query(Component).get(i)
+                              for i in [1, 3, 4, 5]]
+        # NaOH, sodium aluminate, fumed silica, water
+        self.bc.chemicals = [self.session.query(Chemical).get(i)
+                             for i in [1, 3, 9, 10]]
+        for comp, moles in zip(self.bc.components, [2.0, 1.0, 30.0, 400.0]):
+            comp.moles = moles
+        self.bc.calculate_masses(self.session)
+        self.bc.selections = self.bc.chemicals[2:]
+        self.bc.sample_size = 7.5
+        self.masses = [c.mass for c in self.bc.chemicals]
+
+    def check_loaded(self, path):
+        loaded = zbcfile.load(path)
+        self.assertEqual(loaded.component_ids, [1, 3, 4, 5])
+        self.assertEqual(loaded.chemical_ids, [1, 3, 9, 10])
+        np.testing.assert_allclose(loaded.masses, self.masses)
+
+        # reset the objects to make sure the values come from the file
+        for item in self.bc.chemicals + self.bc.components:
+            self.session.expire(item)
+        model = BatchCalculator()
+        loaded.load_into(model, self.session)
+        self.assertEqual([z.moles for z in model.components],
+                         [2.0, 1.0, 30.0, 400.0])
+        np.testing.assert_allclose([c.mass for c in model.chemicals],
+                                   self.masses)
+        np.testing.assert_allclose(model.B, self.bc.B)
+        self.assertEqual([c.id for c in model.selections], [9, 10])
+        self.assertEqual(model.sample_size, 7.5)
+        return loaded
+
+    def test_roundtrip(self):
+        path = os.path.join(self.tmpdir, "calc.zbc")
+        zbcfile.save(path, self.bc)
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(sorted(archive.namelist()),
+                             [zbcfile.ARRAYS, zbcfile.HEADER])
+        loaded = self.check_loaded(path)
+        self.assertFalse(loaded.legacy)
+
+    def test_lazy_arrays(self):
+        path = os.path.join(self.tmpdir, "calc.zbc")
+        zbcfile.save(path, self.bc)
+        loaded = zbcfile.load(path)
+        self.assertIsNone(loaded._arrays)
+        np.testing.assert_allclose(loaded.arrays["B"], self.bc.B)
+
+    def test_legacy_pickle(self):
+        path = os.path.join(self.tmpdir, "old.zbc")
+        data = (self.bc.components, self.bc.chemicals,
+                self.bc.A, self.bc.B, self.bc.X,
+                self.bc.scale_all, self.bc.sample_scale,
+                self.bc.sample_size, self.bc.selections)
+        with open(path, "wb") as fobj:
+            pickle.dump(data, fobj, protocol=2)
+        loaded = self.check_loaded(path)
+        self.assertTrue(loaded.legacy)
+
+    def test_newer_version(self):
+        path = os.path.join(self.tmpdir, "new.zbc")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(zbcfile.HEADER, '{"format": "zbc", "version": 99}')
+        with self.assertRaises(ValueError):
+            zbcfile.load(path)
+
+    def test_unreadable(self):
+        data = pickle.dumps((self.bc.A, self.bc.B), protocol=2)
+        contents = {
+            "image.zbc": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+            "truncated.zbc": pickle.dumps(list(range(100)), protocol=2)[:50],
+            "tuple.zbc": data,
+            "class.zbc": data.replace(b"numpy", b"nompy"),
+            "empty.zbc": b"",
+        }
+        for name, content in contents.items():
+            path = os.path.join(self.tmpdir, name)
+            with open(path, "wb") as fobj:
+                fobj.write(content)
+            with self.assertRaises(ValueError):
+                zbcfile.load(path)
+
+        path = os.path.join(self.tmpdir, "noheader.zbc")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(zbcfile.ARRAYS, b"")
+        with self.assertRaises(ValueError):
+            zbcfile.load(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
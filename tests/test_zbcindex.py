@@ -0,0 +1,118 @@
+import os
+import pickle
+import time
+import unittest
+import zipfile
+
+from batchcalc.calculator import BatchCalculator
+from batchcalc.model import Chemical, Component
+from batchcalc import zbcfile
+from batchcalc.zbcindex import Catalogue, parse_ratio
+
+from dbtestcase import TempDBTestCase
+
+
+class TestCatalogue(TempDBTestCase):
+
+    def setUp(self):
+        super(TestCatalogue, self).setUp()
+        self.root = os.path.join(self.tmpdir, "calculations")
+        os.makedirs(os.path.join(self.root, "sub"))
+        self.catalogue = Catalogue(os.path.join(self.tmpdir, "index.db"))
+
+        self.save("low.zbc", [1, 3, 4, 5], [1.0, 1.0, 10.0, 100.0],
+                  [1, 3, 9, 10])
+        self.save(os.path.join("sub", "tma.zbc"), [1, 3, 4, 5, 7],
+                  [1.0, 1.0, 30.0, 300.0, 2.0], [1, 3, 9, 10, 12])
+        self.save("high.zbc", [1, 3, 4, 5], [1.0, 1.0, 40.0, 100.0],
+                  [1, 3, 9, 10])
+
+    def tearDown(self):
+        self.catalogue.close()
+        super(TestCatalogue, self).tearDown()
+
+    def save(self, name, components, moles, chemicals):
+        model = BatchCalculator()
+        model.components = [self.session.query(Component).get(i)
+                            for i in components]
+        for comp, m in zip(model.components, moles):
+            comp.moles = m
+        model.chemicals = [self.session.query(Chemical).get(i)
+                           for i in chemicals]
+        path = os.path.join(self.root, name)
+        zbcfile.save(path, model)
+        return path
+
+    def test_parse_ratio(self):
+        self.assertEqual(parse_ratio("SiO2/Al2O3 >= 20"),
+                         ("SiO2", "Al2O3", ">=", 20.0))
+        with self.assertRaises(ValueError):
+            parse_ratio("SiO2>20")
+
+    def test_query(self):
+        self.catalogue.scan(self.root)
+        self.assertEqual(len(self.catalogue), 3)
+        found = self.catalogue.query(chemicals=["TMAOH"],
+                                     ratios=["SiO2/Al2O3>20"])
+        self.assertEqual([os.path.basename(p) for p in found], ["tma.zbc"])
+        found = self.catalogue.query(ratios=["SiO2/Al2O3>20"])
+        self.assertEqual([os.path.basename(p) for p in found],
+                         ["high.zbc", "tma.zbc"])
+        found = self.catalogue.query(chemicals=["9"], ratios=["H2O/SiO2<5"])
+        self.assertEqual([os.path.basename(p) for p in found], ["high.zbc"])
+
+    def test_incremental_scan(self):
+        report = self.catalogue.scan(self.root)
+        self.assertEqual((report.added, report.unchanged), (3, 0))
+
+        report = self.catalogue.scan(self.root)
+        self.assertEqual((report.added, report.updated, report.unchanged),
+                         (0, 0, 3))
+
+        path = self.save("low.zbc", [1, 3, 4, 5], [1.0, 1.0, 25.0, 100.0],
+                         [1, 3, 9, 10])
+        # make sure the modification time differs on coarse clocks
+        mtime = time.time() + 10.0
+        os.utime(path, (mtime, mtime))
+        os.remove(os.path.join(self.root, "high.zbc"))
+        with zipfile.ZipFile(os.path.join(self.root, "broken.zbc"),
+                             "w") as archive:
+            archive.writestr(zbcfile.HEADER, "not a calculation")
+
+        report = self.catalogue.scan(self.root)
+        self.assertEqual((report.added, report.updated, report.removed,
+                          report.unchanged), (1, 1, 1, 1))
+        self.assertEqual(len(report.errors), 1)
+        found = self.catalogue.query(ratios=["SiO2/Al2O3>20"])
+        self.assertEqual([os.path.basename(p) for p in found],
+                         ["low.zbc", "tma.zbc"])
+
+    def test_legacy_not_loaded(self):
+        marker = os.path.join(self.tmpdir, "unpickled")
+        with open(os.path.join(self.root, "old.zbc"), "wb") as fobj:
+            pickle.dump(Payload(marker), fobj, protocol=2)
+
+        report = self.catalogue.scan(self.root)
+        self.assertFalse(os.path.exists(marker))
+        self.assertEqual(report.added, 4)
+        self.assertEqual([os.path.basename(p) for p in report.legacy],
+                         ["old.zbc"])
+        self.assertEqual(report.errors, [])
+        self.assertEqual(len(self.catalogue.query()), 3)
+
+        report = self.catalogue.scan(self.root)
+        self.assertEqual((report.unchanged, report.legacy), (4, []))
+
+
+class Payload(object):
+    '''Pickles into a call creating the directory `path`.'''
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (os.mkdir, (self.path,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 
-import subprocess
-import os
+from __future__ import print_function
+
+from batchcalc.typeset import TypesetError, get_pdf
 
 texdata = r'''\documentclass[10pt,a4paper]{article}
 % font
@@ -219,34 +220,12 @@ Sample name & Aspect ratio & Si/Al & Comment \\
 \end{document}'''
 
 
-def clean_tex(fname, wrkdir='/tmp'):
-    exts = [".out", ".aux", ".log", ".tex"]
-    fbase = os.path.splitext(fname)[0]
-    for fil in [fbase + ext for ext in exts]:
-        if os.path.exists(os.path.join(wrkdir, fil)):
-            os.remove(os.path.join(wrkdir, fil))
-
-def which(prog):
-    for path in os.getenv('PATH').split(os.path.pathsep):
-        fprog = os.path.join(path, prog)
-        if os.path.exists(fprog) and os.access(fprog, os.X_OK):
-            return fprog
-        
-def generate_pdf(texstr, fname, wrkdir='/tmp', clean=True):
-    os.chdir(wrkdir)
-    with open(fname, 'w') as tex:
-        tex.write(texstr)
-    pdflatex = which('pdflatex')
-    print "pdflatex: ", pdflatex
-    if pdflatex is not None:
-        p = subprocess.Popen([pdflatex, fname], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = p.communicate()
-        if p.returncode == 0 and clean:
-            clean_tex(fname)
-        else:
-            print "something went wrong"
-    else:
-        print "Could not find pdlfatex"
-
-which('pdflatex')
-generate_pdf(texdata, 'test.tex')
+if __name__ == "__main__":
+
+    # typeset in an isolated temporary directory, the pdf is cached so that
+    # running the script again without changes does not call pdflatex
+    try:
+        print("pdf: ", get_pdf(texdata, output="test.pdf"))
+    except TypesetError as err:
+        print("something went wrong: ", err)
+        print(err.log)